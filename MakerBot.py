@@ -1,3 +1,9 @@
+if __name__ == '__main__':
+    # Run as a script: hand over to the module before anything below is built, so the
+    # modules that import MakerBot share one printer, manifest and executor with it.
+    import MakerBot
+    raise SystemExit(MakerBot.main())
+
 import socket
 import ssl
 import json
@@ -6,11 +12,31 @@ import time
 import sys
 import os 
 import zlib 
+import mmap
 import select 
-import struct
+import asyncio
+import contextvars
 import configparser
-import winsound
-from typing import Dict, Any, Optional, Tuple, Union, List
+import functools
+import itertools
+import argparse
+import random
+import concurrent.futures
+import contextlib
+from collections import deque
+from typing import Dict, Any, Optional, Tuple, Union, List, Callable
+
+import MakerBotMetrics
+import MakerBotProfile
+import MakerBotTelemetry
+import MakerBotToolpath
+from MakerBotFramer import JsonStreamFramer
+
+try:
+    # winsound only on Windows, the completion beep is skipped elsewhere.
+    import winsound
+except ImportError:
+    winsound = None
 
 try:
     # msvcrt (Microsoft Visual C Runtime) only on Windows.
@@ -33,504 +59,1411 @@ LOCAL_FILE_PATH = "print.makerbot"
 RPC_BLOCK_SIZE = 131072  # 128 KB block size: kb * 1024
 RPC_FILE_ID = 'AAAA'    # File id
 RPC_FILE_PATH = f"//current_thing/{os.path.basename(LOCAL_FILE_PATH)}"
+UPLOAD_WINDOW = 8                # put_raw blocks in flight before waiting for an acknowledgement
+UPLOAD_ACK_TIMEOUT = 30.0        # Seconds to wait for a put_init/put_raw/put_term reply
+UPLOAD_PRESSURE_LATENCY = 2.0    # Slower acknowledgements than this halve the window
+UPLOAD_MANIFEST_PATH = "upload_manifest.json"
+# Continue an interrupted upload from the last acknowledged block. Off by default: it needs an
+# "offset" for put_init that the firmware does not document, see _upload_file.
+UPLOAD_RESUME = False
 
-ssl_socket: Optional[ssl.SSLSocket] = None
-global_request = 1
 is_running = threading.Event()
 
-async_messages = []
-async_lock = threading.Lock() 
-
-printer_status: Dict[str, Any] = {
-    "process": "IDLE",
-    "step": "N/A",    
-    "filename": "N/A", 
-    "progress": "N/A",        
-    "elapsed_time": "N/A",    
-    "chamber_current": "N/A",
-    "chamber_target": "N/A",
-    "extruder_current": "N/A",
-    "extruder_target": "N/A",
-    "preheating": False
-}
+RPC_TIMEOUT = 10.0   # Seconds to wait for the reply of a request
+AUTHORIZE_TIMEOUT = 300.0   # The first authorization waits for the button on the printer
+
+HEARTBEAT_INTERVAL = 10.0     # Silence after which the link is probed with a request
+HEARTBEAT_TIMEOUT = 30.0      # Silence after which the link counts as dead
+HEARTBEAT_METHOD = "get_system_information"
+RECONNECT_MIN_DELAY = 1.0
+RECONNECT_MAX_DELAY = 60.0
+DAEMON_PORT = 12310
+
+class PrinterStatus:
+    # What the notifications tell about the printer, as numbers. None is "not
+    # known yet" (or no process). Text is only made from it when a screen is drawn.
+    __slots__ = ("process", "step", "filename", "progress", "elapsed_time", "chamber_current",
+                 "chamber_target", "extruder_current", "extruder_target", "preheating")
+
+    def __init__(self):
+        self.process: Optional[str] = None
+        self.step: Optional[str] = None
+        self.filename: Optional[str] = None
+        self.progress: Optional[float] = None        # Percent
+        self.elapsed_time: Optional[float] = None    # Seconds
+        self.chamber_current: Optional[float] = None
+        self.chamber_target: Optional[float] = None
+        self.extruder_current: Optional[float] = None
+        self.extruder_target: Optional[float] = None
+        self.preheating = False
+
+    def copy(self) -> 'PrinterStatus':
+        status = PrinterStatus.__new__(PrinterStatus)
+        for name in self.__slots__:
+            setattr(status, name, getattr(self, name))
+        return status
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def update(self, changes: Dict[str, Any], name: str, value: Any):
+        # Sets one field, and records it in `changes` if the value is new.
+        if getattr(self, name) != value:
+            setattr(self, name, value)
+            changes[name] = value
+
+    def formatted(self) -> Dict[str, str]:
+        # Display text for every field.
+        elapsed = "N/A"
+        if self.elapsed_time is not None:
+            hours, remainder = divmod(int(self.elapsed_time), 3600)
+            minutes, seconds = divmod(remainder, 60)
+            elapsed = f"{hours:02}:{minutes:02}:{seconds:02}"
+        return {
+            "process": self.process or "IDLE",
+            "step": self.step or "N/A",
+            "filename": self.filename or "N/A",
+            "progress": f"{self.progress:g}%" if self.progress is not None else "N/A",
+            "elapsed_time": elapsed,
+            "chamber_current": _format_number(self.chamber_current),
+            "chamber_target": _format_number(self.chamber_target),
+            "extruder_current": _format_number(self.extruder_current),
+            "extruder_target": _format_number(self.extruder_target),
+            "preheating": "yes" if self.preheating else "no",
+        }
+
+def _format_number(value: Optional[float]) -> str:
+    return "N/A" if value is None else f"{value:g}"
 
 last_action_feedback: str = ""
 last_feedback_time: float = 0.0
 FEEDBACK_DURATION = 15.0 
-status_lock = threading.Lock() 
 
-# --- Hardcoded JSON-RPC COMMANDS  ---
-
-JSON_menu_1 = '{"params": {}, "jsonrpc": "2.0", "method": "print_again"}'
-JSON_menu_2 = '{"params": {}, "jsonrpc": "2.0", "method": "preheat"}'
-JSON_menu_3 = '{"params": {"temperature_settings": 215, "tool_index": 0}, "jsonrpc": "2.0", "method": "load_filament"}'
-JSON_menu_4 = '{"params": {"temperature_settings": 215, "tool_index": 0}, "jsonrpc": "2.0", "method": "unload_filament"}'
-JSON_menu_5 = '{"params": {}, "jsonrpc": "2.0", "method": "cool"}'
-JSON_menu_6 = '{"params": {}, "jsonrpc": "2.0", "method": "park"}'
+# ==============================================================================
+#           JSON-RPC COMMANDS
+# ==============================================================================
+# Every command is serialized once, when the module is loaded. The id is the
+# last member of the request, so sending a command only splices the id digits
+# between the pre-encoded bytes in front of it and the closing brace.
 
-JSON_menu_8 = '{"params": {"machine_func": "set_temperature_target", "params": {"index": 0, "temperature": 280}}, "jsonrpc": "2.0", "method": "machine_action_command"}'
-JSON_menu_9 = '{"params": {"index":0}, "jsonrpc": "2.0", "method": "load_print_tool"}'
+class RpcCommand:
+    __slots__ = ("method", "head")
 
-JSON_menu_x = '{"params": {}, "jsonrpc": "2.0", "method": "cancel"}'
-JSON_menu_enter_1 = '{"params": {"method":"acknowledge_error"}, "jsonrpc": "2.0", "method": "process_method"}'
-JSON_menu_enter_2 = '{"params": {"method":"acknowledge_failure"}, "jsonrpc": "2.0", "method": "process_method"}'
-JSON_menu_enter_3 = '{"params": {"method":"acknowledge_completed"}, "jsonrpc": "2.0", "method": "process_method"}'
+    def __init__(self, method: str, params: Optional[Union[Dict[str, Any], List[Any]]] = None):
+        self.method = method
+        text = json.dumps({"params": {} if params is None else params, "jsonrpc": "2.0", "method": method, "id": 0})
+        self.head = text[:-2].encode('utf-8')    # Everything before the "0}"
 
-JSON_menu_space_1 = '{"params": {"method":"suspend"}, "jsonrpc": "2.0", "method": "process_method"}'
-JSON_menu_space_2 = '{"params": {"method":"resume"}, "jsonrpc": "2.0", "method": "process_method"}'
+    @classmethod
+    def from_json(cls, raw_json_string: str) -> 'RpcCommand':
+        rpc_data = json.loads(raw_json_string)
+        return cls(rpc_data.get("method", "unknown.method"), rpc_data.get("params"))
+
+    def payload(self, request_id: int) -> bytes:
+        return b"%s%d}" % (self.head, request_id)
+
+    def __repr__(self) -> str:
+        return f"RpcCommand({self.method!r})"
+
+def as_rpc_command(command: Union[RpcCommand, str, Dict[str, Any]]) -> RpcCommand:
+    # Ad hoc requests (strings or dicts) are serialized on the spot.
+    if isinstance(command, RpcCommand):
+        return command
+    if isinstance(command, str):
+        return RpcCommand.from_json(command)
+    return RpcCommand(command.get("method", "unknown.method"), command.get("params"))
+
+def machine_command(machine_func: str, method: str = "machine_query_command", **params) -> RpcCommand:
+    return RpcCommand(method, {"machine_func": machine_func, "params": params})
+
+@functools.lru_cache(maxsize=256)
+def move_command(point_mm: Tuple[float, ...], mm_per_second: float, relative: Tuple[bool, ...]) -> RpcCommand:
+    return machine_command("move", point_mm=list(point_mm), mm_per_second=mm_per_second, relative=list(relative))
+
+@functools.lru_cache(maxsize=8)
+def put_raw_command(length: int) -> RpcCommand:
+    # Nearly every block of an upload has the same length, so this is one entry.
+    return RpcCommand("put_raw", [RPC_FILE_ID, length])
+
+CMD_CLEAR_QUEUE = RpcCommand("clear_queue")
+CMD_CLOSE_QUEUE = RpcCommand("close_queue")
+CMD_OPEN_QUEUE = RpcCommand("open_queue", {"clear": True})
+CMD_EXECUTE_QUEUE = RpcCommand("execute_queue")
+CMD_HEARTBEAT = RpcCommand(HEARTBEAT_METHOD)
+
+JSON_menu_1 = RpcCommand("print_again")
+JSON_menu_2 = RpcCommand("preheat")
+JSON_menu_3 = RpcCommand("load_filament", {"temperature_settings": 215, "tool_index": 0})
+JSON_menu_4 = RpcCommand("unload_filament", {"temperature_settings": 215, "tool_index": 0})
+JSON_menu_5 = RpcCommand("cool")
+JSON_menu_6 = RpcCommand("park")
+
+JSON_menu_8 = machine_command("set_temperature_target", method="machine_action_command", index=0, temperature=280)
+JSON_menu_9 = RpcCommand("load_print_tool", {"index": 0})
+
+JSON_menu_x = RpcCommand("cancel")
+JSON_menu_enter_1 = RpcCommand("process_method", {"method": "acknowledge_error"})
+JSON_menu_enter_2 = RpcCommand("process_method", {"method": "acknowledge_failure"})
+JSON_menu_enter_3 = RpcCommand("process_method", {"method": "acknowledge_completed"})
+
+JSON_menu_space_1 = RpcCommand("process_method", {"method": "suspend"})
+JSON_menu_space_2 = RpcCommand("process_method", {"method": "resume"})
 
 # ==============================================================================
-#           LISTENER
+#           EVENT LOOP
 # ==============================================================================
-class ListenerThread(threading.Thread):
+# Every connection lives on one asyncio event loop in a background thread: an
+# idle printer costs a task waiting in read(), not a thread waking up every
+# second. Code that is not async itself (the menu, the daemon, the uploader,
+# the scheduler) calls the coroutines through `event_loop` and blocks until
+# they are done.
+
+RECV_BUFFER_SIZE = 65536
+CONNECT_TIMEOUT = 120.0        # TCP and TLS of one connect; the authorization has its own timeouts
+CLOSE_TIMEOUT = 5.0            # Longest wait for a clean TLS shutdown
+MAX_CONCURRENT_CONNECTS = 32   # TLS handshakes in progress at the same time
+EXPIRE_INTERVAL = 0.5          # How often the listener fails the requests past their deadline
+
+class AsyncRunner:
+
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        # The loop thread starts with the first call; importing the module starts nothing.
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.loop.run_forever, name="asyncio-loop", daemon=True)
+                self.thread.start()
+            return self.loop
+
+    def submit(self, coroutine) -> concurrent.futures.Future:
+        return asyncio.run_coroutine_threadsafe(coroutine, self.start())
+
+    def run(self, coroutine, timeout: Optional[float] = None):
+        # Blocks the calling thread until the coroutine is done. On the loop thread
+        # itself that would never return, coroutines there await instead.
+        if threading.current_thread() is self.thread:
+            coroutine.close()
+            raise RuntimeError("Blocking call on the event loop thread.")
+        future = self.submit(coroutine)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def stop(self):
+        with self.lock:
+            loop, thread = self.loop, self.thread
+            self.loop = self.thread = None
+        if loop:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(2)
+
+event_loop = AsyncRunner()
+
+def notification_status_params(json_response: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    # The status part of a notification, None for other methods.
+    method = json_response.get('method', 'ismeretlen.metódus')
+    params = json_response.get('params', {})
+    if method not in ["system_notification", "state_nothification"]:
+        return None
+    if method == "system_notification" and 'info' in params:
+        return params['info']
+    return params
+
+def apply_printer_status(printer_status: PrinterStatus, params: Dict[str, Any]) -> Dict[str, Any]:
+    # Copies what the notification contains into printer_status; fields it
+    # does not mention are left alone. Returns the fields that changed.
+    changes: Dict[str, Any] = {}
+    update = printer_status.update
+
+    if "current_process" in params:
+        current_process_data = params["current_process"]
+        if isinstance(current_process_data, dict):
+            update(changes, "process", current_process_data.get("name", "Active process"))
+            update(changes, "step", current_process_data.get("step"))
+            filename = current_process_data.get("filename")
+            update(changes, "filename", filename.split('/')[-1] if filename else None)
+            progress = current_process_data.get("progress")
+            update(changes, "progress", progress if isinstance(progress, (int, float)) else None)
+            elapsed = current_process_data.get("elapsed_time")
+            update(changes, "elapsed_time", elapsed if isinstance(elapsed, (int, float)) else None)
+            if changes.get("step") == "completed" and winsound:
+                winsound.Beep(784, 600)
+                winsound.Beep(880, 600)
+        else:
+            # No process: the printer is idle.
+            for name in ("process", "step", "filename", "progress", "elapsed_time"):
+                update(changes, name, None)
+
+    if "chamber_temp" in params:
+        c_temp = params.get("chamber_temp", {})
+        if "current" in c_temp:
+            update(changes, "chamber_current", c_temp["current"])
+        if "target" in c_temp:
+            update(changes, "chamber_target", c_temp["target"])
+
+        e_temp = params.get("extruder_temp", {})
+        if "current" in e_temp:
+            update(changes, "extruder_current", e_temp["current"])
+        if "target" in e_temp:
+            update(changes, "extruder_target", e_temp["target"])
+
+        if "is_menu_2ing" in params:
+            update(changes, "preheating", params["is_menu_2ing"])
     
-    def __init__(self, sock: ssl.SSLSocket):
+    if "toolheads" in params:
+        toolheads = params["toolheads"]
+        
+        if 'chamber' in toolheads and isinstance(toolheads['chamber'], list) and toolheads['chamber']:
+            chamber_data = toolheads['chamber'][0]
+            if "current_temperature" in chamber_data:
+                update(changes, "chamber_current", chamber_data["current_temperature"])
+            if "target_temperature" in chamber_data:
+                update(changes, "chamber_target", chamber_data["target_temperature"])
+            if 'preheating' in chamber_data:
+                update(changes, "preheating", chamber_data["preheating"])
+            
+        if 'extruder' in toolheads and isinstance(toolheads['extruder'], list) and toolheads['extruder']:
+            extruder_data = toolheads['extruder'][0]
+            if "current_temperature" in extruder_data:
+                update(changes, "extruder_current", extruder_data["current_temperature"])
+            if "target_temperature" in extruder_data:
+                update(changes, "extruder_target", extruder_data["target_temperature"])
+            if extruder_data.get('preheating'):
+                update(changes, "preheating", True)
+
+    return changes
+
+# ==============================================================================
+#                 RPC UTILITIES AND CONTROL
+# ==============================================================================
+
+class RpcError(Exception):
+    pass
+
+class RpcFuture(concurrent.futures.Future):
+
+    def __init__(self, table: 'PendingRequests', request_id: int, method: str, timeout: float):
         super().__init__()
-        self.sock = sock
-        self.running = True
-        self.daemon = True 
-        self.last_status_time = time.time()
+        self.table = table
+        self.request_id = request_id
+        self.method = method
+        self.timeout = timeout
+        self.sent_at = time.perf_counter()
+        self.deadline = self.sent_at + timeout
+        self.latency: Optional[float] = None
+
+    def wait(self, timeout: Optional[float] = None) -> Tuple[Optional[Any], Optional[str]]:
+        if timeout is None:
+            timeout = max(0.0, self.deadline - time.perf_counter())
+        try:
+            return self.result(timeout), None
+        except concurrent.futures.TimeoutError:
+            self.table.discard(self.request_id)
+            return None, f"No response to {self.method} (id {self.request_id}) in {self.timeout:.1f} s."
+        except Exception as e:
+            return None, str(e)
+
+class PendingRequests:
+    # Requests waiting for their reply, keyed by JSON-RPC id.
+
+    def __init__(self, latency: Optional[MakerBotMetrics.Histogram] = None):
+        self._lock = threading.Lock()
+        self._calls: Dict[int, RpcFuture] = {}
+        self.latency = latency
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def register(self, request_id: int, method: str, timeout: float = RPC_TIMEOUT) -> RpcFuture:
+        future = RpcFuture(self, request_id, method, timeout)
+        with self._lock:
+            self._calls[request_id] = future
+        return future
+
+    def discard(self, request_id: int):
+        with self._lock:
+            self._calls.pop(request_id, None)
+
+    def resolve(self, response: Dict[str, Any]) -> Optional[RpcFuture]:
+        with self._lock:
+            future = self._calls.pop(response.get('id'), None)
+        if future is None:
+            return None
+        future.latency = time.perf_counter() - future.sent_at
+        if self.latency:
+            self.latency.observe(future.latency)
+        error = response.get('error')
+        if error is not None:
+            message = error.get('message', 'Unknown error!') if isinstance(error, dict) else str(error)
+            future.set_exception(RpcError(f"{future.method}: {message}"))
+        else:
+            future.set_result(response.get('result'))
+        return future
+
+    def expire(self):
+        now = time.perf_counter()
+        with self._lock:
+            expired = [f for f in self._calls.values() if f.deadline < now]
+            for future in expired:
+                del self._calls[future.request_id]
+        for future in expired:
+            future.set_exception(TimeoutError(f"No response to {future.method} (id {future.request_id})."))
+
+    def fail_all(self, exc: Exception):
+        with self._lock:
+            calls = list(self._calls.values())
+            self._calls.clear()
+        for future in calls:
+            future.set_exception(exc)
 
-    def read_json_response(self, socket_obj: socket.socket) -> dict | None:
-        if not hasattr(self, 'buffer'):
-            self.buffer = b''
+# ==============================================================================
+#           PRINTER CONNECTION
+# ==============================================================================
+# Everything that belongs to one printer: stream, listener, request ids,
+# pending requests and status. The monitor drives the default `printer`,
+# the fleet holds one connection per [PRINTER:name] section. The transport
+# is asyncio (the *_async coroutines, run on `event_loop`); the methods
+# without the suffix are the same calls for threads, they block until the
+# loop has done them.
+
+class PrinterConnection:
+
+    def __init__(self, name: str, ip: str = "", username: str = "", local_code: str = "",
+                 port: int = PRINTER_PORT_SECURE, cfg_section: str = 'SETTINGS'):
+        self.name = name
+        self.ip = ip
+        self.username = username
+        self.local_code = local_code
+        self.port = port
+        self.cfg_section = cfg_section
+        self.first_run = False
+        self.upload_window = UPLOAD_WINDOW
+
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.listener: Optional[asyncio.Task] = None
+        self.reconnect_task: Optional[asyncio.Task] = None
+        self.framer = JsonStreamFramer()
+        self.connect_timings: Dict[str, float] = {}   # Seconds per stage of the last connect; "resumed" 1/0
+        self._state = "offline"
+        self.last_error = ""
+        self.closing = False
+        self.disconnects = 0
+        self.reconnects = 0
+        self.downtime = 0.0
+        self.last_disconnect = 0.0
+
+        self.request_id = 1
+        self.request_lock = threading.Lock()
+        self.metrics = MakerBotMetrics.ConnectionMetrics()
+        self.pending = PendingRequests(self.metrics.rpc_latency)
+        self.status = PrinterStatus()
+        self.status_lock = threading.Lock()
+        # Every change of the status or of the link state is a new version.
+        # Waiters on status_changed wake up, watchers are called (wakeup pipes, fleet events).
+        self.status_changed = threading.Condition(self.status_lock)
+        self.status_version = 0
+        self.status_watchers: List[Callable[[], None]] = []   # Called in the event loop, they must not block
+        self.telemetry: Optional['MakerBotTelemetry.TelemetryRecorder'] = None
+        # File name on the printer -> toolpath analysis, of the last few uploads
+        self.toolpaths: Dict[str, 'MakerBotToolpath.ToolpathStats'] = {}
+
+    @property
+    def connected(self) -> bool:
+        return self.writer is not None
+
+    def next_request_id(self) -> int:
+        with self.request_lock:
+            request_id = self.request_id
+            self.request_id += 1
+        return request_id
+
+    # --- Sending ----------------------------------------------------------------
+
+    async def write(self, *parts: bytes):
+        # All parts go out together: the loop runs one write at a time, nothing
+        # from another caller gets in between. The transport may hold on to a
+        # part until it is encrypted, so a writable buffer (the block buffer
+        # that read_file_blocks reuses) is copied; file mappings are not.
+        writer = self.writer
+        if writer is None:
+            raise ConnectionError(f"Not connected to {self.name} ({self.state}).")
+        for part in parts:
+            writer.write(bytes(part) if isinstance(part, memoryview) and not part.readonly else part)
+        await writer.drain()
+
+    def send_payload(self, *parts: bytes):
+        event_loop.run(self.write(*parts))
+
+    async def rpc_send_many_async(self, commands: List[RpcCommand], timeout: float = RPC_TIMEOUT) -> List[RpcFuture]:
+        # One write (and so one TLS record burst) for all commands, every one gets its own id.
+        futures = []
+        payloads = []
+        for command in commands:
+            request_id = self.next_request_id()
+            futures.append(self.pending.register(request_id, command.method, timeout))
+            payloads.append(command.payload(request_id))
+        try:
+            await self.write(b"".join(payloads))
+        except BaseException:
+            for future in futures:
+                self.pending.discard(future.request_id)
+            raise
+        return futures
+
+    def rpc_send_many(self, commands: List[RpcCommand], timeout: float = RPC_TIMEOUT) -> List[RpcFuture]:
+        return event_loop.run(self.rpc_send_many_async(commands, timeout))
+
+    async def wait_async(self, future: RpcFuture, timeout: Optional[float] = None) -> Tuple[Optional[Any], Optional[str]]:
+        # RpcFuture.wait for coroutines.
+        if timeout is None:
+            timeout = max(0.0, future.deadline - time.perf_counter())
+        waiter = asyncio.wrap_future(future)
+        try:
+            done, _ = await asyncio.wait((waiter,), timeout=timeout)
+        except asyncio.CancelledError:
+            self.pending.discard(future.request_id)
+            waiter.cancel()
+            raise
+        if not done:
+            # Out of the table first: no reply can complete the future once it is cancelled.
+            self.pending.discard(future.request_id)
+            waiter.cancel()
+            return None, f"No response to {future.method} (id {future.request_id}) in {future.timeout:.1f} s."
+        try:
+            return waiter.result(), None
+        except Exception as e:
+            return None, str(e)
+
+    def rpc_send(self, command: Union[RpcCommand, str, Dict[str, Any]], timeout: float = RPC_TIMEOUT) -> RpcFuture:
+        command = as_rpc_command(command)
+        request_id = self.next_request_id()
+        future = self.pending.register(request_id, command.method, timeout)
+        final_payload = command.payload(request_id)
+        print(final_payload.decode('utf-8'))
+        try:
+            self.send_payload(final_payload)
+        except Exception:
+            self.pending.discard(request_id)
+            raise
+        return future
+
+    def rpc_call_raw(self, raw_json_string: Union[RpcCommand, str]) -> Tuple[Optional[str], Optional[str]]:
+        if not self.connected:
+            return None, "The socket is not initialized."
+        try:
+            future = self.rpc_send(raw_json_string)
+            return future.method, None
 
-        while True:
-            try:
-                chunk = socket_obj.recv(4096)
-                if not chunk:
-                    print("Error: The connection to the server was closed while reading.")
-                    return None
-                
-                self.buffer += chunk
-                
-                json_start = self.buffer.find(b'{')
-                if json_start == -1:
+        except json.JSONDecodeError:
+            return None, "The hardcoded JSON string is invalid (program error)."
+        except Exception as e:
+            return None, str(e)
+
+    def rpc_call_wait(self, raw_json_string: Union[RpcCommand, str, Dict[str, Any]], timeout: float = RPC_TIMEOUT) -> Tuple[Optional[Any], Optional[str], Optional[float]]:
+        # Same as rpc_call_raw, but waits for the reply: (result, error, round trip seconds)
+        if not self.connected:
+            return None, "The socket is not initialized.", None
+        try:
+            future = self.rpc_send(raw_json_string, timeout)
+        except json.JSONDecodeError:
+            return None, "The hardcoded JSON string is invalid (program error).", None
+        except Exception as e:
+            return None, str(e), None
+        result, error = future.wait(timeout)
+        return result, error, future.latency
+
+    def rpc_call_sequence(self, raw_json_strings: List[Union[RpcCommand, str]], timeout: float = RPC_TIMEOUT) -> Tuple[float, Optional[str]]:
+        # Sends the commands one after the other, each waits for the previous acknowledgement.
+        total_latency = 0.0
+        for raw_json_string in raw_json_strings:
+            result, error, latency = self.rpc_call_wait(raw_json_string, timeout)
+            if error:
+                return total_latency, error
+            total_latency += latency
+        return total_latency, None
+
+    async def upload_async(self, local_path: str, remote_path: str = RPC_FILE_PATH, job: Optional['Job'] = None,
+                           start_print: bool = True, source: Optional['SharedFile'] = None) -> Tuple[Optional[str], Optional[str]]:
+        # rpc_file_upload for coroutines: the same pipeline and manifest, in a
+        # worker thread; its writes come back to this loop.
+        return await asyncio.to_thread(rpc_file_upload, self, local_path, remote_path, job, start_print, source)
+
+    # --- Listener ---------------------------------------------------------------
+
+    async def listen(self):
+        reason = "closed"
+        last_receive = time.monotonic()
+        last_probe = 0.0
+        next_expire = time.perf_counter()
+        read = None
+        pending = self.pending
+        metrics = self.metrics
+        profile = MakerBotProfile.active()   # The TLS read happens inside the event loop, it is not timed here
+        try:
+            while True:
+                # The read stays pending over a heartbeat instead of being cancelled
+                # by wait_for, a cancelled read can swallow the cancellation of close().
+                if read is None:
+                    read = asyncio.ensure_future(self.reader.read(RECV_BUFFER_SIZE))
+                done, _ = await asyncio.wait((read,), timeout=HEARTBEAT_INTERVAL if not pending else EXPIRE_INTERVAL)
+
+                if pending and time.perf_counter() >= next_expire:
+                    pending.expire()
+                    next_expire = time.perf_counter() + EXPIRE_INTERVAL
+
+                if not done:
+                    # A quiet printer is asked something; no answer at all means the link is dead.
+                    silence = time.monotonic() - last_receive
+                    if silence > HEARTBEAT_TIMEOUT:
+                        reason = f"no data for {silence:.0f} s"
+                        break
+                    if silence > HEARTBEAT_INTERVAL and time.monotonic() - last_probe > HEARTBEAT_INTERVAL:
+                        last_probe = time.monotonic()
+                        request_id = self.next_request_id()
+                        pending.register(request_id, CMD_HEARTBEAT.method)
+                        self.writer.write(CMD_HEARTBEAT.payload(request_id))
                     continue
+                chunk = read.result()
+                read = None
+                if not chunk:
+                    print(f"Error: The connection to {self.name} was closed while reading.")
+                    reason = "closed by the printer"
+                    break
+                last_receive = time.monotonic()
+                if profile:
+                    started = time.perf_counter_ns()
+                messages = self.framer.feed(chunk)
+                if profile:
+                    started = profile.span("decode", started)
+                for message in messages:
+                    self.dispatch(message)
+                    if profile:
+                        started = profile.span("dispatch", started)
+                    metrics.listener_lag.observe(time.monotonic() - last_receive)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"\n\n❌ **ERROR in Listener** ({self.name}): {e}")
+            reason = str(e)
+        finally:
+            if read is not None:
+                read.cancel()
+            was_online = self.state == "online"
+            pending.fail_all(ConnectionError(f"Connection to {self.name} lost: {reason}"))
+            if was_online and not self.closing:
+                self.reconnect_task = asyncio.create_task(self.reconnect(reason), name=f"reconnect-{self.name}")
+
+    def dispatch(self, message: Any):
+        if not isinstance(message, dict):
+            return
+        if 'id' in message:
+            self.pending.resolve(message)
+            print(f"\033[92m Response:", message, "\033[0m")
+
+        elif 'method' in message:
+            self.metrics.notifications += 1
+            params = notification_status_params(message)
+            if params is not None:
+                #print(f"\033[93m Notification:", message, "\033[0m")
+                self.update_status(params)
+
+    def update_status(self, params: Dict[str, Any]):
+        profile = MakerBotProfile.active()
+        if profile:
+            started = time.perf_counter_ns()
+        with self.status_lock:
+            if profile:
+                started = profile.span("status_lock", started)
+            changes = apply_printer_status(self.status, params)
+            if changes:
+                self.status_event(changes)
+        if changes:
+            self.notify_watchers()
+        if profile:
+            profile.span("status_update", started)
+
+    # --- Connection -------------------------------------------------------------
+
+    async def open_session(self) -> Optional[str]:
+        # TCP, TLS (resumed if this process has talked to the printer before)
+        # and authorization, timed stage by stage. Returns an authorization error;
+        # connection errors are raised.
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        timings: Dict[str, float] = {}
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            address = (await loop.getaddrinfo(self.ip, self.port, family=socket.AF_INET, type=socket.SOCK_STREAM))[0][4]
+            await asyncio.wait_for(loop.sock_connect(sock, address), CONNECT_TIMEOUT)
+            connected = time.perf_counter()
+            tls_resume_session.set(tls_sessions.get((self.ip, self.port)))
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(sock=sock, ssl=client_ssl_context(), server_hostname=self.ip,
+                                        limit=RECV_BUFFER_SIZE),
+                CONNECT_TIMEOUT - (connected - started))
+        except asyncio.TimeoutError:
+            sock.close()
+            raise ConnectionError(f"no answer from {self.ip}:{self.port} in {CONNECT_TIMEOUT:.0f} s") from None
+        except BaseException:
+            sock.close()
+            raise
+        ssl_object = self.writer.get_extra_info('ssl_object')
+        timings["tcp"] = connected - started
+        timings["tls"] = time.perf_counter() - connected
+        timings["resumed"] = 1.0 if ssl_object.session_reused else 0.0
+        print(f"✅ **SSL/TLS connection is ready (Port: {self.port}{', session resumed' if ssl_object.session_reused else ''}).**")
+
+        # The listener runs from the start, so the authorization replies are
+        # framed and matched by id like every other reply.
+        self.metrics.parse_errors += self.framer.parse_errors
+        self.framer = JsonStreamFramer()
+        self.listener = asyncio.create_task(self.listen(), name=f"listen-{self.name}")
+        auth_started = time.perf_counter()
+        try:
+            error = await self.perform_stable_auth()
+        except BaseException:
+            await self.drop_session()
+            raise
+        if error:
+            await self.drop_session()
+            return error
+        # TLS 1.3 sends the session ticket after the handshake; by now it has arrived.
+        tls_sessions[(self.ip, self.port)] = ssl_object.session
+        timings["auth"] = time.perf_counter() - auth_started
+        timings["total"] = time.perf_counter() - started
+        self.connect_timings = timings
+        print(f"✅ **{self.name}: ready in {timings['total'] * 1000:.0f} ms (TCP {timings['tcp'] * 1000:.0f} ms, "
+              f"TLS {timings['tls'] * 1000:.0f} ms{' resumed' if timings['resumed'] else ''}, "
+              f"auth {timings['auth'] * 1000:.0f} ms).**")
+        return None
+
+    async def perform_stable_auth(self) -> Optional[str]:
+        # Both requests go out in one write; the replies are matched by id,
+        # however the printer splits or joins them.
+        commands = auth_commands(self)
+        timeout = AUTHORIZE_TIMEOUT if self.first_run else RPC_TIMEOUT
+        futures = await self.rpc_send_many_async(commands, timeout)
+        if self.first_run:
+            print(f"Push the button on the printer! ({self.name}, {self.ip})")
+        for command, future in zip(commands, futures):
+            result, error = await self.wait_async(future)
+            error = check_auth_reply(self, command.method, result, error)
+            if error:
+                return error
+        print(f"Authentication successful!")
+        return None
+
+    async def drop_session(self):
+        listener, self.listener = self.listener, None
+        if listener and listener is not asyncio.current_task():
+            listener.cancel()
+            try:
+                await listener
+            except (asyncio.CancelledError, Exception):
+                pass
+        writer, self.writer, self.reader = self.writer, None, None
+        if writer:
+            writer.close()
+            try:
+                # The TLS shutdown can wait for the printer for a long time.
+                await asyncio.wait_for(writer.wait_closed(), CLOSE_TIMEOUT)
+            except Exception:
+                writer.transport.abort()
+        self.pending.fail_all(ConnectionError(f"Connection to {self.name} closed."))
+
+    async def connect_async(self) -> Optional[str]:
+        self.state = "connecting"
+        self.closing = False
+        try:
+            error = await self.open_session()
+        except Exception as e:
+            self.state = "error"
+            self.last_error = f"ERROR establishing connection: {e}. Check IP address."
+            return self.last_error
 
-                temp_data = self.buffer[json_start:].decode('utf-8')
-                
-                try:
-                    response = json.loads(temp_data)
-                    
-                    json_bytes = json.dumps(response).encode('utf-8')
-                    json_size = len(json_bytes)
-                    
-                    self.buffer = self.buffer[json_start + json_size:]
-                    return response
-                    
-                except json.JSONDecodeError:
-                    pass 
-                
-            except socket.timeout:
-                return None
-            except Exception as e:
-                print(f"Unexpected error while reading: {e}")
-                return None
+        if error:
+            self.state = "auth failed"
+            self.last_error = error
+            return error
 
-    def run(self):
         print("\n--- LISTENER START: I am listening for messages from the printer... ---")
-        self.sock.settimeout(1.0)
-        
-        while is_running.is_set():
+        self.state = "online"
+        self.last_error = ""
+        return None
+
+    def connect(self) -> Optional[str]:
+        return event_loop.run(self.connect_async())
+
+    async def reconnect(self, reason: str):
+        # Started by the listener when the link is lost. Every request in flight
+        # has failed; the connection is rebuilt with exponential backoff and
+        # reauthorized with the stored local code. Request ids keep counting up.
+        started = time.time()
+        self.disconnects += 1
+        self.last_disconnect = started
+        self.state = "reconnecting"
+        self.last_error = f"Connection lost: {reason}"
+        print(f"\n❌ **{self.name}: {self.last_error}. Reconnecting...")
+        await self.drop_session()
+
+        delay = RECONNECT_MIN_DELAY
+        while not self.closing:
             try:
-                json_response = self.read_json_response(self.sock)
-                
-                if json_response is None:
-                    if not is_running.is_set():
-                        break
-                    continue 
-
-                if 'id' in json_response:                                        
-                    print(f"\033[92m Response:", json_response, "\033[0m")
-                    pass
-                    
-                elif 'method' in json_response:                      
-                    method = json_response.get('method', 'ismeretlen.metódus')
-                    params = json_response.get('params', {})
-                    if method in ["system_notification", "state_nothification"]:
-                        #print(f"\033[93m Notification:", json_response, "\033[0m")
-                        if method == "system_notification" and 'info' in params:
-                            self.update_printer_status(params['info'])
-                        else:
-                            self.update_printer_status(params)
-                    else:
-                        pass
-                        
+                error = await self.open_session()
+                if not error:
+                    self.reconnects += 1
+                    self.downtime += time.time() - started
+                    self.state = "online"
+                    self.last_error = ""
+                    print(f"✅ **{self.name}: reconnected after {time.time() - started:.1f} s.**")
+                    return
+                self.last_error = error
             except Exception as e:
-                if is_running.is_set():
-                    print(f"\n\n❌ **ERROR in Listener Thread**: {e}")
-                    
-        
-        print("------ 🛑 LISTENER HAS BEEN STOPPED ------")
-                    
+                self.last_error = f"Reconnect failed: {e}"
+            await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+        self.downtime += time.time() - started
+
+    def link_summary(self) -> str:
+        summary = f"{self.state}, reconnects: {self.reconnects}, downtime: {self.downtime:.0f} s"
+        if self.state == "reconnecting":
+            summary += f" (down for {time.time() - self.last_disconnect:.0f} s)"
+        return summary
+
+    async def close_async(self):
+        self.closing = True
+        reconnect_task, self.reconnect_task = self.reconnect_task, None
+        if reconnect_task and reconnect_task is not asyncio.current_task():
+            reconnect_task.cancel()
+            try:
+                await reconnect_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        stopped = self.listener is not None
+        await self.drop_session()
+        if stopped:
+            print("------ 🛑 LISTENER HAS BEEN STOPPED ------")
+        self.state = "offline"
+
+    def close(self):
+        event_loop.run(self.close_async())
+
+    def status_copy(self) -> PrinterStatus:
+        with self.status_lock:
+            return self.status.copy()
+
+    # --- Status events ----------------------------------------------------------
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    @state.setter
+    def state(self, state: str):
+        if state != self._state:
+            self._state = state
+            self.publish_status({"state": state})
+
+    def status_event(self, changes: Dict[str, Any]):
+        # Call with status_lock held.
+        self.status_version += 1
+        self.status_changed.notify_all()
+        if self.telemetry:
+            self.telemetry.record(self.name, changes)
+
+    def notify_watchers(self):
+        # Call without status_lock, a watcher may read the status.
+        for watcher in self.status_watchers:
+            watcher()
+
+    def publish_status(self, changes: Dict[str, Any]):
+        with self.status_lock:
+            self.status_event(changes)
+        self.notify_watchers()
+
+    def wait_status(self, version: int, timeout: Optional[float] = None) -> int:
+        # Sleeps until the status is newer than `version` or the timeout; returns the current version.
+        with self.status_changed:
+            self.status_changed.wait_for(lambda: self.status_version != version, timeout)
+            return self.status_version
+
+printer = PrinterConnection("default")
+printer_status = printer.status
+status_lock = printer.status_lock
+
+def rpc_call_raw(raw_json_string: Union[RpcCommand, str]) -> Tuple[Optional[str], Optional[str]]:
+    return printer.rpc_call_raw(raw_json_string)
+
+def rpc_call_wait(raw_json_string: Union[RpcCommand, str, Dict[str, Any]], timeout: float = RPC_TIMEOUT) -> Tuple[Optional[Any], Optional[str], Optional[float]]:
+    return printer.rpc_call_wait(raw_json_string, timeout)
+
+def rpc_call_sequence(raw_json_strings: List[Union[RpcCommand, str]], timeout: float = RPC_TIMEOUT) -> Tuple[float, Optional[str]]:
+    return printer.rpc_call_sequence(raw_json_strings, timeout)
 
-    def update_printer_status(self, params: Dict[str, Any]):
-        with status_lock:
-            current_process_data = params.get("current_process")
-            current_filename = "N/A"
-            current_progress = "N/A"
-            current_elapsed_time = "N/A"
-            current_process_name = "IDLE"
-            current_step = "N/A"
-
-            if isinstance(current_process_data, dict):
-                current_process_name = current_process_data.get("name", "Active process")
-                current_step = current_process_data.get("step", "N/A")                
-                if current_step == "completed": 
-                    winsound.Beep(784, 600)
-                    winsound.Beep(880, 600)
-                
-                filename = current_process_data.get("filename") 
-                if filename:
-                     current_filename = filename.split('/')[-1]
-                
-                # Progress
-                progress = current_process_data.get("progress")
-                current_progress = f"{progress}%" if progress is not None else "N/A"
-                
-                # Elapsed time
-                elapsed = current_process_data.get("elapsed_time")
-                if isinstance(elapsed, (int, float)):
-                    hours, remainder = divmod(int(elapsed), 3600)
-                    minutes, seconds = divmod(remainder, 60)
-                    current_elapsed_time = f"{hours:02}:{minutes:02}:{seconds:02}"
-
-            printer_status["process"] = current_process_name
-            printer_status["step"] = current_step
-            printer_status["filename"] = current_filename
-            printer_status["progress"] = current_progress
-            printer_status["elapsed_time"] = current_elapsed_time
-            
-            if "chamber_temp" in params:
-                c_temp = params.get("chamber_temp", {})
-                printer_status["chamber_current"] = c_temp.get("current", printer_status["chamber_current"])
-                printer_status["chamber_target"] = c_temp.get("target", printer_status["chamber_target"])
+# ==============================================================================
+#           RPC FILE UPLOAD LOGIC
+# ==============================================================================
 
-                e_temp = params.get("extruder_temp", {})
-                printer_status["extruder_current"] = e_temp.get("current", printer_status["extruder_current"])
-                printer_status["extruder_target"] = e_temp.get("target", printer_status["extruder_target"])
+def read_file_blocks(f, block_size: int = RPC_BLOCK_SIZE):
+    # Yields the file in blocks through one reused buffer, so memory use stays
+    # at one block whatever the file size. A block is only valid until the next one.
+    block = bytearray(block_size)
+    view = memoryview(block)
+    while True:
+        n = f.readinto(block)
+        if not n:
+            return
+        yield view[:n]
+
+class UploadPipeline:
+    # Keeps up to `window` put_raw blocks in flight. Every acknowledgement
+    # frees a slot; a slow acknowledgement means the printer is under pressure,
+    # then the window is halved, and it grows back by one after a window's
+    # worth of quick acknowledgements.
+
+    def __init__(self, connection: PrinterConnection, file_size: int, window: int = UPLOAD_WINDOW,
+                 offset: int = 0, crc: int = 0):
+        self.connection = connection
+        self.file_size = file_size
+        self.offset = offset
+        self.max_window = max(1, window)
+        self.window = self.max_window
+        self.in_flight = deque()
+        self.quick_acks = 0
+        self.backoffs = 0
+        self.bytes_sent = offset
+        self.bytes_acked = offset
+        self.blocks_acked = 0
+        self.crc = crc            # CRC of everything sent so far
+        self.acked_crc = crc      # CRC of everything acknowledged so far
+        self.started = 0.0
+        self.elapsed = 0.0
+        self.on_ack = None      # Called with the pipeline after every acknowledged block
+        self.job: Optional['Job'] = None   # Progress goes there; it can pause or cancel the upload between blocks
+
+    @property
+    def mb_per_s(self) -> float:
+        return (self.bytes_acked - self.offset) / self.elapsed / 1e6 if self.elapsed else 0.0
+
+    def send_block(self, chunk) -> RpcFuture:
+        request_id = self.connection.next_request_id()
+        future = self.connection.pending.register(request_id, "put_raw", UPLOAD_ACK_TIMEOUT)
+        future.length = len(chunk)
+        self.connection.send_payload(put_raw_command(len(chunk)).payload(request_id), chunk)
+        return future
+
+    def wait_oldest(self) -> Optional[str]:
+        future = self.in_flight.popleft()
+        result, error = future.wait(UPLOAD_ACK_TIMEOUT)
+        if error:
+            return error
+        self.bytes_acked += future.length
+        self.blocks_acked += 1
+        self.acked_crc = future.crc
+        if self.on_ack:
+            self.on_ack(self)
+        if future.latency > UPLOAD_PRESSURE_LATENCY:
+            self.window = max(1, self.window // 2)
+            self.quick_acks = 0
+            self.backoffs += 1
+        else:
+            self.quick_acks += 1
+            if self.quick_acks >= self.window and self.window < self.max_window:
+                self.window += 1
+                self.quick_acks = 0
+        return None
+
+    def run(self, blocks, block_crcs=None) -> Optional[str]:
+        # block_crcs: the running CRC after each block, when it is already known (SharedFile).
+        self.started = time.perf_counter()
+        try:
+            for chunk in blocks:
+                if self.job:
+                    error = self.job.checkpoint()
+                    if error:
+                        return error
+                while len(self.in_flight) >= self.window:
+                    error = self.wait_oldest()
+                    if error:
+                        return error
+                self.crc = next(block_crcs) if block_crcs is not None else zlib.crc32(chunk, self.crc)
+                future = self.send_block(chunk)
+                future.crc = self.crc
+                self.in_flight.append(future)
+                self.bytes_sent += len(chunk)
+                i = int((self.bytes_acked / self.file_size) * 100) if self.file_size else 100
+                if self.job:
+                    elapsed = time.perf_counter() - self.started
+                    speed = (self.bytes_acked - self.offset) / elapsed / 1e6 if elapsed else 0.0
+                    self.job.report(i, f"{speed:.1f} MB/s")
+                else:
+                    print(f"\r",i, "% ",int(0.5*i)*".", end='', flush=True)
+            while self.in_flight:
+                error = self.wait_oldest()
+                if error:
+                    return error
+            self.crc &= 0xFFFFFFFF
+            return None
+        finally:
+            for future in self.in_flight:
+                self.connection.pending.discard(future.request_id)
+            self.in_flight.clear()
+            self.elapsed = time.perf_counter() - self.started
+
+def file_crc32(path: str, length: Optional[int] = None) -> int:
+    # CRC of the whole file, or of its first `length` bytes.
+    crc = 0
+    remaining = length
+    with open(path, 'rb') as f:
+        for block in read_file_blocks(f, RPC_BLOCK_SIZE):
+            if remaining is not None:
+                block = block[:remaining]
+                remaining -= len(block)
+            crc = zlib.crc32(block, crc)
+            if remaining == 0:
+                break
+    return crc & 0xFFFFFFFF
+
+class SharedFile:
+    # A file read and checksummed once, to be uploaded to many printers. The
+    # blocks are read-only views of one mmap; no printer gets its own copy,
+    # and the running CRC after every block is computed here once.
+
+    def __init__(self, path: str, block_size: int = RPC_BLOCK_SIZE):
+        self.path = os.path.abspath(path)
+        self.block_size = block_size
+        with open(self.path, 'rb') as f:
+            file_stat = os.fstat(f.fileno())
+            self.size = file_stat.st_size
+            self.mtime = file_stat.st_mtime
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self.view = memoryview(self.map) if self.map else memoryview(b"")
+        self.crcs: List[int] = []
+        crc = 0
+        for start in range(0, self.size, block_size):
+            crc = zlib.crc32(self.view[start:start + block_size], crc)
+            self.crcs.append(crc)
+        self.crc = crc & 0xFFFFFFFF
+
+    def crc_at(self, length: int) -> int:
+        # CRC of the first `length` bytes; length is a whole number of blocks (or the size).
+        blocks = -(-length // self.block_size)
+        return self.crcs[blocks - 1] & 0xFFFFFFFF if blocks else 0
+
+    def blocks(self, offset: int = 0):
+        for start in range(offset, self.size, self.block_size):
+            yield self.view[start:start + self.block_size]
+
+    def block_crcs(self, offset: int = 0):
+        return iter(self.crcs[offset // self.block_size:])
+
+    def close(self):
+        self.view.release()
+        if self.map:
+            try:
+                self.map.close()
+            except BufferError:
+                pass    # A block is still referenced somewhere; the map goes with it
 
-                printer_status["preheating"] = params.get("is_menu_2ing", printer_status["preheating"])
-            
-            if "toolheads" in params:
-                toolheads = params["toolheads"]
-                
-                if 'chamber' in toolheads and isinstance(toolheads['chamber'], list) and toolheads['chamber']:
-                    chamber_data = toolheads['chamber'][0]
-                    printer_status["chamber_current"] = chamber_data.get("current_temperature", printer_status["chamber_current"])
-                    printer_status["chamber_target"] = chamber_data.get("target_temperature", printer_status["chamber_target"])
-                    if 'preheating' in chamber_data:
-                        printer_status["preheating"] = chamber_data["preheating"]
-                    
-                if 'extruder' in toolheads and isinstance(toolheads['extruder'], list) and toolheads['extruder']:
-                    extruder_data = toolheads['extruder'][0]
-                    printer_status["extruder_current"] = extruder_data.get("current_temperature", printer_status["extruder_current"])
-                    printer_status["extruder_target"] = extruder_data.get("target_temperature", printer_status["extruder_target"])
-                    
-                    if 'preheating' in extruder_data and extruder_data['preheating']:
-                           printer_status["preheating"] = True
+    def __enter__(self) -> 'SharedFile':
+        return self
 
-# ==============================================================================
-#                 RPC UTILITIES AND CONTROL
-# ==============================================================================
+    def __exit__(self, *exc):
+        self.close()
 
-def rpc_call_raw(raw_json_string: str) -> Tuple[Optional[str], Optional[str]]:
-    global ssl_socket, global_request
-    if not ssl_socket:
-        return None, "The socket is not initialized."
-    try:
-        rpc_data = json.loads(raw_json_string)
-        rpc_data["id"] = global_request
-        method_name = rpc_data.get("method", "unknown.method")
-        final_payload = json.dumps(rpc_data)
-        print(final_payload)
-        ssl_socket.sendall(final_payload.encode('utf-8'))
-        global_request += 1
-        return method_name, None 
-        
-    except json.JSONDecodeError:
-        return None, "The hardcoded JSON string is invalid (program error)."
-    except Exception as e:
-        return None, str(e)
+class UploadManifest:
+    # What has been sent to which printer: {"<ip>|<remote path>": {path, size,
+    # mtime, crc, block_size, blocks_acked, acked_crc, complete}}. It is kept
+    # next to the script, like makerbot.cfg, and rewritten atomically.
 
-# ==============================================================================
-#           RPC FILE UPLOAD LOGIC
-# ==============================================================================
+    SAVE_INTERVAL = 2.0
+
+    def __init__(self, path: str = UPLOAD_MANIFEST_PATH):
+        self.path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.last_save = 0.0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    @staticmethod
+    def key(printer_ip: str, remote_path: str) -> str:
+        return f"{printer_ip}|{remote_path}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            entry = self.entries.get(key)
+            return dict(entry) if entry else None
+
+    def known_crc(self, local_path: str, size: int, mtime: float) -> Optional[int]:
+        # A file that has not changed since it was last sent does not need a CRC pass.
+        with self.lock:
+            for entry in self.entries.values():
+                if (entry.get("path") == local_path and entry.get("size") == size
+                        and entry.get("mtime") == mtime and entry.get("crc") is not None):
+                    return entry["crc"]
+        return None
+
+    def update(self, key: str, force_save: bool = True, **fields):
+        with self.lock:
+            self.entries.setdefault(key, {}).update(fields, updated=time.time())
+            if not force_save and time.time() - self.last_save < self.SAVE_INTERVAL:
+                return
+            self.last_save = time.time()
+            data = json.dumps(self.entries, indent=1)
+        temp_path = f"{self.path}.{threading.get_ident()}.tmp"   # Fleet uploads save from several threads
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Warning: could not save the upload manifest: {e}")
+
+upload_manifest = UploadManifest()
+job_catalog: Optional['MakerBotCatalog.JobCatalog'] = None    # --catalog DIR
+
+def resolve_job_path(name: str) -> str:
+    # A job given by its name in the catalog, or a path.
+    found = job_catalog.find(name) if job_catalog else None
+    return found or name
 
-def rpc_file_upload() -> Tuple[Optional[str], Optional[str]]:
-    global ssl_socket, global_request, filename
-    rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "clear_queue"}')
-    time.sleep(0.1)
-    rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "close_queue"}')
-    time.sleep(0.1)
-    absolute_local_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), LOCAL_FILE_PATH)
+def rpc_print_file(conn: PrinterConnection, filepath: str = LOCAL_FILE_PATH) -> Optional[str]:
+    print_params = {
+        "filepath": filepath,
+        "ensure_build_plate_clear": False
+    } 
+    call = {"params": print_params, "jsonrpc": "2.0", "method": "print"}
+    result, error, latency = conn.rpc_call_wait(call)
+    return error
+
+def rpc_file_upload(conn: Optional[PrinterConnection] = None, local_path: str = LOCAL_FILE_PATH,
+                    remote_path: str = RPC_FILE_PATH, job: Optional['Job'] = None,
+                    start_print: bool = True, source: Optional[SharedFile] = None) -> Tuple[Optional[str], Optional[str]]:
+    # start_print=False only stages the file (under another remote name while
+    # something else is printing), so the command queue is left alone then.
+    # With a SharedFile the blocks and CRCs come from it, not from the disk.
+    conn = conn or printer
+    print_path = os.path.basename(remote_path)
+    if start_print:
+        latency, error = conn.rpc_call_sequence([
+            CMD_CLEAR_QUEUE,
+            CMD_CLOSE_QUEUE,
+        ])
+        if error:
+            return "rpc_file_upload", f"ERROR: Could not reset the queue: {error}"
+    absolute_local_path = source.path if source else os.path.join(os.path.dirname(os.path.abspath(__file__)), local_path)
     
     if not os.path.exists(absolute_local_path):
-        return "rpc_file_upload", f"ERROR: Local file not found: {LOCAL_FILE_PATH}"
+        return "rpc_file_upload", f"ERROR: Local file not found: {local_path}"
+    # Layers, time and filament are worked out while the file is being sent.
+    analysis = MakerBotToolpath.analyze_in_background(absolute_local_path)
+    if analysis:
+        analysis.add_done_callback(functools.partial(_remember_toolpath, conn, print_path))
+
+    manifest_key = UploadManifest.key(conn.ip, remote_path)
+    entry = upload_manifest.get(manifest_key) or {}
+    offset = 0
+    resume_crc = 0
     try:
-        with open(absolute_local_path, 'rb') as f:
-            file_bytes = f.read()
-            file_size = len(file_bytes)
-            crc_checksum = zlib.crc32(file_bytes) & 0xFFFFFFFF
+        file_stat = os.stat(absolute_local_path)
+        file_size = source.size if source else file_stat.st_size
+        same_size = entry.get("size") == file_size and entry.get("block_size") == RPC_BLOCK_SIZE
+
+        # The printer already has this exact file: print it without sending it again.
+        if same_size and entry.get("complete"):
+            file_crc = source.crc if source else upload_manifest.known_crc(absolute_local_path, file_size, file_stat.st_mtime)
+            if file_crc is None and job_catalog:
+                file_crc = job_catalog.known_crc(absolute_local_path, file_size, file_stat.st_mtime)
+            if file_crc is None:
+                file_crc = file_crc32(absolute_local_path)
+            if file_crc == entry.get("crc"):
+                if not start_print:
+                    return f"Upload (file already on the printer, skipped{toolpath_note(analysis)})", None
+                error = rpc_print_file(conn, print_path)
+                if not error:
+                    return f"Print (file already on the printer, upload skipped{toolpath_note(analysis)})", None
+                print(f"\n The printer does not have the file any more ({error}), uploading it again.")
+
+        # An interrupted upload of the same file continues after the last acknowledged block.
+        elif UPLOAD_RESUME and same_size and entry.get("blocks_acked"):
+            acked = min(entry["blocks_acked"] * RPC_BLOCK_SIZE, file_size)
+            acked_crc = source.crc_at(acked) if source else file_crc32(absolute_local_path, acked)
+            if acked_crc == entry.get("acked_crc"):
+                offset = acked
+                resume_crc = entry["acked_crc"]
     except Exception as e:
         return "rpc_file_upload", f"ERROR: Error reading local file: {e}"
 
     feedback_prefix = f"Upload ({os.path.basename(absolute_local_path)}, {file_size} byte)"
+    upload_manifest.update(manifest_key, path=absolute_local_path, size=file_size, mtime=file_stat.st_mtime,
+                           crc=None, block_size=RPC_BLOCK_SIZE, complete=False)
+
+    pipeline, error = _upload_file(conn, absolute_local_path, remote_path, file_size, manifest_key, offset, resume_crc, job, source)
+    # A cancel that came after the last block was acknowledged did not stop anything.
+    if error and job and job.cancelled.is_set():
+        resume_note = ", it resumes from there" if UPLOAD_RESUME else ""
+        return "rpc_file_upload", f"Upload cancelled at {pipeline.bytes_acked if pipeline else offset} byte{resume_note}."
+    if error and offset:
+        print(f"\n Resume was not accepted ({error}), uploading the whole file.")
+        pipeline, error = _upload_file(conn, absolute_local_path, remote_path, file_size, manifest_key, 0, 0, job, source)
+    if error:
+        return "rpc_file_upload", f"ERROR: {feedback_prefix} {error}"
+    upload_manifest.update(manifest_key, crc=pipeline.crc, complete=True)
+    if job_catalog:
+        job_catalog.remember_crc(absolute_local_path, file_size, file_stat.st_mtime, pipeline.crc)
+    if not start_print:
+        return f"Upload ({pipeline.mb_per_s:.2f} MB/s{toolpath_note(analysis)})", None
+
+    error = rpc_print_file(conn, print_path)
+    if error:
+        return "rpc_file_upload", f"ERROR: {feedback_prefix} print failed: {error}"
+    return f"Upload and print ({pipeline.mb_per_s:.2f} MB/s{toolpath_note(analysis)})", None
+
+TOOLPATHS_KEPT = 8      # Analyses kept per printer
+
+def _remember_toolpath(conn: PrinterConnection, print_path: str, analysis: concurrent.futures.Future):
+    stats = MakerBotToolpath.finished_stats(analysis)
+    if stats is None:
+        return
+    toolpaths = conn.toolpaths
+    toolpaths.pop(print_path, None)
+    toolpaths[print_path] = stats
+    while len(toolpaths) > TOOLPATHS_KEPT:
+        del toolpaths[next(iter(toolpaths))]
+
+def toolpath_note(analysis: Optional[concurrent.futures.Future]) -> str:
+    stats = MakerBotToolpath.finished_stats(analysis)
+    return f"; {stats.summary()}" if stats else ""
+
+def _upload_file(conn: PrinterConnection, absolute_local_path: str, remote_path: str, file_size: int,
+                 manifest_key: str, offset: int, crc: int,
+                 job: Optional['Job'] = None,
+                 source: Optional[SharedFile] = None) -> Tuple[Optional[UploadPipeline], Optional[str]]:
+    local_file = None
+    if not source:
+        try:
+            local_file = open(absolute_local_path, 'rb')
+        except Exception as e:
+            return None, f"Error reading local file: {e}"
+
+    with local_file or contextlib.nullcontext():
+        # --- 1. STEP: put_init
+        init_params = {
+            "length": file_size, 
+            "block_size": RPC_BLOCK_SIZE, 
+            "file_path": remote_path,
+            "file_id": RPC_FILE_ID
+        }
+        if offset:
+            init_params["offset"] = offset
+        call = {"params": init_params, "jsonrpc": "2.0", "method": "put_init"}
+        result, error, latency = conn.rpc_call_wait(call, UPLOAD_ACK_TIMEOUT)
+        if error:
+            return None, f"put_init failed: {error}"
+
+        # --- 2. STEP: put_raw  ---
+        # The file is streamed block by block, the CRC is computed on the way
+        # and the manifest follows the acknowledgements.
+        print("\n Upload is starting." if not offset else f"\n Upload is resuming at {offset} byte.")
+        first_block = offset // RPC_BLOCK_SIZE
+        pipeline = UploadPipeline(conn, file_size, conn.upload_window, offset, crc)
+        pipeline.job = job
+        pipeline.on_ack = lambda p: upload_manifest.update(
+            manifest_key, force_save=False, blocks_acked=first_block + p.blocks_acked, acked_crc=p.acked_crc)
+        if source:
+            error = pipeline.run(source.blocks(offset), source.block_crcs(offset))
+        else:
+            local_file.seek(offset)
+            error = pipeline.run(read_file_blocks(local_file, RPC_BLOCK_SIZE))
+        conn.metrics.upload(pipeline.bytes_acked - offset, pipeline.elapsed)
+        upload_manifest.update(manifest_key, blocks_acked=first_block + pipeline.blocks_acked, acked_crc=pipeline.acked_crc)
+        if error:
+            return pipeline, f"put_raw failed: {error}"
+
+    if pipeline.bytes_sent != file_size:
+        return pipeline, f"{os.path.basename(absolute_local_path)} changed during the upload."
 
-    # --- 1. STEP: put_init    
-    init_params = {
-        "length": file_size, 
-        "block_size": RPC_BLOCK_SIZE, 
-        "file_path": RPC_FILE_PATH,
-        "file_id": RPC_FILE_ID
-    }
-    call = {
-        "params": init_params,
-        "jsonrpc": "2.0",
-        "method": "put_init",
-        "id": global_request
-    } 
-    json_string = json.dumps(call)               
-    payload = json_string.encode('utf-8')
-    print(payload)
-    ssl_socket.sendall(payload)
-    global_request += 1
-    time.sleep(3)
-     
-    # --- 2. STEP: put_raw  ---
-    bytes_sent = 0
-    i=0
-    print("\n Upload is starting.")
-    while bytes_sent < file_size:
-        chunk = file_bytes[bytes_sent:bytes_sent + RPC_BLOCK_SIZE]    
-        chunk_len = len(chunk)
-        i=int((bytes_sent/file_size)*100)
-        raw_params_list = [RPC_FILE_ID, chunk_len]
-        raw_request = {
-            "params": raw_params_list,
-            "jsonrpc": "2.0",
-            "method": "put_raw",
-            "id": global_request
-        }  
-        raw_header = json.dumps(raw_request)
-        payload = raw_header.encode('utf-8')
-        print(payload)
-        ssl_socket.sendall(payload)
-        print(f"\r",i, "% ",int(0.5*i)*".", end='', flush=True)
-        ssl_socket.sendall(chunk)
-        global_request += 1
-        bytes_sent += chunk_len
-        time.sleep(1)
-    
     # --- 3. STEP: put_term  --- 
-    print("\n Finished")
+    print(f"\n Finished: {pipeline.mb_per_s:.2f} MB/s, window {pipeline.window}/{pipeline.max_window}, {pipeline.backoffs} backoffs")
     term_params = {
-        "crc": crc_checksum,   
+        "crc": pipeline.crc,   
         "length": file_size,
         "file_id": RPC_FILE_ID
     }
-    call = {
-        "params": term_params,
-        "jsonrpc": "2.0",
-        "method": "put_term",
-        "id": global_request              
-    }          
-    json_string = json.dumps(call)               
-    payload = json_string.encode('utf-8')
-    print(payload)
-    ssl_socket.sendall(payload)
-    global_request += 1
-    
-    print_params = {
-        "filepath": LOCAL_FILE_PATH,
-        "ensure_build_plate_clear": False
-    } 
-    
-    call = {
-        "params": print_params,
-        "jsonrpc": "2.0",
-        "method": "print",
-        "id": global_request              
-    }          
-    
-    json_string = json.dumps(call)               
-    payload = json_string.encode('utf-8')
-    ssl_socket.sendall(payload)
-    global_request += 1
-    return "Upload and print",""
+    call = {"params": term_params, "jsonrpc": "2.0", "method": "put_term"}
+    result, error, latency = conn.rpc_call_wait(call, UPLOAD_ACK_TIMEOUT)
+    if error:
+        return pipeline, f"put_term failed: {error}"
+    # Firmware that ignores the offset writes the rest of the file from byte 0; whether it then
+    # rejects the CRC is up to the firmware. A resumed file is only printed when the reply
+    # states the CRC of what the printer has; otherwise the caller sends the whole file again.
+    if offset and not put_term_confirms(result, pipeline.crc, file_size):
+        return pipeline, f"put_term did not confirm the resumed file (reply: {result!r})"
+    return pipeline, None
+
+def put_term_confirms(result: Any, crc: int, length: int) -> bool:
+    if not isinstance(result, dict) or not isinstance(result.get("crc"), int):
+        return False
+    return result["crc"] & 0xFFFFFFFF == crc and result.get("length", length) == length
+
+# ==============================================================================
+#           QUEUE MACROS
+# ==============================================================================
+# A motion macro fills the printer's command queue and then runs it. The
+# preamble (close and open the queue) and all queued commands go out in one
+# write; only when every one of them is acknowledged is execute_queue sent.
+# If anything fails, the queue is cleared and closed instead, so a partly
+# filled queue never runs.
+
+class QueueMacro:
+
+    def __init__(self, name: str, commands: List[RpcCommand] = (),
+                 preamble: Tuple[RpcCommand, ...] = None):
+        self.name = name
+        self.preamble = (CMD_CLOSE_QUEUE, CMD_OPEN_QUEUE) if preamble is None else tuple(preamble)
+        self.commands = list(commands)
+
+    def add(self, command: RpcCommand) -> 'QueueMacro':
+        self.commands.append(command)
+        return self
+
+    def move(self, point_mm: Tuple[float, ...], mm_per_second: float, relative: Tuple[bool, ...]) -> 'QueueMacro':
+        return self.add(move_command(tuple(point_mm), mm_per_second, tuple(relative)))
+
+    @property
+    def program(self) -> List[RpcCommand]:
+        return list(self.preamble) + self.commands
+
+    def run(self, conn: PrinterConnection, timeout: float = RPC_TIMEOUT) -> Tuple[float, Optional[str]]:
+        # Returns (seconds from the first write to the execute_queue acknowledgement, error)
+        if not conn.connected:
+            return 0.0, "The socket is not initialized."
+        started = time.perf_counter()
+        try:
+            futures = conn.rpc_send_many(self.program, timeout)
+        except Exception as e:
+            return time.perf_counter() - started, str(e)
+        error = None
+        for future in futures:
+            result, error = future.wait(timeout)
+            if error:
+                break
+        if error:
+            for future in futures:
+                conn.pending.discard(future.request_id)
+            self.abort(conn)
+            return time.perf_counter() - started, error
+        result, error, latency = conn.rpc_call_wait(CMD_EXECUTE_QUEUE, timeout)
+        return time.perf_counter() - started, error
+
+    @staticmethod
+    def abort(conn: PrinterConnection):
+        # Fire and forget: the connection may be the reason the macro failed.
+        try:
+            conn.rpc_send_many([CMD_CLEAR_QUEUE, CMD_CLOSE_QUEUE])
+        except Exception:
+            pass
+
+HOME_XY_MACRO = QueueMacro("Home X/Y", [
+    machine_command("home_axis", axis=1, speed=11, flip_direction=True, set_position=False),
+    machine_command("set_position", axis=1, position_mm=-152),
+    machine_command("move_axis", axis=1, point_mm=0, mm_per_second=100, relative=False),
+    machine_command("home_axis", axis=0, speed=11, flip_direction=False, set_position=True),
+    move_command((145.5, 0, 0, 0), 100.0, (False, True, True, True)),
+    machine_command("home_axis", axis=1, speed=11, flip_direction=False, set_position=True),
+    move_command((0, 175, 0, 0), 100.0, (True, False, True, True)),
+])
+
+HOME_Z_MACRO = QueueMacro("Home Z", [
+    machine_command("home_axis", axis=0, speed=30, flip_direction=True, set_position=True),
+    machine_command("home_axis", axis=1, speed=30, flip_direction=False, set_position=True),
+    machine_command("move_axis", axis=1, point_mm=-270, mm_per_second=100, relative=True),
+    machine_command("move_axis", axis=0, point_mm=-216.5, mm_per_second=100, relative=True),
+    machine_command("set_position", axis=1, position_mm=0),
+    machine_command("set_position", axis=0, position_mm=0),
+    machine_command("wait_for_heaters_at_target", timeout_minutes=5, check=[True, False]),
+    RpcCommand("home", {"axes": "z"}),
+], preamble=(
+    CMD_CLOSE_QUEUE,
+    machine_command("set_temperature_target", method="machine_action_command", index=0, temperature=180),
+    CMD_OPEN_QUEUE,
+))
+
+PARK_MACRO = (QueueMacro("Park")
+    .move((0, 0, 50, 0), 3.0, (True, True, False, True))
+    .move((0, 130, 0, 0), 100.0, (True, False, True, True))
+    .move((147.5, 0, 0, 0), 100.0, (False, True, True, True))
+    .move((145.5, 0, 0, 0), 100.0, (False, True, True, True))
+    .move((0, 175, 0, 0), 100.0, (True, False, True, True)))
+
+MOVE_HOME_Z_MACRO = (QueueMacro("Move home Z")
+    .move((0, 0, 0, 0), 100.0, (False, False, True, True))
+    .move((0, 0, 0, 0), 3.0, (True, True, False, True)))
+
+Z_ZERO_MACRO = QueueMacro("Z zero", [machine_command("set_position", axis=2, position_mm=0)])
+
+# Z jog distance (mm, negative is up) -> speed (mm/s)
+Z_JOG_SPEEDS = {0.01: 1.0, 0.1: 1.0, 1: 2.0, 10: 3.0, 100: 3.0}
+
+@functools.lru_cache(maxsize=64)
+def move_axis_macro(axis: int, distance_mm: float, mm_per_second: float) -> QueueMacro:
+    point_mm = [0, 0, 0, 0]
+    point_mm[axis] = distance_mm
+    return QueueMacro(f"Move axis {axis}").move(point_mm, mm_per_second, (True, True, True, True))
 
 def home_xy():
-    try:
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "close_queue"}')
-        rpc_call_raw('{"params": {"clear": true}, "jsonrpc": "2.0", "method": "open_queue"}')
-        rpc_call_raw('{"params": {"machine_func": "home_axis", "params": {"axis": 1, "speed": 11, "flip_direction": true, "set_position": false}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {"machine_func": "set_position", "params": {"axis": 1, "position_mm": -152}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {"machine_func": "move_axis", "params": {"axis": 1, "point_mm": 0, "mm_per_second": 100, "relative":false}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {"machine_func": "home_axis", "params": {"axis": 0, "speed": 11, "flip_direction": false, "set_position": true}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {"machine_func": "move", "params": {"point_mm":[145.5, 0, 0, 0], "mm_per_second":100.0, "relative":[false, true, true, true]}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {"machine_func": "home_axis", "params": {"axis": 1, "speed": 11, "flip_direction": false, "set_position": true}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {"machine_func": "move", "params": {"point_mm":[0, 175, 0, 0], "mm_per_second":100.0, "relative":[true, false, true, true]}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "execute_queue"}')
-        return "Home X/Y process", None 
-    except Exception as e:
-        return "There is something wrong with my HOME X/Y commands.", str(e)
+    latency, error = HOME_XY_MACRO.run(printer)
+    if error:
+        return "There is something wrong with my HOME X/Y commands.", error
+    return f"Home X/Y process ({latency * 1000:.0f} ms)", None
 
 def home_z():
-    try:
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "close_queue"}')
-        rpc_call_raw('{"params": {"machine_func": "set_temperature_target", "params": {"index": 0, "temperature": 180}}, "jsonrpc": "2.0", "method": "machine_action_command"}')
-        rpc_call_raw('{"params": {"clear": true}, "jsonrpc": "2.0", "method": "open_queue"}')
-        rpc_call_raw('{"params": {"machine_func": "home_axis", "params": {"axis": 0, "speed": 30, "flip_direction": true, "set_position": true}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {"machine_func": "home_axis", "params": {"axis": 1, "speed": 30, "flip_direction": false, "set_position": true}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {"machine_func": "move_axis", "params": {"axis": 1, "point_mm": -270, "mm_per_second": 100, "relative":true}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {"machine_func": "move_axis", "params": {"axis": 0, "point_mm": -216.5, "mm_per_second": 100, "relative":true}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {"machine_func": "set_position", "params": {"axis": 1, "position_mm": 0}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {"machine_func": "set_position", "params": {"axis": 0, "position_mm": 0}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {"machine_func": "wait_for_heaters_at_target", "params": {"timeout_minutes":5,"check":[true, false]}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {"axes": "z"}, "jsonrpc": "2.0", "method": "home"}')
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "execute_queue"}')
-        return "Home Z process", None 
-    except Exception as e:
-        return "There is something wrong with my HOME-Z commands.", str(e)
+    latency, error = HOME_Z_MACRO.run(printer)
+    if error:
+        return "There is something wrong with my HOME-Z commands.", error
+    return f"Home Z process ({latency * 1000:.0f} ms)", None
         
 def park():
-    try:
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "close_queue"}')
-        rpc_call_raw('{"params": {"clear": true}, "jsonrpc": "2.0", "method": "open_queue"}')
-        rpc_call_raw('{"params": {"machine_func": "move", "params": {"point_mm":[0, 0, 50, 0], "mm_per_second":3.0, "relative":[true, true, false, true]}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {"machine_func": "move", "params": {"point_mm":[0, 130, 0, 0], "mm_per_second":100.0, "relative":[true, false, true, true]}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {"machine_func": "move", "params": {"point_mm":[147.5, 0, 0, 0], "mm_per_second":100.0, "relative":[false, true, true, true]}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {"machine_func": "move", "params": {"point_mm":[145.5, 0, 0, 0], "mm_per_second":100.0, "relative":[false, true, true, true]}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {"machine_func": "move", "params": {"point_mm":[0, 175, 0, 0], "mm_per_second":100.0, "relative":[true, false, true, true]}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "execute_queue"}')
-        return "Park process", None 
-    except Exception as e:
-        return "There is something wrong with my PARK commands.", str(e)
+    latency, error = PARK_MACRO.run(printer)
+    if error:
+        return "There is something wrong with my PARK commands.", error
+    return f"Park process ({latency * 1000:.0f} ms)", None
 
 def move_home_z():
-    try:
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "close_queue"}')
-        rpc_call_raw('{"params": {"clear": true}, "jsonrpc": "2.0", "method": "open_queue"}')
-        rpc_call_raw('{"params": {"machine_func": "move", "params": {"point_mm":[0,0,0,0], "mm_per_second":100.0, "relative":[false, false, true, true]}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {"machine_func": "move", "params": {"point_mm":[0,0,0,0], "mm_per_second":3.0, "relative":[true, true, false, true]}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "execute_queue"}')
-        return "Move process", None 
-    except Exception as e:
-        return "There is something wrong with my MOVE commands.", str(e)
-        
-def move_z_up_001():
-    try:
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "close_queue"}')
-        rpc_call_raw('{"params": {"clear": true}, "jsonrpc": "2.0", "method": "open_queue"}')
-        rpc_call_raw('{"params": {"machine_func": "move", "params": {"point_mm":[0,0,-0.01,0], "mm_per_second":1.0, "relative":[true, true, true, true]}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "execute_queue"}')
-        return "Move process", None 
-    except Exception as e:
-        return "There is something wrong with my MOVE commands.", str(e)
-
-def move_z_up_01():
-    try:
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "close_queue"}')
-        rpc_call_raw('{"params": {"clear": true}, "jsonrpc": "2.0", "method": "open_queue"}')
-        rpc_call_raw('{"params": {"machine_func": "move", "params": {"point_mm":[0,0,-0.1,0], "mm_per_second":1.0, "relative":[true, true, true, true]}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "execute_queue"}')
-        return "Move process", None 
-    except Exception as e:
-        return "There is something wrong with my MOVE commands.", str(e)
-
-def move_z_up_1():
-    try:
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "close_queue"}')
-        rpc_call_raw('{"params": {"clear": true}, "jsonrpc": "2.0", "method": "open_queue"}')
-        rpc_call_raw('{"params": {"machine_func": "move", "params": {"point_mm":[0,0,-1,0], "mm_per_second":2.0, "relative":[true, true, true, true]}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "execute_queue"}')
-        return "Move process", None 
-    except Exception as e:
-        return "There is something wrong with my MOVE commands.", str(e)
-
-def move_z_up_10():
-    try:
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "close_queue"}')
-        rpc_call_raw('{"params": {"clear": true}, "jsonrpc": "2.0", "method": "open_queue"}')
-        rpc_call_raw('{"params": {"machine_func": "move", "params": {"point_mm":[0,0,-10,0], "mm_per_second":3.0, "relative":[true, true, true, true]}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "execute_queue"}')
-        return "Move process", None 
-    except Exception as e:
-        return "There is something wrong with my MOVE commands.", str(e)
-
-def move_z_up_100():
-    try:
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "close_queue"}')
-        rpc_call_raw('{"params": {"clear": true}, "jsonrpc": "2.0", "method": "open_queue"}')
-        rpc_call_raw('{"params": {"machine_func": "move", "params": {"point_mm":[0,0,-100,0], "mm_per_second":3.0, "relative":[true, true, true, true]}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "execute_queue"}')
-        return "Move process", None 
-    except Exception as e:
-        return "There is something wrong with my MOVE commands.", str(e)
-
-def move_z_down_001():
-    try:
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "close_queue"}')
-        rpc_call_raw('{"params": {"clear": true}, "jsonrpc": "2.0", "method": "open_queue"}')
-        rpc_call_raw('{"params": {"machine_func": "move", "params": {"point_mm":[0,0,0.01,0], "mm_per_second":1.0, "relative":[true, true, true, true]}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "execute_queue"}')
-        return "Move process", None 
-    except Exception as e:
-        return "There is something wrong with my MOVE commands.", str(e)
-
-def move_z_down_01():
-    try:
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "close_queue"}')
-        rpc_call_raw('{"params": {"clear": true}, "jsonrpc": "2.0", "method": "open_queue"}')
-        rpc_call_raw('{"params": {"machine_func": "move", "params": {"point_mm":[0,0,0.1,0], "mm_per_second":1.0, "relative":[true, true, true, true]}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "execute_queue"}')
-        return "Move process", None 
-    except Exception as e:
-        return "There is something wrong with my MOVE commands.", str(e)
-
-def move_z_down_1():
-    try:
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "close_queue"}')
-        rpc_call_raw('{"params": {"clear": true}, "jsonrpc": "2.0", "method": "open_queue"}')
-        rpc_call_raw('{"params": {"machine_func": "move", "params": {"point_mm":[0,0,1,0], "mm_per_second":2.0, "relative":[true, true, true, true]}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "execute_queue"}')
-        return "Move process", None 
-    except Exception as e:
-        return "There is something wrong with my MOVE commands.", str(e)
-
-def move_z_down_10():
-    try:
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "close_queue"}')
-        rpc_call_raw('{"params": {"clear": true}, "jsonrpc": "2.0", "method": "open_queue"}')
-        rpc_call_raw('{"params": {"machine_func": "move", "params": {"point_mm":[0,0,10,0], "mm_per_second":3.0, "relative":[true, true, true, true]}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "execute_queue"}')
-        return "Move process", None 
-    except Exception as e:
-        return "There is something wrong with my MOVE commands.", str(e)
-
-def move_z_down_100():
-    try:
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "close_queue"}')
-        rpc_call_raw('{"params": {"clear": true}, "jsonrpc": "2.0", "method": "open_queue"}')
-        rpc_call_raw('{"params": {"machine_func": "move", "params": {"point_mm":[0,0,100,0], "mm_per_second":3.0, "relative":[true, true, true, true]}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "execute_queue"}')
-        return "Move process", None 
-    except Exception as e:
-        return "There is something wrong with my MOVE commands.", str(e)
+    latency, error = MOVE_HOME_Z_MACRO.run(printer)
+    if error:
+        return "There is something wrong with my MOVE commands.", error
+    return f"Move process ({latency * 1000:.0f} ms)", None
+
+def move_z(distance_mm: float):
+    # Jogs Z by distance_mm, a negative distance moves the bed up.
+    speed = Z_JOG_SPEEDS[abs(distance_mm)]
+    latency, error = move_axis_macro(2, distance_mm, speed).run(printer)
+    if error:
+        return "There is something wrong with my MOVE commands.", error
+    return f"Move process ({latency * 1000:.0f} ms)", None
 
 def z_zero():
-    try:
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "close_queue"}')
-        rpc_call_raw('{"params": {"clear": true}, "jsonrpc": "2.0", "method": "open_queue"}')
-        rpc_call_raw('{"params": {"machine_func": "set_position", "params": {"axis": 2, "position_mm": 0}}, "jsonrpc": "2.0", "method": "machine_query_command"}')
-        rpc_call_raw('{"params": {}, "jsonrpc": "2.0", "method": "execute_queue"}')
-        return "Move process", None 
-    except Exception as e:
-        return "There is something wrong with my MOVE commands.", str(e)
+    latency, error = Z_ZERO_MACRO.run(printer)
+    if error:
+        return "There is something wrong with my MOVE commands.", error
+    return f"Move process ({latency * 1000:.0f} ms)", None
 
 def action_menu_0():
-    return rpc_file_upload()
+    return rpc_file_upload(job=executor.current_job())
     
 def action_menu_1():
     return rpc_call_raw(JSON_menu_1)
@@ -572,39 +1505,41 @@ def action_menu_D():
     return z_zero() 
     
 def action_menu_E():
-    return move_z_up_001()
+    return move_z(-0.01)
     
 def action_menu_F():
-    return move_z_up_01()
+    return move_z(-0.1)
 
 def action_menu_G():
-    return move_z_up_1()
+    return move_z(-1)
     
 def action_menu_H():
-    return move_z_up_10()
+    return move_z(-10)
     
 def action_menu_I():
-    return  move_z_up_100()
+    return move_z(-100)
 
 def action_menu_J():
-    return  move_z_down_001()
+    return move_z(0.01)
 
 def action_menu_K():
-    return  move_z_down_01()
+    return move_z(0.1)
 
 def action_menu_L():
-    return  move_z_down_1()
+    return move_z(1)
     
 def action_menu_M():
-    return  move_z_down_10()
+    return move_z(10)
     
 def action_menu_N():
-    return  move_z_down_100()
+    return move_z(100)
 
 def action_menu_P():
     return print_rpc()
 
 def action_menu_x():
+    # A running upload (and everything queued) is stopped first, then the printer is told.
+    executor.cancel_all()
     return rpc_call_raw(JSON_menu_x)  
 
 def action_menu_enter():
@@ -612,80 +1547,399 @@ def action_menu_enter():
     
 def action_menu_space():
     global pause
+    paused = executor.toggle_pause()
+    if paused is not None:
+        # During an upload SPACE holds the upload, not the printer.
+        return ("Upload paused" if paused else "Upload resumed"), None
     pause = not pause
     if pause == True:
         return rpc_call_raw(JSON_menu_space_1) 
     else:
         return rpc_call_raw(JSON_menu_space_2)   
+
+MENU_LABELS = {
+    '0': "Upload And Print", '1': "Print Again", '2': "Preheat", '3': "Load Filament",
+    '4': "Unload Filament", '5': "Cool", '6': "Lower Build Plate", '7': "Park",
+    '8': "Heat Up To 280 °C", '9': "Attach Smart Extruder",
+    'A': "Home Z", 'B': "Home X/Y", 'C': "Move to X/Y/Z 0", 'D': "Zero Z",
+    'E': "Z -0.01 mm", 'F': "Z -0.1 mm", 'G': "Z -1 mm", 'H': "Z -10 mm", 'I': "Z -100 mm",
+    'J': "Z +0.01 mm", 'K': "Z +0.1 mm", 'L': "Z +1 mm", 'M': "Z +10 mm", 'N': "Z +100 mm",
+    '\x18': "Cancel", '\r': "OK", ' ': "Pause / Resume",
+}
+URGENT_KEYS = ('\x18', ' ')   # Never wait behind a running command
+
+# Actions related to the menu items
+MENU_ACTIONS = {
+    '0': action_menu_0,
+    '1': action_menu_1,
+    '2': action_menu_2,
+    '3': action_menu_3,
+    '4': action_menu_4,
+    '5': action_menu_5,
+    '6': action_menu_6,
+    '7': action_menu_7,
+    '8': action_menu_8,
+    '9': action_menu_9,
     
-def clear_screen():
-    try:
-        #print()
-        os.system('cls' if os.name == 'nt' else 'clear')
-    except Exception:
-        pass 
-
-def display_monitor(status: Dict[str, Any], feedback: str):
-    global custom_code
-    clear_screen()
+    'A': action_menu_A,
+    'B': action_menu_B,
+    'C': action_menu_C,
+    'D': action_menu_D,
     
+    'E': action_menu_E,
+    'F': action_menu_F,
+    'G': action_menu_G,
+    'H': action_menu_H,
+    'I': action_menu_I,
+    'J': action_menu_J,
+    'K': action_menu_K,
+    'L': action_menu_L,
+    'M': action_menu_M,
+    'N': action_menu_N,
+
+    '\x18': action_menu_x,
+    '\r': action_menu_enter,
+    ' ': action_menu_space,
+}
+
+# ==============================================================================
+#           COMMAND EXECUTOR
+# ==============================================================================
+# Menu actions run on a worker thread, so the monitor keeps drawing while an
+# upload or a macro waits for the printer. Commands run one after the other in
+# the order of the keys. Cancel and pause have their own thread: they are sent
+# at once and can stop or hold a running upload between two blocks.
+
+class Job:
+    _ids = itertools.count(1)
+
+    def __init__(self, key: str, name: str, action: Callable[[], Tuple[Optional[str], Optional[str]]]):
+        self.id = next(Job._ids)
+        self.key = key
+        self.name = name
+        self.action = action
+        self.result: Tuple[Optional[str], Optional[str]] = (None, None)
+        self.progress: Optional[int] = None      # Percent, for jobs that report it
+        self.detail = ""
+        self.started = 0.0
+        self.cancelled = threading.Event()
+        self.resumed = threading.Event()
+        self.resumed.set()
+        self.done = threading.Event()
+        self.on_change: Optional[Callable[['Job'], None]] = None
+
+    def report(self, progress: int, detail: str = ""):
+        # Only a new percent is published, a fast upload would redraw the screen for every block.
+        if progress != self.progress:
+            self.progress = progress
+            self.detail = detail
+            if self.on_change:
+                self.on_change(self)
+
+    def checkpoint(self) -> Optional[str]:
+        # Called between steps of a long job: holds while paused, returns an error once cancelled.
+        while not self.resumed.wait(0.1):
+            if self.cancelled.is_set():
+                break
+        return "Cancelled." if self.cancelled.is_set() else None
+
+    @property
+    def paused(self) -> bool:
+        return not self.resumed.is_set()
+
+    def summary(self) -> str:
+        text = self.name
+        if self.progress is not None:
+            text += f" {self.progress}%"
+        if self.detail:
+            text += f" ({self.detail})"
+        if self.paused:
+            text += " - paused, SPACE resumes"
+        return f"{text}, {time.time() - self.started:.0f} s"
+
+class CommandExecutor:
+
+    def __init__(self):
+        self.worker = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="command")
+        self.urgent = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="command-urgent")
+        self.running: Optional[Job] = None
+        self.queued: List[Tuple[Job, concurrent.futures.Future]] = []
+        self.on_change: Optional[Callable[[], None]] = None       # Running or queued jobs changed
+        self.on_finished: Optional[Callable[[Job], None]] = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def submit(self, key: str, action: Callable[[], Tuple[Optional[str], Optional[str]]]) -> Job:
+        job = Job(key, MENU_LABELS.get(key, key), action)
+        job.on_change = lambda job: self._changed()
+        if key in URGENT_KEYS:
+            self.urgent.submit(self._run, job, False)
+        else:
+            with self._lock:
+                self.queued.append((job, self.worker.submit(self._run, job, True)))
+            self._changed()
+        return job
+
+    def _run(self, job: Job, tracked: bool):
+        self._local.job = job
+        job.started = time.time()
+        if tracked:
+            with self._lock:
+                self.queued = [(queued, future) for queued, future in self.queued if queued is not job]
+                self.running = job
+            self._changed()
+        try:
+            job.result = job.action()
+        except Exception as e:
+            job.result = job.name, str(e)
+        finally:
+            self._local.job = None
+            if tracked:
+                with self._lock:
+                    self.running = None
+            job.done.set()
+            if self.on_finished:
+                self.on_finished(job)
+            self._changed()
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change()
+
+    def current_job(self) -> Optional[Job]:
+        # The job of the calling worker thread.
+        return getattr(self._local, "job", None)
+
+    def busy(self) -> bool:
+        return self.running is not None or bool(self.queued)
+
+    def cancel_all(self):
+        with self._lock:
+            queued, self.queued = self.queued, []
+            running = self.running
+        for job, future in queued:
+            if future.cancel():
+                job.result = job.name, "Cancelled."
+                job.done.set()
+        if running:
+            running.cancelled.set()
+            running.resumed.set()
+        self._changed()
+
+    def toggle_pause(self) -> Optional[bool]:
+        # Pauses or resumes the running job if it can be held (an upload); None otherwise.
+        job = self.running
+        if job is None or job.progress is None:
+            return None
+        if job.paused:
+            job.resumed.set()
+        else:
+            job.resumed.clear()
+        job.on_change(job)
+        return job.paused
+
+    def status_text(self) -> str:
+        with self._lock:
+            running, waiting = self.running, len(self.queued)
+        if not running and not waiting:
+            return ""
+        text = f"Running: {running.summary()}" if running else "Starting"
+        return text + (f", {waiting} queued" if waiting else "")
+
+    def shutdown(self):
+        self.cancel_all()
+        self.worker.shutdown(wait=False, cancel_futures=True)
+        self.urgent.shutdown(wait=False, cancel_futures=True)
+
+executor = CommandExecutor()
+    
+# ==============================================================================
+#           TERMINAL RENDERER
+# ==============================================================================
+# The monitor screens are built as a list of lines. Only the lines that differ
+# from the previous frame are rewritten, addressed with ANSI cursor moves, and
+# the whole update goes out in one write. Anything else printed in between
+# (responses, errors, the echo of the keyboard) moves the screen, so the next
+# frame after that is drawn in full.
+
+MONITOR_IDLE_TIMEOUT = 5.0         # Longest sleep of a monitor loop without any event
+MONITOR_MIN_FRAME_INTERVAL = 0.1   # Fleet screens collect the events of this long into one frame
+KEYBOARD_POLL_INTERVAL = 0.05      # Windows only, its console has no select()
+
+class _WatchedStream:
+    # sys.stdout stand-in that tells the renderer when someone else printed.
+
+    def __init__(self, stream, renderer: 'TerminalRenderer'):
+        self._stream = stream
+        self._renderer = renderer
+
+    def write(self, text: str) -> int:
+        if text:
+            self._renderer.dirty = True
+        return self._stream.write(text)
+
+    def __getattr__(self, name: str):
+        return getattr(self._stream, name)
+
+class TerminalRenderer:
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.previous: List[str] = []
+        self.dirty = True
+        self.frames = 0
+        self.full_frames = 0
+        self._ansi_enabled = False
+
+    def install(self):
+        if os.name == 'nt' and not self._ansi_enabled:
+            os.system('')   # Switches the Windows console to ANSI escape handling
+            self._ansi_enabled = True
+        if not isinstance(sys.stdout, _WatchedStream):
+            sys.stdout = _WatchedStream(self.stream, self)
+        self.dirty = True
+
+    def uninstall(self):
+        if isinstance(sys.stdout, _WatchedStream):
+            sys.stdout = self.stream
+
+    def invalidate(self):
+        self.dirty = True
+
+    def render(self, lines: List[str]) -> bool:
+        # Returns False when nothing had to be written.
+        if self.dirty:
+            parts = ["\033[H\033[2J", "\n".join(lines), "\n"]
+            self.full_frames += 1
+        else:
+            previous = self.previous
+            parts = [f"\033[{row};1H{line}\033[K"
+                     for row, line in enumerate(lines, 1)
+                     if row > len(previous) or previous[row - 1] != line]
+            if len(lines) < len(previous):
+                parts.append(f"\033[{len(lines) + 1};1H\033[J")
+            if not parts:
+                return False
+            parts.append(f"\033[{len(lines) + 1};1H")   # Cursor below the frame
+        self.stream.write("".join(parts))
+        self.stream.flush()
+        self.previous = list(lines)
+        self.dirty = False
+        self.frames += 1
+        return True
+
+renderer = TerminalRenderer()
+
+class WakeupPipe:
+    # Lets the select() on stdin also return on a status event.
+
+    def __init__(self):
+        self.fd, self._write_fd = os.pipe()
+        os.set_blocking(self.fd, False)
+        os.set_blocking(self._write_fd, False)
+
+    def wake(self):
+        try:
+            os.write(self._write_fd, b"\0")
+        except (BlockingIOError, OSError):
+            pass    # Full: the reader is awake anyway
+
+    def drain(self):
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def close(self):
+        os.close(self.fd)
+        os.close(self._write_fd)
+
+def monitor_timeout(conn: 'PrinterConnection', feedback_time: float) -> float:
+    # How long the monitor may sleep when no status event comes.
+    if conn.state != "online" or executor.busy():
+        return 1.0     # The link line counts the downtime, a running command its time
+    if feedback_time:
+        return max(0.0, feedback_time + FEEDBACK_DURATION - time.time()) + 0.05
+    return MONITOR_IDLE_TIMEOUT
+
+def monitor_lines(status: PrinterStatus, feedback: str, link: str = "", job: str = "",
+                  toolpath: str = "") -> List[str]:
     GREEN_CIRCLE = "\033[92m●\033[0m"  
     RED_CIRCLE = "\033[91m●\033[0m"  
-    heating_icon = GREEN_CIRCLE if status["preheating"] else RED_CIRCLE
-
-    print("=" * 50)
-    print(f"| MAKERBOT CONTROLLER AND MONITOR | {PRINTER_IP}")
-    print("=" * 50)
-    print(f"File name: {status['filename']}")
-    print(f"Process: {status['process']}")
-    print(f"Step: {status['step']}")
-    print(f"Progress: {status['progress']}")
-    print(f"Elapsed time: {status['elapsed_time']}")
-    print("-" * 50)
-    print(f"HEAT: {heating_icon}")
-    print(f"Extruder: {status['extruder_current']} / {status['extruder_target']} °C")
-    print(f"Chamber: {status['chamber_current']} / {status['chamber_target']} °C")
-    print("-"*22, "MENU", "-"*22)
-    print(f" 0 - Upload And Print")
-    print(f" 1 - Print Again")
-    print(f" 2 - Preheat to 180 °C")
-    print(f" 3 - Load Filament")
-    print(f" 4 - Unload Filament")
-    print(f" 5 - Cool")
-    print(f" 6 - Lower Build Plate")
-    print(f" 7 - Park")
-    print(f" 8 - Heat Up To 280 °C - Change the nozzle")
-    print(f" 9 - Attach Smart Extruder")
-    print("-" * 50)
-    print(f" A - Home Z")
-    print(f" B - Home X/Y")
-    print(f" C - Move to X=0mm/Y=0mm/Z=0mm")
-    print(f" D - Zero Z")
-    print("-" * 50)
-    print(f" E/F/G/H/I - Move to Z UP 0.01mm/0.1mm/1.0mm/10mm/100mm")
-    print(f" J/K/L/M/N - Move to Z DOWN 0.01mm/0.1mm/1.0mm/10mm/100mm")
-    print("-" * 50)
-    print(f" ENTER  - OK - print ready")
-    print(f" SPACE  - Pause / Resume")
-    print(f" CTRL+x - Cancel")
-    print("-" * 50)
-    print(f" ESC - Exit")
-    print("-" * 50)
+    heating_icon = GREEN_CIRCLE if status.preheating else RED_CIRCLE
+    text = status.formatted()
+
+    lines = [
+        "=" * 50,
+        f"| MAKERBOT CONTROLLER AND MONITOR | {PRINTER_IP}",
+        "=" * 50,
+        f"File name: {text['filename']}",
+        f"Process: {text['process']}",
+        f"Step: {text['step']}",
+        f"Progress: {text['progress']}",
+        f"Elapsed time: {text['elapsed_time']}",
+    ]
+    if toolpath:
+        lines.append(toolpath)
+    if link:
+        lines.append(f"Link: {link}")
+    if job:
+        lines.append(f"\033[96m{job}\033[0m")
+    lines += [
+        "-" * 50,
+        f"HEAT: {heating_icon}",
+        f"Extruder: {text['extruder_current']} / {text['extruder_target']} °C",
+        f"Chamber: {text['chamber_current']} / {text['chamber_target']} °C",
+        "-" * 22 + " MENU " + "-" * 22,
+        " 0 - Upload And Print",
+        " 1 - Print Again",
+        " 2 - Preheat to 180 °C",
+        " 3 - Load Filament",
+        " 4 - Unload Filament",
+        " 5 - Cool",
+        " 6 - Lower Build Plate",
+        " 7 - Park",
+        " 8 - Heat Up To 280 °C - Change the nozzle",
+        " 9 - Attach Smart Extruder",
+        "-" * 50,
+        " A - Home Z",
+        " B - Home X/Y",
+        " C - Move to X=0mm/Y=0mm/Z=0mm",
+        " D - Zero Z",
+        "-" * 50,
+        " E/F/G/H/I - Move to Z UP 0.01mm/0.1mm/1.0mm/10mm/100mm",
+        " J/K/L/M/N - Move to Z DOWN 0.01mm/0.1mm/1.0mm/10mm/100mm",
+        "-" * 50,
+        " ENTER  - OK - print ready",
+        " SPACE  - Pause / Resume",
+        " CTRL+x - Cancel",
+        "-" * 50,
+        " ESC - Exit",
+        "-" * 50,
+    ]
 
     if feedback:
-      
         if "ERROR" in feedback:
-            print(f"\n<<< ❌ LAST ACTION ERROR >>>")
-            print(f"\033[91m{feedback}\033[0m")
+            title, color = "<<< ❌ LAST ACTION ERROR >>>", "\033[91m"
         elif "WARNING" in feedback or "INFO" in feedback:
-            print(f"\n<<< ⓘ LAST OPERATION FEEDBACK >>>")
-            print(f"\033[93m{feedback}\033[0m")
+            title, color = "<<< ⓘ LAST OPERATION FEEDBACK >>>", "\033[93m"
         else:
-            print(f"\n<<< ✅ LAST ACTION SUCCESS >>>")
-            print(f"\033[92m{feedback}\033[0m")
-        print("<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<\n")
-    # -------------------------------
-    pass
+            title, color = "<<< ✅ LAST ACTION SUCCESS >>>", "\033[92m"
+        lines += ["", title]
+        lines += [f"{color}{line}\033[0m" for line in feedback.splitlines()]
+        lines += ["<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<", ""]
+    return lines
+
+def display_monitor(status: PrinterStatus, feedback: str, link: str = "", job: str = "",
+                    toolpath: str = "") -> bool:
+    profile = MakerBotProfile.active()
+    if not profile:
+        return renderer.render(monitor_lines(status, feedback, link, job, toolpath))
+    started = time.perf_counter_ns()
+    drawn = renderer.render(monitor_lines(status, feedback, link, job, toolpath))
+    profile.span("render", started)
+    return drawn
 
 def get_config():
     config = configparser.ConfigParser()
@@ -716,204 +1970,405 @@ def get_config():
         config.read(cfg_filename)
     return config['SETTINGS']
 
-def update_config_code(new_code, cfg_filename='makerbot.cfg'):
+def update_config_code(new_code, cfg_filename='makerbot.cfg', section='SETTINGS'):
     cfg_filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), cfg_filename)
     config = configparser.ConfigParser()
     config.read(cfg_filename)
     
-    if 'SETTINGS' not in config:
-        config.add_section('SETTINGS')
+    if section not in config:
+        config.add_section(section)
     
-    config.set('SETTINGS', 'LOCAL_CODE', new_code)
+    config.set(section, 'LOCAL_CODE', new_code)
     
     with open(cfg_filename, 'w', encoding='utf-8') as configfile:
         config.write(configfile)
     print("Local code successfully updated in config file.")
 
-def create_init_ssl_socket(ip, port):
-    raw_init_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    raw_init_socket.settimeout(120)
-    raw_init_socket.connect((ip, port))
- 
-    ssl_init_context = ssl.create_default_context()
-    ssl_init_context.check_hostname = False
-    ssl_init_context.verify_mode = ssl.CERT_NONE
-    
-    s = ssl_init_context.wrap_socket(raw_init_socket, server_hostname=ip)
-    
-    print(f"✅ **SSL/TLS connection is ready (Port: {port}).**")
-    return s
-
-def _process_response_chunk(chunk: str, expected_id: int, is_initial: bool = False) -> Tuple[Optional[Dict[str, Any]], Optional[str], bool]:
-    result = None
-    error = None
-    for line in chunk.split('\n'):
-        if line.strip():
-            try:
-                json_response = json.loads(line)
-                response_id = json_response.get('id')
-                
-                if response_id == expected_id:
-                    if 'error' in json_response:
-                        error = json_response['error'].get('message', 'Unknown error!')
-                    else:
-                        result = json_response.get('result')
-                    return result, error, True
-                    
-            except json.JSONDecodeError:
-                # This is not JSON.
-                pass
-    return result, error, False 
-    
-def perform_stable_auth(ssl_socket: socket.socket, request_id: int) -> Tuple[Optional[str], int]:
-    global USERNAME, LOCAL_CODE
-    if not ssl_socket:
-        return None, "The socket is not initialized."
-    rpc_data = json.loads('{"params": {"username":"' + USERNAME + '"}, "jsonrpc": "2.0", "method": "handshake", "id": 1}')
-    final_payload = json.dumps(rpc_data)
-    ssl_socket.sendall(final_payload.encode('utf-8'))
-    request_id += 1
-    chunk = ssl_socket.recv(4096).decode('utf-8')
-    if not chunk:
-        return None, "Connection closed before initial response."
-    result, error, found = _process_response_chunk(chunk, request_id, is_initial=True)
-        
-    if found:
-        return result, error
-    
-    if FIRSTRUN == True:
-        print("Push the button on the printer!")
-        rpc_data = json.loads('{"params": {"username":"' + USERNAME + '", "local_secret":""}, "jsonrpc": "2.0", "method": "authorize", "id": 2}')
-        final_payload = json.dumps(rpc_data)
-        ssl_socket.sendall(final_payload.encode('utf-8'))
-        request_id += 1
-        chunk = ssl_socket.recv(4096).decode('utf-8')
-        try:
-            response_data = json.loads(chunk)
-            if "result" in response_data:
-                result_content = response_data["result"]
-                if "local_code" in result_content:
-                    new_code = result_content["local_code"]
-                    print(f"Authentication successful!")
-                    update_config_code(new_code)
-                else:
-                    print("Error: The data received is not valid DATA.")
-            else:
-                print("Error: The data received is not valid RESULT.")
-        except json.JSONDecodeError:
-            print("Error: The data received is not valid JSON.")
-        time.sleep(1)
-    else:    
-        rpc_data = json.loads('{"params": {"username":"' + USERNAME + '", "local_secret":"", "local_code": "' + LOCAL_CODE + '"}, "jsonrpc": "2.0", "method": "reauthorize", "id": 2}')
-        final_payload = json.dumps(rpc_data)
-        ssl_socket.sendall(final_payload.encode('utf-8'))
-        request_id += 1
-        chunk = ssl_socket.recv(4096).decode('utf-8')
-        try:
-            response_data = json.loads(chunk)
-            if "error" in response_data:
-                print(f"Authentication failed. Please delete the makerbot.cfg file and restart the program.")
-                is_running.clear()
-                input()
-                sys.exit(1)
-            else:
-                print(f"Authentication successful!")
-                time.sleep(1)
-        except json.JSONDecodeError:
-            print("Error: The data received is not valid JSON.")
-            
-    if not chunk:
-        return None, "Connection closed before initial response."
-    result, error, found = _process_response_chunk(chunk, request_id, is_initial=True)
-        
-    if found:
-        return result, error      
-    return request_id
+# One client context for every connection: a TLS session can only be resumed
+# with the context that created it. The sessions live as long as the process
+# (the ssl module can not save them), so reconnects and the daemon and fleet
+# skip the full handshake; the local code in makerbot.cfg is what survives a restart.
+tls_sessions: Dict[Tuple[str, int], ssl.SSLSession] = {}
+
+# asyncio has no parameter for the session to resume, the context takes it
+# from here when the connection wraps its TLS object. Context variables
+# belong to the task, connections that connect at the same time keep theirs.
+tls_resume_session: contextvars.ContextVar = contextvars.ContextVar("tls_resume_session", default=None)
+
+class ResumingSSLContext(ssl.SSLContext):
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        if session is None:
+            session = tls_resume_session.get()
+        return super().wrap_bio(incoming, outgoing, server_side, server_hostname, session)
+
+@functools.lru_cache(maxsize=1)
+def client_ssl_context() -> ssl.SSLContext:
+    # The printer uses a self-signed certificate.
+    context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+def auth_commands(conn) -> List[RpcCommand]:
+    # handshake, then authorize (first run, the button has to be pushed) or reauthorize with the stored code.
+    commands = [RpcCommand("handshake", {"username": conn.username})]
+    if conn.first_run:
+        commands.append(RpcCommand("authorize", {"username": conn.username, "local_secret": ""}))
+    else:
+        commands.append(RpcCommand("reauthorize", {"username": conn.username, "local_secret": "", "local_code": conn.local_code}))
+    return commands
+
+def check_auth_reply(conn, method: str, result: Any, error: Optional[str]) -> Optional[str]:
+    # The same checks for both transports; a new local code is saved to makerbot.cfg.
+    if method == "handshake":
+        return f"Handshake failed: {error}" if error else None
+    if method == "reauthorize":
+        return "Authentication failed. Please delete the makerbot.cfg file and restart the program." if error else None
+    if error:
+        return f"Authorization failed: {error}"
+    if not isinstance(result, dict) or "local_code" not in result:
+        return "Error: The data received is not valid DATA."
+    conn.local_code = result["local_code"]
+    conn.first_run = False
+    update_config_code(conn.local_code, section=conn.cfg_section)
+    return None
+
+# ==============================================================================
+#                 FLEET
+# ==============================================================================
+# makerbot.cfg can hold any number of printers next to [SETTINGS]:
+#
+#   [PRINTER:method-1]
+#   PRINTER_IP = 192.168.1.21
+#   USERNAME = farm
+#   LOCAL_CODE = ...
+#
+# Every printer gets its own PrinterConnection, connected in parallel.
+
+FLEET_SECTION_PREFIX = "PRINTER:"
+
+class FleetManager:
+
+    def __init__(self, connections: List[PrinterConnection]):
+        self.connections = connections
+        self.by_name = {conn.name: conn for conn in connections}
+        self.changed = threading.Event()
+        self.starting: Optional[concurrent.futures.Future] = None
+        for conn in connections:
+            conn.status_watchers.append(self.changed.set)
+
+    @classmethod
+    def from_config(cls, config: configparser.ConfigParser) -> 'FleetManager':
+        connections = []
+        for section in config.sections():
+            if not section.startswith(FLEET_SECTION_PREFIX):
+                continue
+            settings = config[section]
+            conn = PrinterConnection(
+                section[len(FLEET_SECTION_PREFIX):],
+                settings.get('PRINTER_IP', ''),
+                settings.get('USERNAME', ''),
+                settings.get('LOCAL_CODE', ''),
+                settings.getint('PORT', fallback=PRINTER_PORT_SECURE),
+                cfg_section=section)
+            conn.first_run = not conn.local_code
+            conn.upload_window = settings.getint('UPLOAD_WINDOW', fallback=UPLOAD_WINDOW)
+            connections.append(conn)
+        return cls(connections)
+
+    def start(self):
+        # A slow or unreachable printer must not hold up the others: all of them
+        # connect at once on the event loop, a limited number of handshakes at a time.
+        self.starting = event_loop.submit(self.connect_all())
+
+    async def connect_all(self):
+        limit = asyncio.Semaphore(MAX_CONCURRENT_CONNECTS)
+
+        async def connect(conn: PrinterConnection):
+            async with limit:
+                await conn.connect_async()
+
+        await asyncio.gather(*(connect(conn) for conn in self.connections))
+
+    def stop(self):
+        if self.starting:
+            self.starting.cancel()
+        event_loop.run(self.close_all())
+
+    async def close_all(self):
+        await asyncio.gather(*(conn.close_async() for conn in self.connections))
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        snapshot = {}
+        for conn in self.connections:
+            snapshot[conn.name] = {
+                "status": conn.status_copy(),
+                "ip": conn.ip,
+                "state": conn.state,
+                "error": conn.last_error,
+                "reconnects": getattr(conn, "reconnects", 0),
+            }
+        return snapshot
+
+def fleet_lines(snapshot: Dict[str, Dict[str, Any]], footer: Optional[List[str]] = None) -> List[str]:
+    lines = [
+        "=" * 110,
+        f"| MAKERBOT FLEET MONITOR | {len(snapshot)} printers",
+        "=" * 110,
+        f"{'Printer':<16}{'IP':<16}{'State':<12}{'Process':<16}{'Step':<18}{'Progress':<10}{'Extruder':<12}{'Chamber':<10}",
+        "-" * 110,
+    ]
+    for name, entry in snapshot.items():
+        text = entry["status"].formatted()
+        extruder = f"{text['extruder_current']}/{text['extruder_target']}"
+        chamber = f"{text['chamber_current']}/{text['chamber_target']}"
+        state = entry['state'] + (f" ({entry['reconnects']})" if entry.get('reconnects') else "")
+        lines.append(f"{name[:15]:<16}{entry['ip'][:15]:<16}{state[:11]:<12}{text['process'][:15]:<16}"
+                     f"{text['step'][:17]:<18}{text['progress']:<10}{extruder:<12}{chamber:<10}")
+        if entry["error"]:
+            lines.append(f"\033[91m    {entry['error']}\033[0m")
+    if footer:
+        lines += ["-" * 110] + footer
+    lines += ["-" * 110, " CTRL+C - Exit"]
+    return lines
+
+def display_fleet(snapshot: Dict[str, Dict[str, Any]], footer: Optional[List[str]] = None) -> bool:
+    profile = MakerBotProfile.active()
+    if not profile:
+        return renderer.render(fleet_lines(snapshot, footer))
+    started = time.perf_counter_ns()
+    drawn = renderer.render(fleet_lines(snapshot, footer))
+    profile.span("render", started)
+    return drawn
+
+def read_fleet_config() -> configparser.ConfigParser:
+    config = configparser.ConfigParser()
+    config.read(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'makerbot.cfg'))
+    return config
+
+def run_fleet(telemetry: Optional['MakerBotTelemetry.TelemetryRecorder'] = None, job_files: Optional[List[str]] = None):
+    cfg_filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'makerbot.cfg')
+    config = read_fleet_config()
+    fleet = FleetManager.from_config(config)
+    if not fleet.connections:
+        print(f"No [{FLEET_SECTION_PREFIX}name] sections in {cfg_filename}.")
+        return
+    for conn in fleet.connections:
+        conn.telemetry = telemetry
+    MakerBotMetrics.registry.watch(fleet.connections)
+
+    scheduler = None
+    if job_files:
+        import MakerBotScheduler
+        scheduler = MakerBotScheduler.JobScheduler(fleet.connections, on_change=fleet.changed.set)
+        for path in job_files:
+            scheduler.submit(path)
+
+    print(f"[{time.strftime('%H:%M:%S')}] The MakerBot Remote Control program is starting (Fleet Mode, {len(fleet.connections)} printers).")
+    is_running.set()
+    fleet.start()
+    if scheduler:
+        scheduler.start()
+    renderer.install()
+    try:
+        while is_running.is_set():
+            fleet.changed.clear()
+            display_fleet(fleet.snapshot(), scheduler.lines() if scheduler else None)
+            fleet.changed.wait(MONITOR_IDLE_TIMEOUT)
+            time.sleep(MONITOR_MIN_FRAME_INTERVAL)
+    except KeyboardInterrupt:
+        print("\n\nTo exit (Ctrl+C). Close connections...")
+        is_running.clear()
+    finally:
+        renderer.uninstall()
+    if scheduler:
+        scheduler.stop()
+    fleet.stop()
+    print("Connections are closed. Bye!")
 
 # ==============================================================================
 #                 MAIN PROGRAM LOGIC
 # ==============================================================================
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="MakerBot controller and monitor")
+    parser.add_argument("--fleet", action="store_true", help="monitor every [PRINTER:name] in makerbot.cfg")
+    parser.add_argument("--async", dest="async_mode", action="store_true",
+                        help="kept for old command lines: every connection runs on one asyncio event loop now")
+    parser.add_argument("--jobs", nargs="+", metavar="FILE",
+                        help="with --fleet: print these .makerbot files, each on the printer that is idle first")
+    parser.add_argument("--broadcast", metavar="FILE",
+                        help="with --fleet: read FILE once, upload it to every printer at the same time and print it")
+    parser.add_argument("--no-print", action="store_true",
+                        help="with --broadcast: only upload, do not start the print")
+    parser.add_argument("--catalog", metavar="DIR",
+                        help="index the .makerbot files in DIR (print time, material, extruder, CRC); "
+                             "--jobs, --broadcast and the daemon then also take job names from it")
+    parser.add_argument("--list-jobs", action="store_true", help="with --catalog: list the jobs and exit")
+    parser.add_argument("--daemon", action="store_true",
+                        help="no menu: keep the session open and take commands over a local JSON API")
+    parser.add_argument("--api-port", type=int, default=DAEMON_PORT, metavar="PORT",
+                        help=f"port of the daemon API on 127.0.0.1 (default {DAEMON_PORT})")
+    parser.add_argument("--api-socket", metavar="PATH",
+                        help="serve the daemon API on this Unix socket instead of a port")
+    parser.add_argument("--telemetry", nargs="?", const=MakerBotTelemetry.TELEMETRY_PATH, metavar="FILE",
+                        help=f"record temperatures, progress and steps to an SQLite file (default {MakerBotTelemetry.TELEMETRY_PATH})")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve Prometheus metrics on http://0.0.0.0:PORT/metrics")
+    parser.add_argument("--profile", nargs="?", const="", metavar="TRACE.json",
+                        help="time decode, dispatch, status update and render; print the table at exit "
+                             "and write a Chrome trace if a file is given")
+    return parser.parse_args()
+
+def start_telemetry(path: Optional[str]) -> Optional['MakerBotTelemetry.TelemetryRecorder']:
+    if not path:
+        return None
+    telemetry = MakerBotTelemetry.TelemetryRecorder(path)
+    telemetry.start()
+    return telemetry
+
+def open_catalog(directory: Optional[str]) -> Optional['MakerBotCatalog.JobCatalog']:
+    if not directory:
+        return None
+    import MakerBotCatalog
+    catalog = MakerBotCatalog.JobCatalog(directory)
+    started = time.perf_counter()
+    added, changed, removed = catalog.scan()
+    print(f"Job catalog {catalog.directory}: {len(catalog.jobs())} jobs ({added} new, {changed} changed, "
+          f"{removed} removed, {(time.perf_counter() - started) * 1000:.0f} ms)")
+    return catalog
+
 def main():
-    global ssl_socket, global_request, access_token, last_action_feedback, last_feedback_time, PRINTER_IP, USERNAME, LOCAL_CODE
-    print(f"[{time.strftime('%H:%M:%S')}] The MakerBot Remote Control program is starting (Monitor Mode).")
-    
+    global job_catalog
+    args = parse_args()
+    job_catalog = open_catalog(args.catalog)
+    if args.list_jobs:
+        if not job_catalog:
+            print("ERROR: --list-jobs needs --catalog DIR.")
+            return
+        print("\n".join(job_catalog.lines()))
+        return
+    if args.jobs:
+        args.jobs = [resolve_job_path(name) for name in args.jobs]
+    if args.broadcast:
+        args.broadcast = resolve_job_path(args.broadcast)
+    if args.profile is not None:
+        MakerBotProfile.profiler.enable(trace=bool(args.profile))
+    telemetry = start_telemetry(args.telemetry)
+    MakerBotMetrics.registry.telemetry = telemetry
+    if args.metrics_port is not None:
+        MakerBotMetrics.start_metrics_server(args.metrics_port)
+    try:
+        if args.fleet:
+            if args.broadcast:
+                import MakerBotBroadcast
+                return MakerBotBroadcast.run_broadcast(args.broadcast, not args.no_print, telemetry)
+            return run_fleet(telemetry, args.jobs)
+        if args.daemon:
+            import MakerBotDaemon
+            return MakerBotDaemon.run_daemon(telemetry, args.api_port, args.api_socket)
+        return run_monitor(telemetry)
+    finally:
+        if telemetry:
+            telemetry.stop()
+        if args.profile is not None:
+            print(MakerBotProfile.profiler.report())
+            if args.profile:
+                MakerBotProfile.profiler.write_trace(args.profile)
+                print(f"Trace written to {args.profile}")
+
+def configure_printer(telemetry: Optional['MakerBotTelemetry.TelemetryRecorder'] = None):
+    # The default `printer` from [SETTINGS] in makerbot.cfg (asked for on the first run).
+    global PRINTER_IP, USERNAME, LOCAL_CODE, UPLOAD_WINDOW, UPLOAD_RESUME
     settings = get_config()
 
     PRINTER_IP = settings.get('PRINTER_IP')
     USERNAME = settings.get('USERNAME')
     LOCAL_CODE = settings.get('LOCAL_CODE')
+    UPLOAD_WINDOW = settings.getint('UPLOAD_WINDOW', fallback=UPLOAD_WINDOW)
+    UPLOAD_RESUME = settings.getboolean('UPLOAD_RESUME', fallback=UPLOAD_RESUME)
 
     
-    # 1. ESTABLISHING AN SSL/TLS CONNECTION
-    try:
-        ssl_socket = create_init_ssl_socket(PRINTER_IP, PRINTER_PORT_SECURE)
-    except Exception as e:
-        print(f"\n❌ **ERROR establishing connection: {e}. Check IP address.")
-        return
+    printer.ip = PRINTER_IP
+    printer.port = settings.getint('PORT', fallback=PRINTER_PORT_SECURE)
+    printer.username = USERNAME
+    printer.local_code = LOCAL_CODE
+    printer.first_run = FIRSTRUN
+    printer.upload_window = UPLOAD_WINDOW
+    printer.telemetry = telemetry
+    MakerBotMetrics.registry.watch([printer])
+
+def run_monitor(telemetry: Optional['MakerBotTelemetry.TelemetryRecorder'] = None):
+    global last_action_feedback, last_feedback_time
+
+    print(f"[{time.strftime('%H:%M:%S')}] The MakerBot Remote Control program is starting (Monitor Mode).")
+    configure_printer(telemetry)
 
+    # 1. ESTABLISHING AN SSL/TLS CONNECTION
     # 2. PERFORM AUTHENTICATION
-    next_id = perform_stable_auth(ssl_socket, global_request)
-    global_request = next_id 
-    
-    # 3. STARTING A LISTENER THREAD
+    # 3. STARTING THE LISTENER
+    error = printer.connect()
+    if error:
+        print(f"\n❌ **{error}")
+        if printer.state == "auth failed":
+            input()
+            sys.exit(1)
+        return
     is_running.set()
-    listener = ListenerThread(ssl_socket)
-    listener.start()
     
     # 4. MAIN MONITOR CYCLE AND INPUT MANAGEMENT
-    timeout_seconds = 1.0     
-    
-    # Actions related to the menu items
-    menu_actions = {
-        '0': action_menu_0,
-        '1': action_menu_1,
-        '2': action_menu_2,
-        '3': action_menu_3,
-        '4': action_menu_4,
-        '5': action_menu_5,
-        '6': action_menu_6,
-        '7': action_menu_7,
-        '8': action_menu_8,
-        '9': action_menu_9,
-        
-        'A': action_menu_A,
-        'B': action_menu_B,
-        'C': action_menu_C,
-        'D': action_menu_D,
-        
-        'E': action_menu_E,
-        'F': action_menu_F,
-        'G': action_menu_G,
-        'H': action_menu_H,
-        'I': action_menu_I,
-        'J': action_menu_J,
-        'K': action_menu_K,
-        'L': action_menu_L,
-        'M': action_menu_M,
-        'N': action_menu_N,
-
-        '\x18': action_menu_x,
-        '\r': action_menu_enter,
-        ' ': action_menu_space,
-    }
+    # The loop sleeps until a key, a status event or something on the screen
+    # that ages (feedback, downtime counter); an idle printer costs nothing.
+    wakeup = None if IS_WINDOWS else WakeupPipe()
+    if wakeup:
+        printer.status_watchers.append(wakeup.wake)
+
+    # Commands report back through the status events, which wake the loop.
+    def command_finished(job: Job):
+        global last_action_feedback, last_feedback_time
+        method_name, error_message = job.result
+        if error_message:
+            new_feedback = f"ERROR: RPC send failed. {error_message}"
+        elif method_name:
+            new_feedback = f"SUCCESS: The following command was sent to the printer: ({method_name})"
+        else:
+            return
+        with status_lock:
+            last_action_feedback = new_feedback
+            last_feedback_time = time.time()
+
+    menu_actions = MENU_ACTIONS
+    executor.on_finished = command_finished
+    executor.on_change = lambda: printer.publish_status({"command": executor.status_text()})
     
+    renderer.install()
     try:
         while is_running.is_set():
-            start_time = time.time()
             with status_lock:
+                version = printer.status_version
                 status_copy = printer_status.copy()
+                link = printer.link_summary()
+                job_text = executor.status_text()
+                toolpath = printer.toolpaths.get(status_copy.filename) if status_copy.filename else None
                 feedback_copy = last_action_feedback
                 if last_action_feedback and (time.time() - last_feedback_time) > FEEDBACK_DURATION:
                     last_action_feedback = ""
                     last_feedback_time = 0.0
                     feedback_copy = ""
                     
-            display_monitor(status_copy, feedback_copy)
+            toolpath_text = MakerBotToolpath.monitor_text(toolpath, status_copy.progress) if toolpath else ""
+            display_monitor(status_copy, feedback_copy, link, job_text, toolpath_text)
+            timeout_seconds = monitor_timeout(printer, last_feedback_time if feedback_copy else 0.0)
             
             user_input = None
             
             if IS_WINDOWS:
+                # No select() on the Windows console: the keyboard is polled while waiting for the status.
+                deadline = time.time() + timeout_seconds
+                while (not msvcrt.kbhit() and time.time() < deadline
+                       and printer.wait_status(version, KEYBOARD_POLL_INTERVAL) == version):
+                    pass
                 if msvcrt.kbhit():
                     char = msvcrt.getch()
                     try:
@@ -921,21 +2376,19 @@ def main():
                         if len(user_input) > 1: user_input = None 
                     except UnicodeDecodeError:
                         user_input = None
-
-                time_to_wait = timeout_seconds - (time.time() - start_time)
-                if time_to_wait > 0:
-                    time.sleep(time_to_wait)
                         
             else:
                 try:
-                    i, o, e = select.select([sys.stdin], [], [], timeout_seconds)
+                    i, o, e = select.select([sys.stdin, wakeup.fd], [], [], timeout_seconds)
                 except select.error:
                     continue 
                 except ValueError:
                     is_running.clear()
                     break
-                    
-                if i:
+
+                if wakeup.fd in i:
+                    wakeup.drain()
+                if sys.stdin in i:
                     try:
                         user_input = sys.stdin.readline().strip()
                     except EOFError:
@@ -943,50 +2396,33 @@ def main():
                         break
 
             if user_input:
+                # The key (and on Linux the Enter after it) was echoed over the frame.
+                renderer.invalidate()
                 if user_input == '\x1b':
                     print("\nTo request to exit. Close connection...")
                     is_running.clear()
                     break
                 
-                action_sleep_time = 0.5
-                new_feedback = ""
-                
                 if user_input in menu_actions:
-                    method_name, error_message = menu_actions[user_input]()
-                    
-                    if error_message:
-                        new_feedback = f"ERROR: RPC send failed. {error_message}"
-                        action_sleep_time = 2.0
-                    elif method_name:
-                        new_feedback = f"SUCCESS: The following command was sent to the printer: ({method_name})"
-
-                    with status_lock:
-                        last_action_feedback = new_feedback
-                        last_feedback_time = time.time()
-                        
-                    time.sleep(action_sleep_time) 
+                    # Runs in the background, the result arrives as feedback.
+                    executor.submit(user_input, menu_actions[user_input])
 
                 else:
                     with status_lock:
                         last_action_feedback = f"WARNING: Invalid selection: {user_input}."
                         last_feedback_time = time.time()
-                    time.sleep(0.5)
                 
             
     except KeyboardInterrupt:
         print("\n\nTo exit (Ctrl+C). Close connection...")
         is_running.clear()
+    finally:
+        renderer.uninstall()
+        executor.shutdown()
+        if wakeup:
+            printer.status_watchers.remove(wakeup.wake)
+            wakeup.close()
 
     print("Waiting for closing Listener.")
-    if listener.is_alive():
-        listener.join(2) 
-    
-    if ssl_socket:
-        ssl_socket.close()
-        print("Connection is closed. Bye!")
-
-
-if __name__ == '__main__':
-
-    main()
-
+    printer.close()
+    print("Connection is closed. Bye!")
@@ -0,0 +1,500 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zipfile
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import MakerBot
+import MakerBotToolpath
+from MakerBotFramer import JsonStreamFramer
+from MakerBotMock import MOCK_LOCAL_CODE
+
+# ==============================================================================
+#           TEST DATA
+# ==============================================================================
+
+def make_notification(i: int, padding: int = 0) -> Dict[str, Any]:
+    info = {
+        "current_process": {
+            "name": "PrintProcess",
+            "step": "printing",
+            "filename": "/current_thing/print.makerbot",
+            "progress": i % 100,
+            "elapsed_time": i,
+        },
+        "toolheads": {
+            "chamber": [{"current_temperature": 40 + i % 5, "target_temperature": 50, "preheating": False}],
+            "extruder": [{"current_temperature": 215 + i % 3, "target_temperature": 215, "preheating": False}],
+        },
+    }
+    if padding:
+        info["disk_info"] = "x" * padding
+    return {"params": {"info": info}, "jsonrpc": "2.0", "method": "system_notification"}
+
+def make_stream(count: int, padding: int = 0) -> bytes:
+    # The printer does not use Python's separators, so the stream is compact.
+    return b"".join(
+        json.dumps(make_notification(i, padding), separators=(",", ":")).encode("utf-8")
+        for i in range(count)
+    )
+
+class FakeSocket:
+    def __init__(self, data: bytes, chunk_size: int):
+        self.data = data
+        self.chunk_size = chunk_size
+        self.pos = 0
+
+    def recv(self, size: int) -> bytes:
+        if self.pos >= len(self.data):
+            raise socket.timeout()
+        size = min(size, self.chunk_size)
+        chunk = self.data[self.pos:self.pos + size]
+        self.pos += size
+        return chunk
+
+# ==============================================================================
+#           READERS
+# ==============================================================================
+
+class LegacyReader:
+    # The old read_json_response: re-decodes the whole buffer for every chunk
+    # and re-serializes the message to guess how much to drop.
+    def __init__(self):
+        self.buffer = b''
+
+    def read_json_response(self, socket_obj) -> dict | None:
+        while True:
+            try:
+                chunk = socket_obj.recv(4096)
+                if not chunk:
+                    return None
+                self.buffer += chunk
+                json_start = self.buffer.find(b'{')
+                if json_start == -1:
+                    continue
+                temp_data = self.buffer[json_start:].decode('utf-8')
+                try:
+                    response = json.loads(temp_data)
+                    json_size = len(json.dumps(response).encode('utf-8'))
+                    self.buffer = self.buffer[json_start + json_size:]
+                    return response
+                except json.JSONDecodeError:
+                    pass
+            except socket.timeout:
+                return None
+
+class FramerReader:
+    # What the listener does with every read: the framer, and the messages
+    # handed out one at a time.
+    def __init__(self):
+        self.framer = JsonStreamFramer()
+        self.messages = deque()
+
+    def read_json_response(self, socket_obj) -> dict | None:
+        if self.messages:
+            return self.messages.popleft()
+        while True:
+            try:
+                chunk = socket_obj.recv(MakerBot.RECV_BUFFER_SIZE)
+            except socket.timeout:
+                return None
+            self.messages.extend(self.framer.feed(chunk))
+            if self.messages:
+                return self.messages.popleft()
+
+def read_all(reader, sock) -> List[dict]:
+    messages = []
+    while True:
+        message = reader.read_json_response(sock)
+        if message is not None:
+            messages.append(message)
+        elif sock.pos >= len(sock.data):
+            return messages
+
+def run_reader(name: str, factory, data: bytes, chunk_size: int, expected: int) -> Dict[str, Any]:
+    reader = factory()
+    sock = FakeSocket(data, chunk_size)
+    start = time.perf_counter()
+    messages = read_all(reader, sock)
+    elapsed = time.perf_counter() - start
+    return {
+        "reader": name,
+        "chunk_size": chunk_size,
+        "messages": len(messages),
+        "expected": expected,
+        "seconds": elapsed,
+        "msgs_per_s": len(messages) / elapsed if elapsed else 0.0,
+        "mb_per_s": len(data) / elapsed / 1e6 if elapsed else 0.0,
+    }
+
+# ==============================================================================
+#           BENCHMARKS
+# ==============================================================================
+
+def bench_framing(args) -> List[Dict[str, Any]]:
+    results = []
+
+    # Back-to-back bursts: many notifications arrive in every read.
+    burst = make_stream(args.messages)
+    for chunk_size in (4096, 65536):
+        results.append(dict(run_reader("framer", FramerReader, burst, chunk_size, args.messages), case="burst"))
+    results.append(dict(run_reader("legacy", LegacyReader, burst, 4096, args.messages), case="burst"))
+
+    # One large notification at a time, split over many reads.
+    large_count = max(1, args.messages // 500)
+    large = make_stream(large_count, padding=args.large_kb * 1024)
+    results.append(dict(run_reader("framer", FramerReader, large, 4096, large_count), case="large"))
+    legacy_texts = [json.dumps(make_notification(i, args.large_kb * 1024)) for i in range(large_count)]
+    legacy_data = "".join(legacy_texts).encode("utf-8")
+    # Legacy only copes with one message per read, so feed it Python-spaced JSON one by one.
+    legacy_result = None
+    for text in legacy_texts:
+        r = run_reader("legacy", LegacyReader, text.encode("utf-8"), 4096, 1)
+        if legacy_result is None:
+            legacy_result = r
+        else:
+            legacy_result["messages"] += r["messages"]
+            legacy_result["seconds"] += r["seconds"]
+    legacy_result["expected"] = large_count
+    legacy_result["msgs_per_s"] = legacy_result["messages"] / legacy_result["seconds"]
+    legacy_result["mb_per_s"] = len(legacy_data) / legacy_result["seconds"] / 1e6
+    results.append(dict(legacy_result, case="large"))
+    return results
+
+def bench_status(args) -> List[Dict[str, Any]]:
+    # Notification -> status dictionary, what the listener does for every message.
+    conn = MakerBot.PrinterConnection("bench")
+    messages = [make_notification(i) for i in range(args.messages)]
+    start = time.perf_counter()
+    for message in messages:
+        params = MakerBot.notification_status_params(message)
+        if params is not None:
+            conn.update_status(params)
+    elapsed = time.perf_counter() - start
+    return [{"case": "status", "messages": len(messages), "seconds": elapsed,
+             "msgs_per_s": len(messages) / elapsed if elapsed else 0.0}]
+
+# ==============================================================================
+#           MOCK PRINTER BENCHMARKS
+# ==============================================================================
+# The mock runs in its own process, so the CPU time and memory measured here
+# belong to the client only.
+
+MOCK_READY = re.compile(r"listening on [^:]+: ([0-9, ]+)")
+
+@contextlib.contextmanager
+def quiet():
+    # The client prints every request and the upload progress.
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+class MockProcess:
+
+    def __init__(self, *mock_args: str):
+        self.mock_args = [str(a) for a in mock_args]
+        self.process = None
+        self.ports: List[int] = []
+
+    def __enter__(self) -> 'MockProcess':
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "MakerBotMock.py")
+        self.process = subprocess.Popen([sys.executable, "-u", script, "--port", "0", *self.mock_args],
+                                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        output = []
+        for line in self.process.stdout:
+            output.append(line)
+            match = MOCK_READY.search(line)
+            if match:
+                self.ports = [int(p) for p in match.group(1).split(",")]
+                break
+        if not self.ports:
+            self.process.wait()
+            raise RuntimeError("The mock printer did not start: " + "".join(output).strip())
+        # Keep reading its statistics lines so the pipe never fills up.
+        threading.Thread(target=self.process.stdout.read, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.wait(5)
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def percentile(values: List[float], p: int) -> float:
+    return statistics.quantiles(values, n=100, method="inclusive")[p - 1] if len(values) > 1 else values[0]
+
+def mock_connection(port: int, name: str = "bench") -> MakerBot.PrinterConnection:
+    conn = MakerBot.PrinterConnection(name, "127.0.0.1", "bench", MOCK_LOCAL_CODE, port)
+    with quiet():
+        error = conn.connect()
+    if error:
+        raise RuntimeError(f"Could not connect to the mock printer: {error}")
+    return conn
+
+def upload_once(conn: MakerBot.PrinterConnection, path: str, block_size: int) -> MakerBot.UploadPipeline:
+    # put_init, pipelined put_raw and put_term, like rpc_file_upload without the manifest.
+    file_size = os.path.getsize(path)
+    init_params = {"length": file_size, "block_size": block_size,
+                   "file_path": "/current_thing/bench.makerbot", "file_id": MakerBot.RPC_FILE_ID}
+    result, error, latency = conn.rpc_call_wait({"params": init_params, "jsonrpc": "2.0", "method": "put_init"})
+    if error:
+        raise RuntimeError(f"put_init failed: {error}")
+    pipeline = MakerBot.UploadPipeline(conn, file_size, conn.upload_window)
+    with open(path, "rb") as f:
+        error = pipeline.run(MakerBot.read_file_blocks(f, block_size))
+    if error:
+        raise RuntimeError(f"put_raw failed: {error}")
+    term_params = {"crc": pipeline.crc, "length": file_size, "file_id": MakerBot.RPC_FILE_ID}
+    result, error, latency = conn.rpc_call_wait({"params": term_params, "jsonrpc": "2.0", "method": "put_term"})
+    if error:
+        raise RuntimeError(f"put_term failed: {error}")
+    return pipeline
+
+def bench_upload(args) -> List[Dict[str, Any]]:
+    results = []
+    with MockProcess("--notify-hz", 1, "--latency", args.latency_ms) as mock, \
+            tempfile.TemporaryDirectory() as tmp:
+        conn = mock_connection(mock.ports[0])
+        try:
+            for size_mb in args.upload_mb:
+                path = os.path.join(tmp, f"upload_{size_mb}.bin")
+                with open(path, "wb") as f:
+                    f.write(os.urandom(int(size_mb * 1024 * 1024)))
+                for block_kb in args.block_kb:
+                    with quiet():
+                        pipeline = upload_once(conn, path, block_kb * 1024)
+                    results.append({"case": "upload", "file_mb": size_mb, "block_kb": block_kb,
+                                    "window": pipeline.max_window, "backoffs": pipeline.backoffs,
+                                    "seconds": pipeline.elapsed, "mb_per_s": pipeline.mb_per_s})
+        finally:
+            with quiet():
+                conn.close()
+    return results
+
+def bench_rtt(args) -> List[Dict[str, Any]]:
+    results = []
+    with MockProcess("--notify-hz", 1, "--latency", args.latency_ms) as mock:
+        conn = mock_connection(mock.ports[0])
+        try:
+            cases = (
+                ("command", lambda: conn.rpc_call_wait(MakerBot.JSON_menu_5)[2]),
+                ("macro", lambda: MakerBot.PARK_MACRO.run(conn)[0]),
+            )
+            for case, call in cases:
+                latencies = []
+                with quiet():
+                    for _ in range(args.round_trips):
+                        latency = call()
+                        if latency is not None:
+                            latencies.append(latency * 1000)
+                results.append({"case": case, "calls": len(latencies),
+                                "p50_ms": percentile(latencies, 50), "p99_ms": percentile(latencies, 99),
+                                "max_ms": max(latencies)})
+        finally:
+            with quiet():
+                conn.close()
+    return results
+
+def measure_cpu(seconds: float) -> float:
+    start = time.process_time()
+    time.sleep(seconds)
+    return time.process_time() - start
+
+def bench_fleet(args) -> List[Dict[str, Any]]:
+    # Client CPU for N printers that only send status notifications.
+    results = []
+    with MockProcess("--notify-hz", args.notify_hz) as mock:
+        port = mock.ports[0]
+
+        fleet = MakerBot.FleetManager([MakerBot.PrinterConnection(f"bench-{i}", "127.0.0.1", "bench", MOCK_LOCAL_CODE, port)
+                                       for i in range(args.printers)])
+        try:
+            with quiet():
+                MakerBot.event_loop.run(fleet.connect_all(), 120)
+                online = sum(conn.state == "online" for conn in fleet.connections)
+                cpu = measure_cpu(args.fleet_seconds)
+        finally:
+            with quiet():
+                fleet.stop()
+        results.append({"case": "event loop", "printers": online, "notify_hz": args.notify_hz,
+                        "cpu_per_printer_pct": cpu / args.fleet_seconds / max(1, online) * 100})
+    return results
+
+# ==============================================================================
+#           TOOLPATH ANALYSIS
+# ==============================================================================
+
+def make_toolpath_file(path: str, layers: int, moves_per_layer: int) -> int:
+    # A .makerbot with a synthetic toolpath, written as a stream. Returns the toolpath size.
+    size = 0
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("meta.json", json.dumps({"duration_s": 0, "materials": ["pla"]}))
+        with archive.open("print.jsontoolpath", "w") as member:
+            def write(text: str):
+                nonlocal size
+                data = text.encode("utf-8")
+                member.write(data)
+                size += len(data)
+            write("[\n")
+            a = 0.0
+            for layer in range(layers):
+                z = 0.2 * (layer + 1)
+                write(json.dumps({"command": {"function": "comment", "parameters": {"comment": f"Layer Section {layer}"},
+                                              "metadata": {}, "tags": []}}) + ",\n")
+                for i in range(moves_per_layer):
+                    a += 0.05
+                    command = {"command": {"function": "move",
+                                           "parameters": {"x": (i % 100) * 0.5, "y": (i // 100) * 0.5, "z": z,
+                                                          "a": round(a, 5), "feedrate": 40.0},
+                                           "metadata": {"relative": {"x": False, "y": False, "z": False, "a": False}},
+                                           "tags": ["Infill"]}}
+                    write(json.dumps(command) + ",\n")
+            write(json.dumps({"command": {"function": "comment", "parameters": {"comment": "End"},
+                                          "metadata": {}, "tags": []}}) + "\n]\n")
+    return size
+
+def load_and_analyze(path: str) -> MakerBotToolpath.ToolpathStats:
+    # The whole toolpath in memory at once, what the streaming analyzer avoids.
+    with zipfile.ZipFile(path) as archive:
+        commands = json.loads(archive.read("print.jsontoolpath"))
+    analyzer = MakerBotToolpath.ToolpathAnalyzer()
+    for command in commands:
+        analyzer.command(command)
+    return analyzer.finish()
+
+def traced_peak_mb(function, *args) -> float:
+    # Run separately from the timing: tracemalloc slows allocation-heavy code several times.
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+def bench_toolpath(args) -> List[Dict[str, Any]]:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.makerbot")
+        toolpath_size = make_toolpath_file(path, args.toolpath_layers, args.toolpath_moves)
+        cases = [("stream", MakerBotToolpath.analyze_toolpath)]
+        if toolpath_size <= args.toolpath_load_limit_mb * 1e6:
+            cases.append(("load", load_and_analyze))
+        for case, analyze in cases:
+            start = time.perf_counter()
+            stats = analyze(path)
+            elapsed = time.perf_counter() - start
+            results.append({"case": case, "toolpath_mb": toolpath_size / 1e6, "file_mb": os.path.getsize(path) / 1e6,
+                            "commands": stats.commands, "layers": stats.layers, "seconds": elapsed,
+                            "mb_per_s": toolpath_size / elapsed / 1e6, "peak_mb": traced_peak_mb(analyze, path)})
+    return results
+
+# ==============================================================================
+#           OUTPUT
+# ==============================================================================
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_results(title: str, results: List[Dict[str, Any]]):
+    print("=" * 78)
+    print(f"| {title}")
+    print("=" * 78)
+    for r in results:
+        print(f"{r['case']:<6} {r['reader']:<7} chunk={r['chunk_size']:<6} "
+              f"{r['messages']:>7}/{r['expected']:<7} msgs "
+              f"{r['msgs_per_s']:>12,.0f} msg/s {r['mb_per_s']:>8.2f} MB/s")
+
+def print_table(title: str, results: List[Dict[str, Any]]):
+    print("=" * 78)
+    print(f"| {title}")
+    print("=" * 78)
+    for r in results:
+        print("  ".join(f"{k}={v:,.2f}" if isinstance(v, float) else f"{k}={v}" for k, v in r.items()))
+
+SECTIONS = ("framing", "status", "toolpath", "upload", "rtt", "fleet")
+
+def main():
+    parser = argparse.ArgumentParser(description="MakerBot controller benchmarks")
+    parser.add_argument("--only", default=",".join(SECTIONS), help="comma separated: " + ", ".join(SECTIONS))
+    parser.add_argument("--messages", type=int, default=20000, help="notifications per burst")
+    parser.add_argument("--large-kb", type=int, default=256, help="size of a large notification")
+    parser.add_argument("--upload-mb", type=float, nargs="+", default=[1, 8, 32], help="upload file sizes")
+    parser.add_argument("--block-kb", type=int, nargs="+", default=[32, 128, 512], help="upload block sizes")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="mock printer reply delay")
+    parser.add_argument("--round-trips", type=int, default=1000, help="calls per latency case")
+    parser.add_argument("--printers", type=int, default=20, help="connections in the fleet case")
+    parser.add_argument("--notify-hz", type=float, default=10.0, help="notifications per printer per second")
+    parser.add_argument("--fleet-seconds", type=float, default=5.0, help="fleet measurement time")
+    parser.add_argument("--toolpath-layers", type=int, default=200, help="layers of the synthetic toolpath")
+    parser.add_argument("--toolpath-moves", type=int, default=1000, help="moves per layer of the synthetic toolpath")
+    parser.add_argument("--toolpath-load-limit-mb", type=float, default=100,
+                        help="compare with loading the whole toolpath only up to this size")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+    sections = [s.strip() for s in args.only.split(",") if s.strip()]
+
+    report: Dict[str, Any] = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "args": vars(args),
+    }
+    if "framing" in sections:
+        report["framing"] = bench_framing(args)
+        print_results("JSON framing", report["framing"])
+    if "status" in sections:
+        report["status"] = bench_status(args)
+        print_table("Status update", report["status"])
+    if "toolpath" in sections:
+        report["toolpath"] = bench_toolpath(args)
+        print_table("Toolpath analysis", report["toolpath"])
+    mock_benchmarks = (("upload", "Upload throughput (mock printer)", bench_upload),
+                       ("rtt", "Round trip (mock printer)", bench_rtt),
+                       ("fleet", "Fleet CPU (mock printer)", bench_fleet))
+    for name, title, bench in mock_benchmarks:
+        if name not in sections:
+            continue
+        try:
+            report[name] = bench(args)
+        except RuntimeError as e:
+            print(f"{title}: skipped, {e}")
+            report[name] = {"error": str(e)}
+            continue
+        print_table(title, report[name])
+    report["peak_rss_mb"] = peak_rss_mb()
+    if report["peak_rss_mb"] is not None:
+        print(f"Peak RSS: {report['peak_rss_mb']:.1f} MB")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+        print(f"Results written to {args.json}")
+
+if __name__ == '__main__':
+    main()
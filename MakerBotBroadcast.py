@@ -0,0 +1,129 @@
+import concurrent.futures
+import os
+import threading
+import time
+from typing import Optional, List
+
+import MakerBot
+import MakerBotMetrics
+from MakerBot import PrinterConnection, SharedFile, Job
+
+# ==============================================================================
+#           BROADCAST UPLOAD
+# ==============================================================================
+# The same job to many printers: the file is read and checksummed once into a
+# SharedFile, then every printer gets its own thread with its own
+# put_init/put_raw/put_term sequence and its own window of blocks in flight.
+# A slow printer only slows its own thread; the shared blocks are read-only,
+# so nothing waits for it. Resume and "already on the printer" work per
+# printer as in a normal upload.
+
+class BroadcastTarget:
+
+    def __init__(self, conn: PrinterConnection):
+        self.conn = conn
+        self.job = Job('0', f"Upload to {conn.name}", None)
+        self.result = ""
+        self.error: Optional[str] = None
+        self.bytes = 0
+        self.seconds = 0.0
+
+    @property
+    def mb_per_s(self) -> float:
+        return self.bytes / self.seconds / 1e6 if self.seconds else 0.0
+
+class BroadcastUpload:
+
+    def __init__(self, connections: List[PrinterConnection], local_path: str,
+                 remote_path: str = MakerBot.RPC_FILE_PATH, start_print: bool = True):
+        self.targets = [BroadcastTarget(conn) for conn in connections]
+        self.local_path = local_path
+        self.remote_path = remote_path
+        self.start_print = start_print
+        self.elapsed = 0.0
+        self.read_seconds = 0.0
+        self.file_size = 0
+
+    def run(self, connect: bool = False) -> List[BroadcastTarget]:
+        started = time.perf_counter()
+        with SharedFile(self.local_path) as source:
+            self.read_seconds = time.perf_counter() - started
+            self.file_size = source.size
+            print(f"{os.path.basename(source.path)}: {source.size} byte, CRC {source.crc:08x}, "
+                  f"read in {self.read_seconds * 1000:.0f} ms, to {len(self.targets)} printers")
+            with concurrent.futures.ThreadPoolExecutor(max(1, len(self.targets)), thread_name_prefix="broadcast") as pool:
+                for target in self.targets:
+                    pool.submit(self.upload, target, source, connect)
+        self.elapsed = time.perf_counter() - started
+        return self.targets
+
+    def upload(self, target: BroadcastTarget, source: SharedFile, connect: bool):
+        conn = target.conn
+        try:
+            if connect and conn.state != "online":
+                target.error = conn.connect()
+                if target.error:
+                    return
+            bytes_before = conn.metrics.upload_bytes
+            started = time.perf_counter()
+            target.result, target.error = MakerBot.rpc_file_upload(
+                conn, source.path, self.remote_path, job=target.job, start_print=self.start_print, source=source)
+            target.seconds = time.perf_counter() - started
+            target.bytes = conn.metrics.upload_bytes - bytes_before
+        except Exception as e:
+            target.error = f"ERROR: {e}"
+        finally:
+            outcome = target.error or target.result
+            print(f"\n[{time.strftime('%H:%M:%S')}] {conn.name}: {outcome}")
+
+    def cancel(self):
+        for target in self.targets:
+            target.job.cancelled.set()
+            target.job.resumed.set()
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(target.bytes for target in self.targets)
+
+    def report(self) -> str:
+        lines = [f"{'Printer':<16}{'Result':<12}{'Sent MB':>10}{'Seconds':>10}{'MB/s':>8}"]
+        for target in self.targets:
+            result = "failed" if target.error else ("skipped" if not target.bytes else "ok")
+            lines.append(f"{target.conn.name[:15]:<16}{result:<12}{target.bytes / 1e6:>10.2f}"
+                         f"{target.seconds:>10.2f}{target.mb_per_s:>8.2f}")
+            if target.error:
+                lines.append(f"    {target.error}")
+        aggregate = self.total_bytes / self.elapsed / 1e6 if self.elapsed else 0.0
+        ok = sum(1 for target in self.targets if not target.error)
+        lines.append(f"{ok}/{len(self.targets)} printers, {self.total_bytes / 1e6:.2f} MB in {self.elapsed:.2f} s, "
+                     f"{aggregate:.2f} MB/s together (file read once in {self.read_seconds * 1000:.0f} ms)")
+        return "\n".join(lines)
+
+def run_broadcast(local_path: str, start_print: bool = True, telemetry=None):
+    fleet = MakerBot.FleetManager.from_config(MakerBot.read_fleet_config())
+    if not fleet.connections:
+        print(f"No [{MakerBot.FLEET_SECTION_PREFIX}name] sections in makerbot.cfg.")
+        return
+    if not os.path.isfile(local_path):
+        print(f"ERROR: Local file not found: {local_path}")
+        return
+    for conn in fleet.connections:
+        conn.telemetry = telemetry
+    MakerBotMetrics.registry.watch(fleet.connections)
+
+    print(f"[{time.strftime('%H:%M:%S')}] The MakerBot Remote Control program is starting (Broadcast, {len(fleet.connections)} printers).")
+    MakerBot.is_running.set()
+    broadcast = BroadcastUpload(fleet.connections, local_path, start_print=start_print)
+    worker = threading.Thread(target=broadcast.run, args=(True,), name="broadcast", daemon=True)
+    worker.start()
+    try:
+        while worker.is_alive():
+            worker.join(0.5)
+    except KeyboardInterrupt:
+        print("\n\nTo exit (Ctrl+C). Stopping the uploads...")
+        broadcast.cancel()
+        worker.join()
+    finally:
+        MakerBot.is_running.clear()
+        fleet.stop()
+    print(broadcast.report())
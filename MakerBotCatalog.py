@@ -0,0 +1,169 @@
+import concurrent.futures
+import json
+import os
+import threading
+import time
+import zipfile
+from typing import Dict, Any, Optional, List, Tuple
+
+# ==============================================================================
+#           JOB CATALOG
+# ==============================================================================
+# The .makerbot files of a jobs directory, with what is needed to choose and
+# send one: estimated print time, material, extruder and CRC32. A .makerbot
+# file is a zip; only its central directory and meta.json are read, the
+# toolpath is never unpacked. The CRC is not computed here: the first upload
+# works it out while sending and records it, so later sends of the unchanged
+# file skip the CRC pass. The index is kept in a JSON file next to the
+# script and keyed by path; a rescan only stats the files and reads again the
+# ones whose mtime or size changed, so a directory of thousands of jobs is
+# listed at once.
+
+CATALOG_INDEX_PATH = "job_catalog.json"
+CATALOG_EXTENSION = ".makerbot"
+CATALOG_META_NAME = "meta.json"
+CATALOG_WORKERS = 4           # Files read at the same time in a rescan
+
+def _first(meta: Dict[str, Any], *keys: str) -> Any:
+    # The first of the keys that is set; lists (one entry per extruder) give their first item.
+    for key in keys:
+        value = meta.get(key)
+        if isinstance(value, list):
+            value = value[0] if value else None
+        if value not in (None, ""):
+            return value
+    return None
+
+def read_job_metadata(path: str) -> Dict[str, Any]:
+    # meta.json of a .makerbot file; the names differ between printer generations.
+    with zipfile.ZipFile(path) as archive:
+        names = archive.namelist()
+        meta = json.loads(archive.read(CATALOG_META_NAME)) if CATALOG_META_NAME in names else {}
+    duration = _first(meta, "duration_s", "duration")
+    return {
+        "duration": float(duration) if isinstance(duration, (int, float)) else None,
+        "material": _first(meta, "materials", "material"),
+        "extruder": _first(meta, "tool_types", "tool_type", "extruder_types", "extruder_type", "bot_type"),
+        "thumbnails": [name for name in names if name.lower().endswith(".png")],
+    }
+
+class JobCatalog:
+
+    def __init__(self, directory: str, index_path: str = CATALOG_INDEX_PATH):
+        self.directory = os.path.abspath(directory)
+        self.path = os.path.join(os.path.dirname(os.path.abspath(__file__)), index_path)
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.last_scan = 0.0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def _files(self) -> Dict[str, Tuple[int, float]]:
+        # path -> (size, mtime) of every .makerbot under the directory; scandir has the stat already.
+        found = {}
+        pending = [self.directory]
+        while pending:
+            try:
+                with os.scandir(pending.pop()) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.name.lower().endswith(CATALOG_EXTENSION) and entry.is_file():
+                            file_stat = entry.stat()
+                            found[entry.path] = (file_stat.st_size, file_stat.st_mtime)
+            except OSError:
+                continue
+        return found
+
+    @staticmethod
+    def _read(path: str, size: int, mtime: float) -> Dict[str, Any]:
+        entry = {"size": size, "mtime": mtime, "crc": None, "error": None}     # crc: set by the first upload
+        try:
+            entry.update(read_job_metadata(path))
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+            entry["error"] = f"{type(e).__name__}: {e}"
+        return entry
+
+    def scan(self) -> Tuple[int, int, int]:
+        # Brings the index up to date with the directory. Returns (added, changed, removed).
+        files = self._files()
+        with self.lock:
+            known = dict(self.entries)
+        removed = [path for path in known if path.startswith(self.directory + os.sep) and path not in files]
+        stale = [(path, size, mtime) for path, (size, mtime) in files.items()
+                 if path not in known or known[path]["size"] != size or known[path]["mtime"] != mtime]
+        fresh = {}
+        if stale:
+            with concurrent.futures.ThreadPoolExecutor(CATALOG_WORKERS, thread_name_prefix="catalog") as pool:
+                for (path, size, mtime), entry in zip(stale, pool.map(lambda item: self._read(*item), stale)):
+                    fresh[path] = entry
+        added = sum(1 for path in fresh if path not in known)
+        with self.lock:
+            for path in removed:
+                self.entries.pop(path, None)
+            self.entries.update(fresh)
+            self.last_scan = time.time()
+        if fresh or removed:
+            self.save()
+        return added, len(fresh) - added, len(removed)
+
+    def save(self):
+        with self.lock:
+            data = json.dumps(self.entries, indent=1)
+        temp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Warning: could not save the job catalog: {e}")
+
+    def jobs(self) -> List[Tuple[str, Dict[str, Any]]]:
+        # The jobs of this directory, by name.
+        prefix = self.directory + os.sep
+        with self.lock:
+            items = [(path, dict(entry)) for path, entry in self.entries.items() if path.startswith(prefix)]
+        return sorted(items, key=lambda item: os.path.relpath(item[0], self.directory).lower())
+
+    def find(self, name: str) -> Optional[str]:
+        # A job by its path, its path in the directory, or its file name.
+        for candidate in (name, os.path.join(self.directory, name)):
+            path = os.path.abspath(candidate)
+            with self.lock:
+                if path in self.entries:
+                    return path
+        matches = [path for path, entry in self.jobs() if os.path.basename(path) == name]
+        return matches[0] if len(matches) == 1 else None
+
+    def known_crc(self, local_path: str, size: int, mtime: float) -> Optional[int]:
+        with self.lock:
+            entry = self.entries.get(local_path)
+            if entry and entry["size"] == size and entry["mtime"] == mtime:
+                return entry["crc"]
+        return None
+
+    def remember_crc(self, local_path: str, size: int, mtime: float, crc: int):
+        # Called after an upload of a cataloged file, which computed the CRC anyway.
+        with self.lock:
+            entry = self.entries.get(local_path)
+            if not entry or entry["size"] != size or entry["mtime"] != mtime or entry["crc"] == crc:
+                return
+            entry["crc"] = crc
+        self.save()
+
+    def lines(self) -> List[str]:
+        lines = [f"{'Job':<40}{'Size MB':>9}{'Time':>9}  {'Material':<14}{'Extruder':<14}{'CRC':<8}"]
+        for path, entry in self.jobs():
+            name = os.path.relpath(path, self.directory)
+            if entry.get("error"):
+                lines.append(f"{name[:39]:<40}{entry['size'] / 1e6:>9.2f}  {entry['error']}")
+                continue
+            duration = entry.get("duration")
+            time_text = f"{int(duration // 3600)}:{int(duration % 3600 // 60):02d}" if duration else "-"
+            crc = f"{entry['crc']:08x}" if entry.get("crc") is not None else "-"
+            lines.append(f"{name[:39]:<40}{entry['size'] / 1e6:>9.2f}{time_text:>9}  "
+                         f"{str(entry.get('material') or '-')[:13]:<14}{str(entry.get('extruder') or '-')[:13]:<14}{crc:<8}")
+        return lines
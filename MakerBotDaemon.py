@@ -0,0 +1,231 @@
+import json
+import os
+import random
+import signal
+import socketserver
+import stat
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional, Tuple
+
+import MakerBot
+from MakerBot import executor, printer, Job
+
+# ==============================================================================
+#           DAEMON
+# ==============================================================================
+# Headless mode: one authenticated session and listener stay up, and the menu
+# actions are driven over a local JSON API instead of the keyboard. Commands
+# go through the same executor as the monitor, so they are queued in order
+# and cancel/pause preempt a running upload. Every job reuses the warm
+# session; no TLS connect or handshake per job.
+#
+#   GET  /status                   printer status, link and the running command
+#   POST /actions/<name>           {"file": "...", "wait": true, "timeout": 600}
+#   GET  /jobs/<id>                state and result of a submitted action
+#   GET  /catalog                  the jobs of --catalog DIR (rescanned first)
+#
+# It listens on 127.0.0.1 only, or on a Unix socket that only the owner can use.
+
+DAEMON_PORT = MakerBot.DAEMON_PORT
+DAEMON_HOST = "127.0.0.1"
+DAEMON_JOB_HISTORY = 200      # Finished jobs kept for GET /jobs/<id>
+DAEMON_WAIT_TIMEOUT = 3600.0  # Longest "wait" a request may ask for
+
+ACTIONS = {
+    "upload_and_print": '0',
+    "print_again": '1',
+    "preheat": '2',
+    "load_filament": '3',
+    "unload_filament": '4',
+    "cool": '5',
+    "lower_build_plate": '6',
+    "park": '7',
+    "change_nozzle": '8',
+    "attach_extruder": '9',
+    "home_z": 'A',
+    "home_xy": 'B',
+    "move_home": 'C',
+    "zero_z": 'D',
+    "ok": '\r',
+    "pause": ' ',          # Toggles, like SPACE: the running upload if there is one, else the print
+    "cancel": '\x18',
+}
+
+jobs: 'OrderedDict[int, Job]' = OrderedDict()
+jobs_lock = threading.Lock()
+
+def job_state(job: Job) -> Dict[str, Any]:
+    if job.done.is_set():
+        state = "done"
+    elif executor.running is job or job.started:
+        state = "running"
+    else:
+        state = "queued"
+    method_name, error = job.result
+    return {
+        "id": job.id,
+        "action": job.name,
+        "state": state,
+        "progress": job.progress,
+        "detail": job.detail,
+        "result": method_name if state == "done" else None,
+        "error": error,
+    }
+
+def daemon_status() -> Dict[str, Any]:
+    with MakerBot.status_lock:
+        status = printer.status.as_dict()
+        link = printer.link_summary()
+    return {
+        "printer": printer.ip,
+        "state": printer.state,
+        "link": link,
+        "status": status,
+        "command": executor.status_text(),
+        "actions": sorted(ACTIONS),
+    }
+
+def catalog_listing() -> Tuple[int, Dict[str, Any]]:
+    catalog = MakerBot.job_catalog
+    if catalog is None:
+        return 404, {"error": "No job catalog, start the daemon with --catalog DIR."}
+    added, changed, removed = catalog.scan()
+    jobs_list = [dict(entry, path=path, name=os.path.relpath(path, catalog.directory)) for path, entry in catalog.jobs()]
+    return 200, {"directory": catalog.directory, "added": added, "changed": changed, "removed": removed, "jobs": jobs_list}
+
+def submit_action(name: str, params: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+    key = ACTIONS.get(name)
+    if key is None:
+        return 404, {"error": f"Unknown action: {name}", "actions": sorted(ACTIONS)}
+    try:
+        timeout = min(float(params.get("timeout", DAEMON_WAIT_TIMEOUT)), DAEMON_WAIT_TIMEOUT)
+    except (TypeError, ValueError):
+        return 400, {"error": f"timeout is not a number: {params.get('timeout')!r}"}
+    action = MakerBot.MENU_ACTIONS[key]
+    if key == '0' and (params.get("file") or params.get("job")):
+        local_path = MakerBot.resolve_job_path(str(params.get("job") or params["file"]))
+        if not os.path.isfile(local_path):
+            return 400, {"error": f"File not found: {local_path}"}
+        action = lambda: MakerBot.rpc_file_upload(local_path=os.path.abspath(local_path), job=executor.current_job())
+    job = executor.submit(key, action)
+    with jobs_lock:
+        jobs[job.id] = job
+        while len(jobs) > DAEMON_JOB_HISTORY:
+            jobs.popitem(last=False)
+    if params.get("wait"):
+        job.done.wait(timeout)
+    return (202 if not job.done.is_set() else 200), job_state(job)
+
+class DaemonHandler(BaseHTTPRequestHandler):
+
+    def send_json(self, code: int, body: Dict[str, Any]):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = self.path.split('?')[0].rstrip('/')
+        if path == "/status":
+            return self.send_json(200, daemon_status())
+        if path == "/catalog":
+            return self.send_json(*catalog_listing())
+        if path.startswith("/jobs/"):
+            try:
+                job_id = int(path[len("/jobs/"):])
+            except ValueError:
+                return self.send_json(400, {"error": "The job id is a number."})
+            with jobs_lock:
+                job = jobs.get(job_id)
+            if job is None:
+                return self.send_json(404, {"error": f"Unknown job: {job_id}"})
+            return self.send_json(200, job_state(job))
+        self.send_json(404, {"error": f"Unknown path: {path}"})
+
+    def do_POST(self):
+        path = self.path.split('?')[0].rstrip('/')
+        if not path.startswith("/actions/"):
+            return self.send_json(404, {"error": f"Unknown path: {path}"})
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            params = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(params, dict):
+                raise ValueError("the body is not a JSON object")
+        except ValueError as e:
+            return self.send_json(400, {"error": f"Invalid JSON: {e}"})
+        code, body = submit_action(path[len("/actions/"):], params)
+        self.send_json(code, body)
+
+    def log_message(self, format, *args):
+        pass
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def start_api_server(port: int = DAEMON_PORT, socket_path: Optional[str] = None) -> socketserver.BaseServer:
+    if socket_path:
+        if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            os.remove(socket_path)    # Left over from a daemon that did not stop cleanly
+        # Created owner-only; a chmod after the bind would leave it open for a moment.
+        old_umask = os.umask(0o177)
+        try:
+            server = UnixHTTPServer(socket_path, DaemonHandler)
+        finally:
+            os.umask(old_umask)
+        where = socket_path
+    else:
+        server = ThreadingHTTPServer((DAEMON_HOST, port), DaemonHandler)
+        server.daemon_threads = True
+        where = f"http://{DAEMON_HOST}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, name="daemon-api", daemon=True).start()
+    print(f"[{time.strftime('%H:%M:%S')}] Control API on {where}")
+    return server
+
+def log_finished(job: Job):
+    method_name, error = job.result
+    outcome = f"ERROR: {error}" if error else f"OK ({method_name})"
+    print(f"[{time.strftime('%H:%M:%S')}] Job {job.id} {job.name}: {outcome}")
+
+def run_daemon(telemetry=None, port: int = DAEMON_PORT, socket_path: Optional[str] = None):
+    print(f"[{time.strftime('%H:%M:%S')}] The MakerBot Remote Control program is starting (Daemon Mode).")
+    MakerBot.configure_printer(telemetry)
+    MakerBot.is_running.set()
+    signal.signal(signal.SIGTERM, lambda signum, frame: MakerBot.is_running.clear())
+
+    # Without a session there is nothing to serve; keep trying like a reconnect does.
+    delay = MakerBot.RECONNECT_MIN_DELAY
+    while MakerBot.is_running.is_set():
+        error = printer.connect()
+        if not error:
+            break
+        print(f"\n❌ **{error}")
+        if printer.state == "auth failed":
+            return
+        time.sleep(delay * random.uniform(0.8, 1.2))
+        delay = min(delay * 2, MakerBot.RECONNECT_MAX_DELAY)
+    if not MakerBot.is_running.is_set():
+        printer.close()      # Stopped (SIGTERM) before the printer answered: no API to serve
+        print("Connection is closed. Bye!")
+        return
+
+    executor.on_finished = log_finished
+    server = start_api_server(port, socket_path)
+    try:
+        while MakerBot.is_running.is_set():
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        print("\n\nTo exit (Ctrl+C). Close connection...")
+    finally:
+        MakerBot.is_running.clear()
+        server.shutdown()
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+        executor.shutdown()
+        printer.close()
+    print("Connection is closed. Bye!")
@@ -0,0 +1,147 @@
+import json
+import re
+from typing import Any, Optional, List
+
+# ==============================================================================
+#           JSON STREAM FRAMING
+# ==============================================================================
+# The printer sends its JSON-RPC messages back to back on the TLS stream, with
+# no length prefix or separator. Complete messages are cut out of each read by
+# raw_decode in one pass. A message split over several reads is tracked by a
+# bracket-depth scanner with a cursor, so its bytes are looked at only once and
+# it is parsed exactly once when the last piece arrives. Consumed bytes are only
+# dropped from the buffer when it runs out of complete messages.
+
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024   # A message larger than this is dropped
+
+class JsonStreamFramer:
+    _START = re.compile(rb'[{\[]')
+    _TEXT_START = re.compile(r'[{\[]')
+    _TOKEN = re.compile(rb'[{}\[\]"]')
+    _STRING_TOKEN = re.compile(rb'["\\]')
+
+    def __init__(self, max_message_size: int = MAX_MESSAGE_SIZE):
+        self.buffer = bytearray()
+        self.max_message_size = max_message_size
+        self.parse_errors = 0
+        self._decoder = json.JSONDecoder()
+        self._pos = 0          # Scan cursor in the buffer
+        self._start = -1       # Start of the message being scanned, -1 between messages
+        self._depth = 0
+        self._in_string = False
+
+    def append(self, data: bytes):
+        self.buffer += data
+
+    def feed(self, data: bytes) -> List[Any]:
+        self.buffer += data
+        messages = []
+        while True:
+            if self._start < 0:
+                self._decode_complete(messages)
+            message = self.next_message()
+            if message is None:
+                return messages
+            messages.append(message)
+
+    def _decode_complete(self, messages: List[Any]):
+        # Fast path: every complete message in the buffer is parsed in C.
+        # It stops at the first message that is cut off (or broken) and leaves
+        # that one to the scanner.
+        text = self.buffer[self._pos:].decode('utf-8', 'surrogateescape')
+        raw_decode = self._decoder.raw_decode
+        find_start = self._TEXT_START.search
+        index = 0
+        consumed = len(text)
+        while True:
+            match = find_start(text, index)
+            if match is None:
+                break
+            try:
+                message, index = raw_decode(text, match.start())
+            except ValueError:
+                consumed = match.start()
+                break
+            messages.append(message)
+
+        if consumed == len(text):
+            self._pos = len(self.buffer)
+        else:
+            self._pos += len(text[:consumed].encode('utf-8', 'surrogateescape'))
+
+    def next_message(self) -> Optional[Any]:
+        buf = self.buffer
+        end = len(buf)
+        pos = self._pos
+
+        while pos < end:
+            if self._start < 0:
+                match = self._START.search(buf, pos)
+                if match is None:
+                    pos = end
+                    break
+                self._start = match.start()
+                self._depth = 1
+                pos = match.end()
+                continue
+
+            if self._in_string:
+                match = self._STRING_TOKEN.search(buf, pos)
+                if match is None:
+                    pos = end
+                    break
+                if buf[match.start()] == 0x5C:   # backslash: skip the escaped byte
+                    if match.end() >= end:
+                        pos = match.start()
+                        break
+                    pos = match.end() + 1
+                    continue
+                self._in_string = False
+                pos = match.end()
+                continue
+
+            match = self._TOKEN.search(buf, pos)
+            if match is None:
+                pos = end
+                break
+            pos = match.end()
+            char = buf[match.start()]
+            if char == 0x22:       # "
+                self._in_string = True
+            elif char == 0x7B or char == 0x5B:   # { [
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    raw = bytes(buf[self._start:pos])
+                    self._start = -1
+                    self._pos = pos
+                    try:
+                        return json.loads(raw)
+                    except ValueError:
+                        self.parse_errors += 1
+
+        self._pos = pos
+        if self._start < 0:
+            self._compact(pos)
+        elif pos - self._start > self.max_message_size:
+            self.parse_errors += 1
+            self._start = -1
+            self._in_string = False
+            self._compact(pos)
+        elif self._start > 0:
+            self._compact(self._start)
+        return None
+
+    def take_bytes(self, size: int) -> bytes:
+        # Raw payload that follows a message (put_raw). Only valid between messages.
+        data = bytes(self.buffer[self._pos:self._pos + size])
+        self._pos += len(data)
+        return data
+
+    def _compact(self, upto: int):
+        if upto:
+            del self.buffer[:upto]
+            self._pos -= upto
+            if self._start >= 0:
+                self._start -= upto
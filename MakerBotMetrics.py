@@ -0,0 +1,186 @@
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional, List, Tuple
+
+# ==============================================================================
+#           METRICS
+# ==============================================================================
+# Counters and histograms of the controller itself (notifications, parse
+# errors, RPC latency, uploads, reconnects, listener lag) and the printer
+# temperatures, served as Prometheus text on http://host:port/metrics.
+# Every connection has its own ConnectionMetrics, written only by its listener
+# (or the event loop), so recording is a plain increment without a lock. The
+# text is put together when a scrape comes in.
+
+METRICS_HOST = ""                     # All interfaces, the farm is scraped from another machine
+RPC_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LISTENER_LAG_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+class Histogram:
+    # Cumulative buckets are computed on export, observe() only counts one slot.
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # The last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def exposition(self, name: str, labels: str) -> List[str]:
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {total}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {total + self.counts[-1]}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+class ConnectionMetrics:
+
+    def __init__(self):
+        self.notifications = 0
+        self.parse_errors = 0           # Of the framers already replaced; the current one is added on export
+        self.rpc_latency = Histogram(RPC_LATENCY_BUCKETS)
+        self.listener_lag = Histogram(LISTENER_LAG_BUCKETS)
+        self.uploads = 0
+        self.upload_bytes = 0
+        self.upload_seconds = 0.0
+        self.upload_mb_per_s = 0.0      # Of the last upload
+
+    def upload(self, byte_count: int, seconds: float):
+        self.uploads += 1
+        self.upload_bytes += byte_count
+        self.upload_seconds += seconds
+        self.upload_mb_per_s = byte_count / seconds / 1e6 if seconds else 0.0
+
+# --- EXPORT -------------------------------------------------------------------
+
+METRIC_HELP = {
+    "makerbot_up": ("gauge", "1 if the connection to the printer is online."),
+    "makerbot_notifications_total": ("counter", "Status notifications received."),
+    "makerbot_parse_errors_total": ("counter", "Malformed or oversized messages dropped by the JSON framer."),
+    "makerbot_pending_requests": ("gauge", "JSON-RPC requests waiting for a reply."),
+    "makerbot_rpc_latency_seconds": ("histogram", "Time from sending a JSON-RPC request to its reply."),
+    "makerbot_listener_lag_seconds": ("histogram", "Time from receiving data to finishing handling a message from it."),
+    "makerbot_uploads_total": ("counter", "File uploads finished or interrupted."),
+    "makerbot_upload_bytes_total": ("counter", "Bytes uploaded and acknowledged."),
+    "makerbot_upload_seconds_total": ("counter", "Time spent uploading."),
+    "makerbot_upload_last_mb_per_second": ("gauge", "Throughput of the last upload."),
+    "makerbot_connect_seconds": ("gauge", "Duration of the stages of the last connect (tcp, tls, auth, total)."),
+    "makerbot_tls_session_resumed": ("gauge", "1 if the last connect resumed a TLS session."),
+    "makerbot_disconnects_total": ("counter", "Connections lost."),
+    "makerbot_reconnects_total": ("counter", "Successful reconnects."),
+    "makerbot_downtime_seconds_total": ("counter", "Time spent reconnecting."),
+    "makerbot_extruder_temperature_celsius": ("gauge", "Extruder temperature."),
+    "makerbot_chamber_temperature_celsius": ("gauge", "Chamber temperature."),
+    "makerbot_print_progress_percent": ("gauge", "Progress of the current print."),
+    "makerbot_telemetry_rows_written_total": ("counter", "Telemetry rows written to the file."),
+    "makerbot_telemetry_rows_dropped_total": ("counter", "Telemetry rows dropped because the file did not keep up."),
+}
+
+def _label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def current_parse_errors(conn) -> int:
+    # The framer of the current session counts its own, the earlier sessions are in the metrics.
+    return conn.metrics.parse_errors + conn.framer.parse_errors
+
+def connection_samples(conn) -> Dict[str, List[str]]:
+    metrics: ConnectionMetrics = conn.metrics
+    labels = f'printer="{_label(conn.name)}"'
+    samples = {
+        "makerbot_up": [f'makerbot_up{{{labels}}} {1 if conn.state == "online" else 0}'],
+        "makerbot_notifications_total": [f'makerbot_notifications_total{{{labels}}} {metrics.notifications}'],
+        "makerbot_parse_errors_total": [f'makerbot_parse_errors_total{{{labels}}} {current_parse_errors(conn)}'],
+        "makerbot_pending_requests": [f'makerbot_pending_requests{{{labels}}} {len(conn.pending)}'],
+        "makerbot_rpc_latency_seconds": metrics.rpc_latency.exposition("makerbot_rpc_latency_seconds", labels),
+        "makerbot_listener_lag_seconds": metrics.listener_lag.exposition("makerbot_listener_lag_seconds", labels),
+        "makerbot_uploads_total": [f'makerbot_uploads_total{{{labels}}} {metrics.uploads}'],
+        "makerbot_upload_bytes_total": [f'makerbot_upload_bytes_total{{{labels}}} {metrics.upload_bytes}'],
+        "makerbot_upload_seconds_total": [f'makerbot_upload_seconds_total{{{labels}}} {metrics.upload_seconds}'],
+        "makerbot_upload_last_mb_per_second": [f'makerbot_upload_last_mb_per_second{{{labels}}} {metrics.upload_mb_per_s}'],
+        "makerbot_disconnects_total": [f'makerbot_disconnects_total{{{labels}}} {conn.disconnects}'],
+        "makerbot_reconnects_total": [f'makerbot_reconnects_total{{{labels}}} {conn.reconnects}'],
+        "makerbot_downtime_seconds_total": [f'makerbot_downtime_seconds_total{{{labels}}} {conn.downtime}'],
+    }
+    timings = dict(conn.connect_timings)
+    if timings:
+        samples["makerbot_tls_session_resumed"] = [f'makerbot_tls_session_resumed{{{labels}}} {int(timings.pop("resumed", 0))}']
+        samples["makerbot_connect_seconds"] = [f'makerbot_connect_seconds{{{labels},stage="{stage}"}} {seconds}'
+                                               for stage, seconds in timings.items()]
+    status = conn.status_copy()
+    for metric, current, target in (("makerbot_extruder_temperature_celsius", status.extruder_current, status.extruder_target),
+                                    ("makerbot_chamber_temperature_celsius", status.chamber_current, status.chamber_target)):
+        lines = samples[metric] = []
+        for kind, value in (("current", current), ("target", target)):
+            if isinstance(value, (int, float)):
+                lines.append(f'{metric}{{{labels},kind="{kind}"}} {value}')
+    if isinstance(status.progress, (int, float)):
+        samples["makerbot_print_progress_percent"] = [f'makerbot_print_progress_percent{{{labels}}} {status.progress}']
+    return samples
+
+class MetricsRegistry:
+    # What the endpoint exports: the connections of the monitor or the fleet, and the telemetry recorder.
+
+    def __init__(self):
+        self.connections: List[Any] = []
+        self.telemetry = None
+
+    def watch(self, connections: List[Any]):
+        self.connections = list(connections)
+
+    def exposition(self) -> str:
+        samples: Dict[str, List[str]] = {}
+        for conn in self.connections:
+            for metric, lines in connection_samples(conn).items():
+                samples.setdefault(metric, []).extend(lines)
+        if self.telemetry:
+            samples["makerbot_telemetry_rows_written_total"] = [f'makerbot_telemetry_rows_written_total {self.telemetry.rows_written}']
+            samples["makerbot_telemetry_rows_dropped_total"] = [f'makerbot_telemetry_rows_dropped_total {self.telemetry.rows_dropped}']
+        out = []
+        for metric, (kind, help_text) in METRIC_HELP.items():
+            if metric not in samples:
+                continue
+            out.append(f"# HELP {metric} {help_text}")
+            out.append(f"# TYPE {metric} {kind}")
+            out.extend(samples[metric])
+        return "\n".join(out) + "\n"
+
+registry = MetricsRegistry()
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.exposition().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Request lines would be written over the monitor screen.
+        pass
+
+def start_metrics_server(port: int, host: str = METRICS_HOST) -> Optional[ThreadingHTTPServer]:
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        print(f"ERROR: The metrics endpoint can not listen on port {port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"Metrics on http://{host or '0.0.0.0'}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,506 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from typing import Dict, Any, Optional, List
+
+from MakerBot import PRINTER_PORT_SECURE, RECV_BUFFER_SIZE
+from MakerBotFramer import JsonStreamFramer
+
+# ==============================================================================
+#           MOCK PRINTER
+# ==============================================================================
+# A local stand-in for the printer's JSON-RPC port: TLS with a self-signed
+# certificate, the authentication calls, file upload, print, the queue
+# methods and a system_notification stream. Latency, notification rate,
+# write coalescing and faults can be set, so the listener, the uploader and
+# the fleet mode can be tried (and benchmarked) without a printer.
+
+MOCK_LOCAL_CODE = "mock-local-code"
+CERT_DIR = os.path.join(tempfile.gettempdir(), "makerbot-mock")
+
+# Methods that only need an acknowledgement
+ACK_METHODS = {
+    "clear_queue", "close_queue", "open_queue", "execute_queue", "machine_query_command",
+    "machine_action_command", "home", "print_again", "preheat", "load_filament", "unload_filament",
+    "cool", "park", "load_print_tool", "cancel", "process_method",
+}
+
+class MockSettings:
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, notify_hz: float = 2.0,
+                 notify_padding: int = 0, coalesce: int = 1, coalesce_delay: float = 0.005,
+                 split: int = 0, drop_rate: float = 0.0, error_rate: float = 0.0,
+                 garbage_rate: float = 0.0, disconnect_after: int = 0, auth_delay: float = 0.0,
+                 strict_auth: bool = False, print_seconds: float = 60.0, verbose: bool = False):
+        self.latency = latency                    # Seconds before every reply
+        self.jitter = jitter                      # Extra random 0..jitter seconds (replies may reorder)
+        self.notify_hz = notify_hz                # system_notification per second, 0 = none
+        self.notify_padding = notify_padding      # Extra bytes in every notification
+        self.coalesce = coalesce                  # Messages collected into one write
+        self.coalesce_delay = coalesce_delay      # Longest wait for a full batch
+        self.split = split                        # Cut writes into random pieces of at most this size
+        self.drop_rate = drop_rate                # Requests that never get a reply
+        self.error_rate = error_rate              # Requests answered with a JSON-RPC error
+        self.garbage_rate = garbage_rate          # Notifications replaced by broken JSON
+        self.disconnect_after = disconnect_after  # Close the connection after this many requests
+        self.auth_delay = auth_delay              # "Button press" time for authorize
+        self.strict_auth = strict_auth            # Reject reauthorize with an unknown code
+        self.print_seconds = print_seconds        # Length of a simulated print
+        self.verbose = verbose
+
+class MockStats:
+
+    def __init__(self):
+        self.connections = 0
+        self.active = 0
+        self.requests = 0
+        self.replies = 0
+        self.notifications = 0
+        self.bytes_in = 0
+        self.bytes_uploaded = 0
+        self.uploads = 0
+        self.crc_errors = 0
+        self.faults = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return dict(vars(self))
+
+class MockSession:
+    # One client connection.
+
+    def __init__(self, server: 'MockPrinter', reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.server = server
+        self.settings = server.settings
+        self.stats = server.stats
+        self.reader = reader
+        self.writer = writer
+        self.loop = asyncio.get_running_loop()
+        self.framer = JsonStreamFramer()
+        self.authorized = False
+        self.closed = False
+        self.requests = 0
+        self.outbox: List[bytes] = []
+        self.flush_handle = None
+        self.notifier = None
+        self.notification_count = 0
+        # Upload
+        self.raw_remaining = 0
+        self.pending_raw: Optional[Dict[str, Any]] = None
+        self.upload: Optional[Dict[str, Any]] = None
+        # Print
+        self.process: Optional[Dict[str, Any]] = None
+        self.print_started = 0.0
+
+    # --- Output ---------------------------------------------------------------
+
+    def send(self, message: Dict[str, Any]):
+        self.send_bytes(json.dumps(message).encode('utf-8'))
+
+    def send_bytes(self, data: bytes):
+        if self.closed:
+            return
+        if self.settings.coalesce <= 1:
+            self.write(data)
+            return
+        self.outbox.append(data)
+        if len(self.outbox) >= self.settings.coalesce:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = self.loop.call_later(self.settings.coalesce_delay, self.flush)
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if self.outbox:
+            data = b"".join(self.outbox)
+            self.outbox.clear()
+            self.write(data)
+
+    def write(self, data: bytes):
+        if self.closed or self.writer.is_closing():
+            return
+        if self.settings.split <= 0:
+            self.writer.write(data)
+            return
+        # Every write is its own TLS record, so the client sees the message in pieces.
+        pos = 0
+        while pos < len(data):
+            size = random.randint(1, self.settings.split)
+            self.writer.write(data[pos:pos + size])
+            pos += size
+
+    def reply(self, request: Dict[str, Any], result: Any = None, error: Optional[str] = None):
+        request_id = request.get("id")
+        if request_id is None:
+            return
+        if error is None and random.random() < self.settings.error_rate:
+            self.stats.faults += 1
+            error = "Injected fault"
+        if error is not None:
+            message = {"jsonrpc": "2.0", "id": request_id, "error": {"code": -32000, "message": error}}
+        else:
+            message = {"jsonrpc": "2.0", "id": request_id, "result": {} if result is None else result}
+        self.stats.replies += 1
+        delay = self.settings.latency + (random.uniform(0, self.settings.jitter) if self.settings.jitter else 0.0)
+        if delay > 0:
+            self.loop.call_later(delay, self.send, message)
+        else:
+            self.send(message)
+
+    # --- Requests -------------------------------------------------------------
+
+    async def serve(self):
+        self.stats.connections += 1
+        self.stats.active += 1
+        try:
+            while not self.closed:
+                data = await self.reader.read(RECV_BUFFER_SIZE)
+                if not data:
+                    break
+                self.stats.bytes_in += len(data)
+                self.framer.append(data)
+                await self.process_buffer()
+        except (ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            self.close()
+            self.stats.active -= 1
+
+    async def process_buffer(self):
+        while not self.closed:
+            if self.raw_remaining:
+                chunk = self.framer.take_bytes(self.raw_remaining)
+                if not chunk:
+                    return
+                self.receive_raw(chunk)
+                if self.raw_remaining:
+                    return
+                continue
+            request = self.framer.next_message()
+            if request is None:
+                return
+            if isinstance(request, dict):
+                await self.handle(request)
+
+    async def handle(self, request: Dict[str, Any]):
+        self.stats.requests += 1
+        self.requests += 1
+        method = request.get("method", "")
+        params = request.get("params") or {}
+        if self.settings.verbose:
+            print(f"{self.server.port} <- {method} {request.get('id')}")
+
+        if self.settings.disconnect_after and self.requests > self.settings.disconnect_after:
+            self.stats.faults += 1
+            self.close()
+            return
+
+        if method == "put_raw":
+            # The raw bytes follow the request whatever happens to the reply.
+            self.raw_remaining = int(params[1])
+            self.pending_raw = request
+            return
+
+        if random.random() < self.settings.drop_rate:
+            self.stats.faults += 1
+            return
+
+        if method == "handshake":
+            self.reply(request, {"machine_type": "mock", "machine_name": f"mock-{self.server.port}",
+                                 "api_version": "1.0.0"})
+        elif method == "authorize":
+            if self.settings.auth_delay:
+                await asyncio.sleep(self.settings.auth_delay)
+            self.reply(request, {"local_code": MOCK_LOCAL_CODE})
+            self.start_notifications()
+        elif method == "reauthorize":
+            if self.settings.strict_auth and params.get("local_code") != MOCK_LOCAL_CODE:
+                self.reply(request, error="Unknown local code")
+                return
+            self.reply(request, {})
+            self.start_notifications()
+        elif method == "get_system_information":
+            self.reply(request, self.system_info())
+        elif method == "put_init":
+            self.start_upload(request, params)
+        elif method == "put_term":
+            self.finish_upload(request, params)
+        elif method == "print":
+            self.start_print(params.get("filepath", "print.makerbot"))
+            self.reply(request, {})
+        elif method in ACK_METHODS:
+            if method == "cancel":
+                self.process = None
+            elif method == "process_method" and params.get("method") == "acknowledge_completed":
+                if self.process and self.system_info()["current_process"]["step"] == "completed":
+                    self.process = None     # The operator cleared the plate, the printer is idle again
+            self.reply(request, {})
+        else:
+            self.reply(request, error=f"Method not found: {method}")
+
+    # --- Upload ---------------------------------------------------------------
+
+    def start_upload(self, request: Dict[str, Any], params: Dict[str, Any]):
+        offset = int(params.get("offset", 0))
+        file_path = params.get("file_path")
+        if offset:
+            # Only a block boundary this printer has already received can be resumed from.
+            prefix_crc = self.server.files.get(file_path, {}).get("prefix_crc", {})
+            if offset not in prefix_crc:
+                self.reply(request, error="Offset not supported")
+                return
+            crc = prefix_crc[offset]
+        else:
+            self.server.files[file_path] = {"prefix_crc": {}, "length": 0}
+            crc = 0
+        self.upload = {
+            "file_path": file_path,
+            "length": int(params.get("length", 0)),
+            "received": offset,
+            "crc": crc,
+        }
+        self.reply(request, {})
+
+    def receive_raw(self, chunk: bytes):
+        self.raw_remaining -= len(chunk)
+        self.stats.bytes_uploaded += len(chunk)
+        if self.upload is not None:
+            self.upload["received"] += len(chunk)
+            self.upload["crc"] = zlib.crc32(chunk, self.upload["crc"])
+        if not self.raw_remaining:
+            request, self.pending_raw = self.pending_raw, None
+            if random.random() < self.settings.drop_rate:
+                self.stats.faults += 1
+                return
+            if self.upload is None:
+                self.reply(request, error="No upload in progress")
+            else:
+                # Remembered so an interrupted upload can be resumed from any block boundary.
+                entry = self.server.files.setdefault(self.upload["file_path"], {"prefix_crc": {}})
+                entry["prefix_crc"][self.upload["received"]] = self.upload["crc"]
+                entry["length"] = self.upload["received"]
+                self.reply(request, {})
+
+    def finish_upload(self, request: Dict[str, Any], params: Dict[str, Any]):
+        upload, self.upload = self.upload, None
+        if upload is None:
+            self.reply(request, error="No upload in progress")
+            return
+        crc = upload["crc"] & 0xFFFFFFFF
+        if upload["received"] != upload["length"] or int(params.get("crc", -1)) != crc:
+            self.stats.crc_errors += 1
+            self.reply(request, error=f"CRC mismatch: {crc} for {upload['received']} byte")
+            return
+        self.stats.uploads += 1
+        self.reply(request, {"crc": crc, "length": upload["received"]})
+
+    # --- Status ---------------------------------------------------------------
+
+    def start_print(self, filepath: str):
+        self.print_started = time.monotonic()
+        self.process = {"name": "PrintProcess", "step": "printing", "filename": filepath,
+                        "progress": 0, "elapsed_time": 0}
+
+    def system_info(self) -> Dict[str, Any]:
+        process = self.process
+        if process is not None:
+            elapsed = time.monotonic() - self.print_started
+            progress = min(100, int(elapsed / self.settings.print_seconds * 100)) if self.settings.print_seconds else 100
+            process = dict(process, progress=progress, elapsed_time=int(elapsed),
+                           step="completed" if progress >= 100 else "printing")
+        i = self.notification_count
+        info = {
+            "current_process": process,
+            "toolheads": {
+                "chamber": [{"current_temperature": 40 + i % 3, "target_temperature": 40 if process else 0,
+                             "preheating": False}],
+                "extruder": [{"current_temperature": (214 + i % 3) if process else 25,
+                              "target_temperature": 215 if process else 0, "preheating": False}],
+            },
+        }
+        if self.settings.notify_padding:
+            info["disk_info"] = "x" * self.settings.notify_padding
+        return info
+
+    def start_notifications(self):
+        self.authorized = True
+        if self.notifier is None and self.settings.notify_hz > 0:
+            self.notifier = asyncio.ensure_future(self.notify())
+
+    async def notify(self):
+        interval = 1.0 / self.settings.notify_hz
+        next_at = time.monotonic()
+        while not self.closed:
+            next_at += interval
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.notification_count += 1
+            self.stats.notifications += 1
+            if random.random() < self.settings.garbage_rate:
+                self.stats.faults += 1
+                self.send_bytes(b'{"params": {"info": ], "jsonrpc": "2.0"}')
+                continue
+            self.send({"params": {"info": self.system_info()}, "jsonrpc": "2.0", "method": "system_notification"})
+
+    def close(self):
+        if self.closed:
+            return
+        self.flush()
+        self.closed = True
+        if self.notifier is not None:
+            self.notifier.cancel()
+        self.writer.close()
+
+class MockPrinter:
+    # A listening port that plays one printer.
+
+    def __init__(self, port: int, settings: MockSettings, ssl_context: ssl.SSLContext, host: str = "127.0.0.1"):
+        self.host = host
+        self.port = port
+        self.settings = settings
+        self.ssl_context = ssl_context
+        self.stats = MockStats()
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.sessions: List[MockSession] = []
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.accept, self.host, self.port, ssl=self.ssl_context)
+        if self.port == 0:
+            self.port = self.server.sockets[0].getsockname()[1]
+
+    async def accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        session = MockSession(self, reader, writer)
+        self.sessions.append(session)
+        try:
+            await session.serve()
+        finally:
+            self.sessions.remove(session)
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+        for session in list(self.sessions):
+            session.close()
+        if self.server is not None:
+            await self.server.wait_closed()
+
+# ==============================================================================
+#           TLS
+# ==============================================================================
+
+def ensure_certificate(cert_path: Optional[str] = None, key_path: Optional[str] = None):
+    # The given certificate, or a self-signed one made once with the openssl command.
+    if cert_path and key_path:
+        return cert_path, key_path
+    os.makedirs(CERT_DIR, exist_ok=True)
+    cert_path = os.path.join(CERT_DIR, "cert.pem")
+    key_path = os.path.join(CERT_DIR, "key.pem")
+    if not (os.path.exists(cert_path) and os.path.exists(key_path)):
+        try:
+            subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "3650",
+                            "-subj", "/CN=makerbot-mock", "-keyout", key_path, "-out", cert_path],
+                           check=True, capture_output=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise RuntimeError(f"Could not create a self-signed certificate with openssl ({e}). "
+                               f"Use --cert and --key.") from e
+    return cert_path, key_path
+
+def create_server_ssl_context(cert_path: Optional[str] = None, key_path: Optional[str] = None) -> ssl.SSLContext:
+    cert_path, key_path = ensure_certificate(cert_path, key_path)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_path, key_path)
+    return context
+
+async def start_mocks(settings: MockSettings, port: int = PRINTER_PORT_SECURE, count: int = 1,
+                      host: str = "127.0.0.1", cert_path: Optional[str] = None,
+                      key_path: Optional[str] = None) -> List[MockPrinter]:
+    # Port 0 gives every mock a free port.
+    context = create_server_ssl_context(cert_path, key_path)
+    mocks = []
+    for i in range(count):
+        mock = MockPrinter(port + i if port else 0, settings, context, host)
+        await mock.start()
+        mocks.append(mock)
+    return mocks
+
+def fleet_config_text(mocks: List[MockPrinter], host: str = "127.0.0.1") -> str:
+    # makerbot.cfg sections for --fleet against these mocks.
+    return "\n".join(
+        f"[PRINTER:mock-{i + 1}]\nPRINTER_IP = {host}\nPORT = {mock.port}\nUSERNAME = mock\n"
+        f"LOCAL_CODE = {MOCK_LOCAL_CODE}\n"
+        for i, mock in enumerate(mocks))
+
+# ==============================================================================
+#           MAIN
+# ==============================================================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Local MakerBot JSON-RPC mock printer")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=PRINTER_PORT_SECURE, help="first port (0 = any free port)")
+    parser.add_argument("--count", type=int, default=1, help="number of printers on consecutive ports")
+    parser.add_argument("--cert", help="PEM certificate (default: self-signed, made with openssl)")
+    parser.add_argument("--key", help="PEM private key")
+    parser.add_argument("--latency", type=float, default=0.0, help="reply delay in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random reply delay in ms")
+    parser.add_argument("--notify-hz", type=float, default=2.0, help="system_notification rate per connection")
+    parser.add_argument("--notify-padding", type=int, default=0, help="extra bytes per notification")
+    parser.add_argument("--coalesce", type=int, default=1, help="messages per write")
+    parser.add_argument("--split", type=int, default=0, help="cut writes into pieces of at most N bytes")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="fraction of requests never answered")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with an error")
+    parser.add_argument("--garbage-rate", type=float, default=0.0, help="fraction of notifications with broken JSON")
+    parser.add_argument("--disconnect-after", type=int, default=0, help="drop the connection after N requests")
+    parser.add_argument("--auth-delay", type=float, default=0.0, help="seconds before authorize answers")
+    parser.add_argument("--strict-auth", action="store_true", help="reject reauthorize with an unknown code")
+    parser.add_argument("--print-seconds", type=float, default=60.0, help="length of a simulated print")
+    parser.add_argument("--verbose", action="store_true")
+    return parser.parse_args()
+
+async def serve(args):
+    settings = MockSettings(
+        latency=args.latency / 1000, jitter=args.jitter / 1000, notify_hz=args.notify_hz,
+        notify_padding=args.notify_padding, coalesce=args.coalesce, split=args.split,
+        drop_rate=args.drop_rate, error_rate=args.error_rate, garbage_rate=args.garbage_rate,
+        disconnect_after=args.disconnect_after, auth_delay=args.auth_delay,
+        strict_auth=args.strict_auth, print_seconds=args.print_seconds, verbose=args.verbose)
+    mocks = await start_mocks(settings, args.port, args.count, args.host, args.cert, args.key)
+    print(f"Mock printer(s) listening on {args.host}: " + ", ".join(str(m.port) for m in mocks))
+    if args.count > 1:
+        print("\nmakerbot.cfg sections for --fleet:\n")
+        print(fleet_config_text(mocks, args.host))
+    try:
+        while True:
+            await asyncio.sleep(5)
+            total = MockStats()
+            for mock in mocks:
+                for key, value in mock.stats.as_dict().items():
+                    setattr(total, key, getattr(total, key) + value)
+            print(" ".join(f"{k}={v}" for k, v in total.as_dict().items()), flush=True)
+    finally:
+        for mock in mocks:
+            await mock.close()
+
+def main():
+    args = parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    except RuntimeError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
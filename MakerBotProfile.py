@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+import time
+from array import array
+from collections import deque
+from typing import Dict, Optional, List, Tuple
+
+# ==============================================================================
+#           PROFILING
+# ==============================================================================
+# Opt-in timers around the hot path: decode (framing and JSON), dispatch (one
+# message), status_lock (waiting for the lock), status update and render.
+# Code takes `active()` once, outside its loop, and checks the local for
+# None, so a disabled profiler costs one comparison per span.
+# --profile prints a table at exit; --profile FILE.json also writes a Chrome
+# trace (chrome://tracing, ui.perfetto.dev).
+
+PROFILE_MAX_SAMPLES = 65536          # Durations kept per stage for the percentiles
+PROFILE_MAX_EVENTS = 1000000         # Spans kept for the trace, the oldest are dropped
+
+class StageStats:
+
+    __slots__ = ("count", "total_ns", "max_ns", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.samples = array('q')
+
+    def add(self, duration_ns: int):
+        if len(self.samples) < PROFILE_MAX_SAMPLES:
+            self.samples.append(duration_ns)
+        else:
+            self.samples[self.count % PROFILE_MAX_SAMPLES] = duration_ns
+        self.count += 1
+        self.total_ns += duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+
+    def percentile(self, fraction: float) -> int:
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0
+
+class Profiler:
+
+    def __init__(self):
+        self.enabled = False
+        self.trace = False
+        self.started_ns = 0
+        self.stages: Dict[str, StageStats] = {}
+        self.events = deque(maxlen=PROFILE_MAX_EVENTS)     # (stage, thread id, start ns, duration ns)
+        self.thread_names: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def enable(self, trace: bool = False):
+        self.trace = trace
+        self.started_ns = time.perf_counter_ns()
+        self.enabled = True
+
+    def span(self, stage: str, started_ns: int, ended_ns: int = 0) -> int:
+        # Records one stage; returns its end so the next stage can start there.
+        ended_ns = ended_ns or time.perf_counter_ns()
+        duration_ns = ended_ns - started_ns
+        with self._lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = StageStats()
+            stats.add(duration_ns)
+            if self.trace:
+                thread_id = threading.get_ident()
+                if thread_id not in self.thread_names:
+                    self.thread_names[thread_id] = threading.current_thread().name
+                self.events.append((stage, thread_id, started_ns, duration_ns))
+        return ended_ns
+
+    def rows(self) -> List[Tuple[str, int, float, float, float, float, float, float]]:
+        # stage, count, total ms, share of wall time %, mean µs, p50 µs, p99 µs, max µs
+        wall_ns = max(1, time.perf_counter_ns() - self.started_ns)
+        with self._lock:
+            stages = list(self.stages.items())
+        rows = []
+        for stage, stats in sorted(stages, key=lambda item: -item[1].total_ns):
+            rows.append((stage, stats.count, stats.total_ns / 1e6, 100.0 * stats.total_ns / wall_ns,
+                         stats.total_ns / stats.count / 1e3, stats.percentile(0.5) / 1e3,
+                         stats.percentile(0.99) / 1e3, stats.max_ns / 1e3))
+        return rows
+
+    def report(self) -> str:
+        wall = (time.perf_counter_ns() - self.started_ns) / 1e9
+        lines = [f"Profile ({wall:.1f} s)",
+                 f"{'Stage':<14}{'Count':>10}{'Total ms':>12}{'Wall %':>8}{'Mean µs':>10}{'p50 µs':>10}{'p99 µs':>10}{'Max µs':>10}"]
+        for stage, count, total_ms, share, mean, p50, p99, peak in self.rows():
+            lines.append(f"{stage:<14}{count:>10}{total_ms:>12.1f}{share:>8.2f}{mean:>10.1f}{p50:>10.1f}{p99:>10.1f}{peak:>10.1f}")
+        return "\n".join(lines)
+
+    def write_trace(self, path: str):
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+            thread_names = dict(self.thread_names)
+        trace_events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                        for tid, name in thread_names.items()]
+        for stage, tid, started_ns, duration_ns in events:
+            trace_events.append({"name": stage, "cat": "makerbot", "ph": "X", "pid": pid, "tid": tid,
+                                 "ts": (started_ns - self.started_ns) / 1e3, "dur": duration_ns / 1e3})
+        with open(path, 'w') as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+profiler = Profiler()
+
+def active() -> Optional[Profiler]:
+    return profiler if profiler.enabled else None
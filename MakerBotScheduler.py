@@ -0,0 +1,231 @@
+import concurrent.futures
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, List, Callable
+
+import MakerBot
+from MakerBot import PrinterConnection, PrinterStatus
+
+# ==============================================================================
+#           JOB SCHEDULER
+# ==============================================================================
+# A queue of .makerbot files for the fleet. The next job goes to whichever
+# printer is idle first. While a printer is in the last part of a print (or
+# waits for the operator to acknowledge a finished one), the next job is
+# already uploaded to it under its own remote name; when the printer goes
+# idle, `print` starts at once. Decisions are made on status events in one
+# scheduler thread; uploads and print commands run on a worker per printer.
+# A printer holds at most two scheduler files, the one being printed and the
+# next one, so the jobs take turns in two fixed remote paths and nothing piles
+# up in the printer's storage.
+
+PRESTAGE_PROGRESS = 90            # Percent of the current print after which the next job is uploaded
+PRINT_START_TIMEOUT = 60.0        # Seconds for a started print to show up in the status
+JOB_MAX_ATTEMPTS = 2              # A failed job is put back in the queue this many times in total
+SCHEDULER_POLL_INTERVAL = 5.0     # Also look without a status event (a printer coming back online)
+STAGING_PATHS = ("//current_thing/job-slot-1.makerbot", "//current_thing/job-slot-2.makerbot")
+
+class PrintJob:
+    _ids = itertools.count(1)
+
+    def __init__(self, path: str):
+        self.id = next(PrintJob._ids)
+        self.path = os.path.abspath(path)
+        self.name = os.path.basename(path)
+        self.remote_path = ""     # The staging path it is sent to, chosen when it goes to a printer
+        self.state = "queued"     # queued, staging, staged, starting, printing, completed, done, failed
+        self.printer: Optional[str] = None
+        self.attempts = 0
+        self.error = ""
+        self.queued_at = time.time()
+        self.started_at = 0.0
+        self.seen_running = False
+
+    def summary(self) -> str:
+        where = f" on {self.printer}" if self.printer else ""
+        error = f" ({self.error})" if self.error else ""
+        return f"#{self.id} {self.name}: {self.state}{where}{error}"
+
+class JobScheduler:
+
+    def __init__(self, connections: List[PrinterConnection], on_change: Optional[Callable[[], None]] = None):
+        self.connections = connections
+        self.on_change = on_change
+        self.queue = deque()
+        self.jobs: List[PrintJob] = []
+        self.staged: Dict[str, PrintJob] = {}     # Printer name -> job uploaded and waiting
+        self.current: Dict[str, PrintJob] = {}    # Printer name -> job started on it
+        self.busy = set()                          # Printers with an upload or print command running
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.workers = concurrent.futures.ThreadPoolExecutor(max(1, len(connections)), thread_name_prefix="scheduler")
+        self.thread: Optional[threading.Thread] = None
+        for conn in connections:
+            conn.status_watchers.append(self.wakeup.set)
+
+    def submit(self, path: str) -> PrintJob:
+        job = PrintJob(path)
+        with self.lock:
+            self.jobs.append(job)
+            self.queue.append(job)
+        self.wakeup.set()
+        return job
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="scheduler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+        self.workers.shutdown(wait=False, cancel_futures=True)
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.wakeup.wait(SCHEDULER_POLL_INTERVAL)
+            self.wakeup.clear()
+            try:
+                self.schedule()
+            except Exception as e:
+                print(f"\n\n❌ **ERROR in scheduler**: {e}")
+
+    def changed(self):
+        if self.on_change:
+            self.on_change()
+
+    # --- Decisions (scheduler thread) -------------------------------------------
+
+    def schedule(self):
+        for conn in self.connections:
+            if conn.state != "online":
+                continue
+            status = conn.status_copy()
+            if status.extruder_current is None:
+                continue     # No notification yet: idle and busy look the same
+            with self.lock:
+                if conn.name in self.busy:
+                    continue
+                self.follow_current(conn, status)
+                if conn.name in self.current:
+                    if self.final_layers(status) and conn.name not in self.staged and self.queue:
+                        self.dispatch(conn, self.queue.popleft(), self.stage_job)
+                elif status.process is None:
+                    job = self.staged.pop(conn.name, None) or (self.queue.popleft() if self.queue else None)
+                    if job:
+                        self.dispatch(conn, job, self.print_job)
+                elif self.final_layers(status) and conn.name not in self.staged and self.queue:
+                    # Printing something the scheduler did not start: staging still saves time.
+                    self.dispatch(conn, self.queue.popleft(), self.stage_job)
+
+    @staticmethod
+    def final_layers(status: PrinterStatus) -> bool:
+        if status.step == "completed":
+            return True      # Waiting for the operator
+        return status.step == "printing" and isinstance(status.progress, (int, float)) and status.progress >= PRESTAGE_PROGRESS
+
+    def follow_current(self, conn: PrinterConnection, status: PrinterStatus):
+        # Moves the job started on this printer along with the printer's status. Call with the lock held.
+        job = self.current.get(conn.name)
+        if job is None:
+            return
+        if status.process is not None:
+            job.seen_running = True
+            new_state = "completed" if status.step == "completed" else "printing"
+        elif job.seen_running:
+            new_state = "done" if job.state == "completed" else "failed"
+            if new_state == "failed":
+                job.error = "the print stopped before completing"
+            del self.current[conn.name]
+        elif time.time() - job.started_at > PRINT_START_TIMEOUT:
+            new_state = "failed"
+            job.error = "the print did not start"
+            del self.current[conn.name]
+        else:
+            return       # Started, not in the status yet
+        if new_state != job.state:
+            job.state = new_state
+            self.changed()
+
+    def dispatch(self, conn: PrinterConnection, job: PrintJob, work: Callable[[PrinterConnection, PrintJob], None]):
+        # Call with the lock held.
+        self.busy.add(conn.name)
+        job.printer = conn.name
+        if job.state != "staged":
+            job.remote_path = self.free_path(conn)
+        self.workers.submit(self.work, conn, job, work)
+
+    def free_path(self, conn: PrinterConnection) -> str:
+        # The staging path that is neither being printed nor holding the next job. Call with the lock held.
+        used = {job.remote_path for job in (self.current.get(conn.name), self.staged.get(conn.name)) if job}
+        return next(path for path in STAGING_PATHS if path not in used)
+
+    def work(self, conn: PrinterConnection, job: PrintJob, work: Callable[[PrinterConnection, PrintJob], None]):
+        try:
+            work(conn, job)
+        except Exception as e:
+            self.fail(job, str(e))
+        finally:
+            with self.lock:
+                self.busy.discard(conn.name)
+            self.changed()
+            self.wakeup.set()
+
+    def fail(self, job: PrintJob, error: str):
+        with self.lock:
+            job.attempts += 1
+            job.error = error
+            if job.attempts < JOB_MAX_ATTEMPTS:
+                job.state = "queued"
+                job.printer = None
+                self.queue.appendleft(job)
+            else:
+                job.state = "failed"
+
+    # --- Work (worker threads) --------------------------------------------------
+
+    def stage_job(self, conn: PrinterConnection, job: PrintJob):
+        with self.lock:
+            job.state = "staging"
+        self.changed()
+        result, error = MakerBot.rpc_file_upload(conn, job.path, job.remote_path, start_print=False)
+        if error:
+            return self.fail(job, error)
+        with self.lock:
+            job.state = "staged"
+            self.staged[conn.name] = job
+
+    def print_job(self, conn: PrinterConnection, job: PrintJob):
+        with self.lock:
+            staged = job.state == "staged"
+            job.state = "starting"
+        self.changed()
+        if staged:
+            error = MakerBot.rpc_print_file(conn, os.path.basename(job.remote_path))
+            if error:
+                # The staged file may be gone (printer restarted): upload it again with the print.
+                result, error = MakerBot.rpc_file_upload(conn, job.path, job.remote_path)
+        else:
+            result, error = MakerBot.rpc_file_upload(conn, job.path, job.remote_path)
+        if error:
+            return self.fail(job, error)
+        with self.lock:
+            job.started_at = time.time()
+            job.seen_running = False
+            self.current[conn.name] = job
+
+    # --- View -------------------------------------------------------------------
+
+    def lines(self, limit: int = 10) -> List[str]:
+        with self.lock:
+            jobs = [job for job in self.jobs if job.state not in ("done",)]
+            done = len(self.jobs) - len(jobs)
+            waiting = len(self.queue)
+        lines = [f" JOBS: {waiting} queued, {done} done"]
+        lines += [f"   {job.summary()}" for job in jobs[:limit]]
+        if len(jobs) > limit:
+            lines.append(f"   ... {len(jobs) - limit} more")
+        return lines
@@ -0,0 +1,221 @@
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import deque
+from typing import Dict, Any, Optional, List, Tuple
+
+# ==============================================================================
+#           TELEMETRY
+# ==============================================================================
+# Every status change of every printer (temperatures, progress, elapsed time)
+# is kept in memory in fixed-size rings, one per printer and metric,
+# and written to an SQLite file in WAL mode by a background thread. The
+# listener only appends to the rings and to a queue, it never waits for the
+# disk. Steps and link state changes go to the file as events. A 20 hour
+# print at a couple of notifications per second is a few hundred thousand
+# rows, and the memory used stays the same.
+
+TELEMETRY_PATH = "telemetry.db"
+TELEMETRY_RING_SIZE = 4096           # Samples kept in memory per printer and metric
+TELEMETRY_FLUSH_INTERVAL = 2.0       # Seconds between writes to the file
+TELEMETRY_MAX_PENDING = 200000       # Rows waiting for the file; beyond this the oldest are dropped
+
+NUMERIC_METRICS = ("extruder_current", "extruder_target", "chamber_current", "chamber_target",
+                   "progress", "elapsed_time")
+EVENT_METRICS = ("step", "state")   # Text, stored as events (print steps, link state)
+
+class RingBuffer:
+    # The last `capacity` (time, value) samples, in two preallocated arrays of doubles.
+
+    __slots__ = ("times", "values", "capacity", "head", "count")
+
+    def __init__(self, capacity: int = TELEMETRY_RING_SIZE):
+        self.times = array('d', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity))
+        self.capacity = capacity
+        self.head = 0       # Next slot to write
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, t: float, value: float):
+        self.times[self.head] = t
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def samples(self, since: float = 0.0) -> List[Tuple[float, float]]:
+        # Oldest first.
+        start = (self.head - self.count) % self.capacity
+        result = []
+        for i in range(self.count):
+            slot = (start + i) % self.capacity
+            if self.times[slot] >= since:
+                result.append((self.times[slot], self.values[slot]))
+        return result
+
+    def last(self) -> Optional[Tuple[float, float]]:
+        if not self.count:
+            return None
+        slot = (self.head - 1) % self.capacity
+        return self.times[slot], self.values[slot]
+
+class TelemetryRecorder:
+
+    def __init__(self, path: str = TELEMETRY_PATH, ring_size: int = TELEMETRY_RING_SIZE,
+                 flush_interval: float = TELEMETRY_FLUSH_INTERVAL):
+        self.path = path
+        self.ring_size = ring_size
+        self.flush_interval = flush_interval
+        self.rings: Dict[Tuple[str, str], RingBuffer] = {}
+        # (printer, metric, t, value or text); when the disk does not keep up, the oldest fall out.
+        self.pending = deque(maxlen=TELEMETRY_MAX_PENDING)
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.flushes = 0
+        self.last_flush_seconds = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._series: Dict[Tuple[str, str], int] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        # Taken off the queue but not committed yet; a failed transaction is tried again.
+        self._unwritten_rows: List[Tuple[str, str, float, float]] = []
+        self._unwritten_events: List[Tuple[str, str, float, Any]] = []
+
+    # --- Recording (event loop) -------------------------------------------------
+
+    def record(self, printer: str, changes: Dict[str, Any], t: Optional[float] = None):
+        # The telemetry thread drains the queue at the same time, so nothing is popped here:
+        # the bounded deque drops the oldest row itself and the drop is only counted.
+        t = time.time() if t is None else t
+        pending = self.pending
+        for metric, value in changes.items():
+            if metric in EVENT_METRICS:
+                row = (printer, metric, t, value)
+            elif metric in NUMERIC_METRICS and isinstance(value, (int, float)):
+                ring = self.rings.get((printer, metric))
+                if ring is None:
+                    ring = self.rings[(printer, metric)] = RingBuffer(self.ring_size)
+                ring.append(t, value)
+                row = (printer, metric, t, value)
+            else:
+                continue
+            if len(pending) >= TELEMETRY_MAX_PENDING:
+                self.rows_dropped += 1
+            pending.append(row)
+
+    def samples(self, printer: str, metric: str, since: float = 0.0) -> List[Tuple[float, float]]:
+        ring = self.rings.get((printer, metric))
+        return ring.samples(since) if ring else []
+
+    # --- File -------------------------------------------------------------------
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="telemetry", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(10)
+
+    def _open(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS series (
+                id INTEGER PRIMARY KEY, printer TEXT NOT NULL, metric TEXT NOT NULL,
+                UNIQUE (printer, metric));
+            CREATE TABLE IF NOT EXISTS samples (
+                series INTEGER NOT NULL, t REAL NOT NULL, value REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS samples_series_t ON samples (series, t);
+            CREATE TABLE IF NOT EXISTS events (
+                printer TEXT NOT NULL, metric TEXT NOT NULL, t REAL NOT NULL, value TEXT);
+        """)
+        for series_id, printer, metric in db.execute("SELECT id, printer, metric FROM series"):
+            self._series[(printer, metric)] = series_id
+        return db
+
+    def _series_id(self, printer: str, metric: str) -> int:
+        series_id = self._series.get((printer, metric))
+        if series_id is None:
+            # lastrowid is not reset when the row already exists, so the id is always looked up.
+            self._db.execute("INSERT OR IGNORE INTO series (printer, metric) VALUES (?, ?)", (printer, metric))
+            series_id = self._db.execute(
+                "SELECT id FROM series WHERE printer = ? AND metric = ?", (printer, metric)).fetchone()[0]
+            self._series[(printer, metric)] = series_id
+        return series_id
+
+    def flush(self):
+        # Writes everything queued so far in one transaction. Only the telemetry thread calls this.
+        # Rows stay in the unwritten lists until the commit succeeded; after a failure
+        # (the file locked by a reader) they are written with the next batch.
+        rows = self._unwritten_rows
+        events = self._unwritten_events
+        pending = self.pending
+        while pending:
+            row = pending.popleft()
+            (events if row[1] in EVENT_METRICS else rows).append(row)
+        for unwritten in (rows, events):
+            overflow = len(unwritten) - TELEMETRY_MAX_PENDING
+            if overflow > 0:
+                del unwritten[:overflow]
+                self.rows_dropped += overflow
+        if not rows and not events:
+            return
+        started = time.perf_counter()
+        known_series = dict(self._series)
+        try:
+            with self._db:
+                samples = [(self._series_id(printer, metric), t, value) for printer, metric, t, value in rows]
+                self._db.executemany("INSERT INTO samples (series, t, value) VALUES (?, ?, ?)", samples)
+                self._db.executemany("INSERT INTO events (printer, metric, t, value) VALUES (?, ?, ?, ?)", events)
+        except sqlite3.Error:
+            self._series = known_series     # Series created in this batch were rolled back with it
+            raise
+        self.rows_written += len(rows) + len(events)
+        rows.clear()
+        events.clear()
+        self.flushes += 1
+        self.last_flush_seconds = time.perf_counter() - started
+
+    def _run(self):
+        try:
+            self._db = self._open()
+        except sqlite3.Error as e:
+            print(f"ERROR: Telemetry file {self.path} can not be opened: {e}")
+            return
+        try:
+            while not self._stop.wait(self.flush_interval):
+                try:
+                    self.flush()
+                except sqlite3.Error as e:
+                    print(f"ERROR: Telemetry write failed, retrying with the next batch: {e}")
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                lost = len(self.pending) + len(self._unwritten_rows) + len(self._unwritten_events)
+                self.rows_dropped += lost
+                print(f"ERROR: Telemetry write failed, {lost} rows lost: {e}")
+        finally:
+            self._db.close()
+            self._db = None
+
+def load_series(path: str, printer: str, metric: str, since: float = 0.0,
+                until: Optional[float] = None) -> List[Tuple[float, float]]:
+    # Reads a series back from the file (the recorder may still be writing it).
+    if not os.path.exists(path):
+        return []
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return db.execute(
+            "SELECT t, value FROM samples JOIN series ON series.id = samples.series "
+            "WHERE printer = ? AND metric = ? AND t >= ? AND t <= ? ORDER BY t",
+            (printer, metric, since, until if until is not None else float("inf"))).fetchall()
+    finally:
+        db.close()
@@ -0,0 +1,226 @@
+import concurrent.futures
+import math
+import os
+import threading
+import time
+import zipfile
+from array import array
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from MakerBotFramer import JsonStreamFramer
+
+# ==============================================================================
+#           TOOLPATH ANALYZER
+# ==============================================================================
+# Layers, time per layer and filament of a .makerbot job, read in one pass
+# from the print.jsontoolpath member. The member is one JSON array of
+# commands, too large to load on a small controller. It is streamed out of the
+# zip in chunks, the outer '[' is skipped, and the rest goes to the same
+# JsonStreamFramer the listener uses, which gives back one command at a time.
+# Memory is one chunk, one command and a float per layer, whatever the file size.
+#
+#   {"command": {"function": "move", "parameters": {"x": 1.0, "y": 2.0, "z": 0.2, "a": 0.5, "feedrate": 40.0},
+#                "metadata": {"relative": {"x": false, "y": false, "z": false, "a": false}}, "tags": ["Infill"]}}
+
+TOOLPATH_SUFFIX = ".jsontoolpath"
+TOOLPATH_CHUNK_SIZE = 65536
+TOOLPATH_CACHE_SIZE = 32             # Analyses kept, by path, size and mtime
+FILAMENT_DIAMETER = 1.75             # mm
+FILAMENT_DENSITY = 1.24              # g/cm³ (PLA)
+
+AXES = ("x", "y", "z", "a")
+
+class ToolpathStats:
+
+    def __init__(self):
+        self.commands = 0
+        self.moves = 0
+        self.layer_times = array('d')    # Seconds per layer
+        self.layer_heights = array('d')  # Z of every layer
+        self.prelude_time = 0.0          # Before the first extruding move (heating, homing, purge travel)
+        self.total_time = 0.0
+        self.filament_mm = 0.0
+        self.max_z = 0.0
+        self.bytes_read = 0              # Uncompressed toolpath
+        self.seconds = 0.0               # Time the analysis took
+        self.parse_errors = 0
+
+    @property
+    def layers(self) -> int:
+        return len(self.layer_times)
+
+    @property
+    def filament_g(self) -> float:
+        area_mm2 = math.pi * (FILAMENT_DIAMETER / 2) ** 2
+        return self.filament_mm * area_mm2 / 1000 * FILAMENT_DENSITY
+
+    def layer_at(self, progress: float) -> int:
+        # The layer being printed at `progress` percent of the estimated time (1-based).
+        if not self.layers:
+            return 0
+        target = self.total_time * max(0.0, min(100.0, progress)) / 100 - self.prelude_time
+        elapsed = 0.0
+        for layer, seconds in enumerate(self.layer_times, 1):
+            elapsed += seconds
+            if elapsed >= target:
+                return layer
+        return self.layers
+
+    def summary(self) -> str:
+        return (f"{self.layers} layers, {format_duration(self.total_time)}, "
+                f"{self.filament_mm / 1000:.1f} m / {self.filament_g:.0f} g filament")
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "layers": self.layers,
+            "total_time": self.total_time,
+            "prelude_time": self.prelude_time,
+            "layer_times": list(self.layer_times),
+            "filament_mm": self.filament_mm,
+            "filament_g": self.filament_g,
+            "max_z": self.max_z,
+            "moves": self.moves,
+            "commands": self.commands,
+        }
+
+def format_duration(seconds: float) -> str:
+    return f"{int(seconds // 3600)}:{int(seconds % 3600 // 60):02d} h"
+
+class ToolpathAnalyzer:
+
+    def __init__(self):
+        self.stats = ToolpathStats()
+        self.position = dict.fromkeys(AXES, 0.0)
+        self.layer_z: Optional[float] = None
+        self.framer = JsonStreamFramer()
+        self.started = False        # The outer '[' was skipped
+
+    def feed(self, data: bytes):
+        self.stats.bytes_read += len(data)
+        if not self.started:
+            data = data.lstrip()
+            if not data:
+                return
+            if data[:1] != b'[':
+                raise ValueError("the toolpath is not a JSON array")
+            data = data[1:]
+            self.started = True
+        for command in self.framer.feed(data):
+            self.command(command)
+
+    def command(self, entry: Any):
+        stats = self.stats
+        stats.commands += 1
+        command = entry.get("command") if isinstance(entry, dict) else None
+        if not isinstance(command, dict):
+            return
+        function = command.get("function")
+        params = command.get("parameters") or {}
+        if function == "move":
+            self.move(params, (command.get("metadata") or {}).get("relative") or {})
+        elif function == "set_position":
+            for axis in AXES:
+                if isinstance(params.get(axis), (int, float)):
+                    self.position[axis] = float(params[axis])
+        elif function == "delay" and isinstance(params.get("seconds"), (int, float)):
+            self.add_time(float(params["seconds"]))
+
+    def move(self, params: Dict[str, Any], relative: Dict[str, Any]):
+        stats = self.stats
+        stats.moves += 1
+        position = self.position
+        deltas = []
+        for axis in AXES:
+            value = params.get(axis)
+            if value is None or value.__class__ not in (int, float):
+                deltas.append(0.0)
+            elif relative.get(axis):
+                position[axis] += value
+                deltas.append(value)
+            else:
+                deltas.append(value - position[axis])
+                position[axis] = value
+        dx, dy, dz, extruded = deltas
+        if extruded > 0:
+            stats.filament_mm += extruded
+            z = position["z"]
+            # A new layer starts where filament is first laid above the last layer (z-hops do not count).
+            if self.layer_z is None or z > self.layer_z + 1e-6:
+                self.layer_z = z
+                stats.layer_times.append(0.0)
+                stats.layer_heights.append(z)
+                stats.max_z = max(stats.max_z, z)
+        elif extruded < 0:
+            stats.filament_mm += extruded     # Retraction; the prime after it adds it back
+        distance = math.sqrt(dx * dx + dy * dy + dz * dz) or abs(extruded)
+        feedrate = params.get("feedrate")
+        if distance and feedrate.__class__ in (int, float) and feedrate > 0:
+            self.add_time(distance / feedrate)
+
+    def add_time(self, seconds: float):
+        stats = self.stats
+        stats.total_time += seconds
+        if stats.layer_times:
+            stats.layer_times[-1] += seconds
+        else:
+            stats.prelude_time += seconds
+
+    def finish(self) -> ToolpathStats:
+        self.stats.parse_errors = self.framer.parse_errors
+        return self.stats
+
+def toolpath_member(archive: zipfile.ZipFile) -> str:
+    for name in archive.namelist():
+        if name.endswith(TOOLPATH_SUFFIX):
+            return name
+    raise KeyError(f"no {TOOLPATH_SUFFIX} in the file")
+
+def analyze_toolpath(path: str, chunk_size: int = TOOLPATH_CHUNK_SIZE) -> ToolpathStats:
+    started = time.perf_counter()
+    analyzer = ToolpathAnalyzer()
+    with zipfile.ZipFile(path) as archive, archive.open(toolpath_member(archive)) as member:
+        while True:
+            data = member.read(chunk_size)
+            if not data:
+                break
+            analyzer.feed(data)
+    stats = analyzer.finish()
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+# --- In the background, for the upload ------------------------------------------
+
+_pool = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="toolpath")
+_cache: 'OrderedDict[tuple, concurrent.futures.Future]' = OrderedDict()
+_cache_lock = threading.Lock()
+
+def analyze_in_background(path: str) -> Optional[concurrent.futures.Future]:
+    # One analysis per file version; a broadcast or a second upload of the file shares it.
+    try:
+        file_stat = os.stat(path)
+    except OSError:
+        return None
+    key = (os.path.abspath(path), file_stat.st_size, file_stat.st_mtime)
+    with _cache_lock:
+        future = _cache.get(key)
+        if future is None:
+            future = _cache[key] = _pool.submit(analyze_toolpath, path)
+            while len(_cache) > TOOLPATH_CACHE_SIZE:
+                _cache.popitem(last=False)
+        else:
+            _cache.move_to_end(key)
+    return future
+
+def finished_stats(future: Optional[concurrent.futures.Future]) -> Optional[ToolpathStats]:
+    # The result if the analysis is done and worked; a file without a toolpath is no error.
+    if future is None or not future.done() or future.cancelled() or future.exception():
+        return None
+    return future.result()
+
+def monitor_text(stats: ToolpathStats, progress: Optional[float]) -> str:
+    if isinstance(progress, (int, float)) and stats.layers:
+        remaining = stats.total_time * (100 - min(100.0, progress)) / 100
+        return (f"Layer: ~{stats.layer_at(progress)}/{stats.layers}, {format_duration(remaining)} left "
+                f"of {format_duration(stats.total_time)}, {stats.filament_g:.0f} g filament")
+    return f"Toolpath: {stats.summary()}"
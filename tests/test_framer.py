@@ -0,0 +1,100 @@
+import json
+import unittest
+
+from MakerBotFramer import JsonStreamFramer
+
+def notification(i: int, text: str = "") -> dict:
+    return {"jsonrpc": "2.0", "method": "system_notification",
+            "params": {"info": {"current_process": {"step": f"step {i}", "text": text}}}}
+
+def encode(*messages) -> bytes:
+    # Back to back, the way the printer sends them.
+    return b"".join(json.dumps(message, ensure_ascii=False).encode("utf-8") for message in messages)
+
+def feed_pieces(framer: JsonStreamFramer, data: bytes, size: int) -> list:
+    messages = []
+    for i in range(0, len(data), size):
+        messages += framer.feed(data[i:i + size])
+    return messages
+
+class JsonStreamFramerTest(unittest.TestCase):
+
+    def test_message_split_over_reads(self):
+        message = notification(1, "x" * 1000)
+        for size in (1, 2, 7, 100, 4096):
+            with self.subTest(size=size):
+                self.assertEqual(feed_pieces(JsonStreamFramer(), encode(message), size), [message])
+
+    def test_every_split_point(self):
+        messages = [notification(1), {"jsonrpc": "2.0", "id": 7, "result": [1, {"a": []}]}, notification(2)]
+        data = encode(*messages)
+        for cut in range(1, len(data)):
+            with self.subTest(cut=cut):
+                framer = JsonStreamFramer()
+                self.assertEqual(framer.feed(data[:cut]) + framer.feed(data[cut:]), messages)
+
+    def test_several_messages_in_one_read(self):
+        messages = [notification(i) for i in range(50)]
+        framer = JsonStreamFramer()
+        self.assertEqual(framer.feed(encode(*messages)), messages)
+        self.assertEqual(framer.parse_errors, 0)
+
+    def test_message_and_a_half(self):
+        first, second = notification(1), notification(2)
+        data = encode(first, second)
+        half = len(encode(first)) + 10
+        framer = JsonStreamFramer()
+        self.assertEqual(framer.feed(data[:half]), [first])
+        self.assertEqual(framer.feed(data[half:]), [second])
+
+    def test_utf8_split_inside_a_character(self):
+        message = notification(1, "hőmérséklet ✓ 温度")
+        data = encode(message)
+        # Every cut, including the ones between the bytes of a multibyte character.
+        for cut in range(1, len(data)):
+            with self.subTest(cut=cut):
+                framer = JsonStreamFramer()
+                self.assertEqual(framer.feed(data[:cut]) + framer.feed(data[cut:]), [message])
+
+    def test_brackets_and_quotes_inside_strings(self):
+        messages = [{"id": 1, "result": "}{]["}, {"id": 2, "result": "say \"}\" \\"},
+                    {"id": 3, "result": "\\\"{"}, {"id": 4, "result": ["[", "]", "{\"a\": 1}"]}]
+        data = encode(*messages)
+        for size in (1, 3, len(data)):
+            with self.subTest(size=size):
+                framer = JsonStreamFramer()
+                self.assertEqual(feed_pieces(framer, data, size), messages)
+                self.assertEqual(framer.parse_errors, 0)
+
+    def test_garbage_between_messages(self):
+        first, second = notification(1), notification(2)
+        data = b"\r\n" + encode(first) + b"garbage\x00\xff  " + encode(second) + b"\n"
+        for size in (1, 5, len(data)):
+            with self.subTest(size=size):
+                self.assertEqual(feed_pieces(JsonStreamFramer(), data, size), [first, second])
+
+    def test_broken_message_is_counted_and_skipped(self):
+        second = notification(2)
+        data = b'{"id": 1, "result": tru}' + encode(second)
+        for size in (1, len(data)):
+            with self.subTest(size=size):
+                framer = JsonStreamFramer()
+                self.assertEqual(feed_pieces(framer, data, size), [second])
+                self.assertEqual(framer.parse_errors, 1)
+
+    def test_unclosed_brace_waits_for_the_rest(self):
+        framer = JsonStreamFramer()
+        self.assertEqual(framer.feed(b'{"id": 1, "result": {"nested": '), [])
+        self.assertEqual(framer.feed(b'[1, 2'), [])
+        self.assertEqual(framer.feed(b']}}{"id": 2}'), [{"id": 1, "result": {"nested": [1, 2]}}, {"id": 2}])
+        self.assertEqual(framer.parse_errors, 0)
+
+    def test_unclosed_brace_over_the_size_limit_is_dropped(self):
+        framer = JsonStreamFramer(max_message_size=1024)
+        self.assertEqual(framer.feed(b'{"result": "' + b"x" * 2048), [])
+        self.assertEqual(framer.parse_errors, 1)
+        self.assertEqual(framer.feed(b'{"id": 3}'), [{"id": 3}])
+        self.assertLess(len(framer.buffer), 1024)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+import MakerBot
+import MakerBotMock
+
+FILE_SIZE = 48 * MakerBot.RPC_BLOCK_SIZE + 1000
+
+def cancel_at(percent: int) -> MakerBot.Job:
+    # An upload job that cancels itself once it has reported `percent`.
+    job = MakerBot.Job('0', 'upload', None)
+    job.on_change = lambda job: job.progress >= percent and job.cancelled.set()
+    return job
+
+class UploadManifestTest(unittest.TestCase):
+    # rpc_file_upload against MakerBotMock: the manifest skips a file the
+    # printer already has and, with UPLOAD_RESUME, continues an interrupted one.
+
+    @classmethod
+    def setUpClass(cls):
+        cls.runner = MakerBot.AsyncRunner()
+        settings = MakerBotMock.MockSettings(notify_hz=1)
+        cls.mock = cls.runner.run(MakerBotMock.start_mocks(settings, 0, 1))[0]
+        cls.conn = MakerBot.PrinterConnection("test", "127.0.0.1", "test", MakerBotMock.MOCK_LOCAL_CODE, cls.mock.port)
+        with contextlib.redirect_stdout(io.StringIO()):
+            error = cls.conn.connect()
+        if error:
+            raise RuntimeError(error)
+
+    @classmethod
+    def tearDownClass(cls):
+        with contextlib.redirect_stdout(io.StringIO()):
+            cls.conn.close()
+        cls.runner.run(cls.mock.close())
+        cls.runner.stop()
+
+    def setUp(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.local_path = os.path.join(temp.name, "part.makerbot")
+        with open(self.local_path, "wb") as f:
+            f.write(os.urandom(FILE_SIZE))
+        self.remote_path = f"//current_thing/{self.id().rsplit('.', 1)[-1]}.makerbot"
+        self.manifest_key = MakerBot.UploadManifest.key(self.conn.ip, self.remote_path)
+
+        saved = MakerBot.upload_manifest, MakerBot.UPLOAD_RESUME
+        self.addCleanup(self.restore, saved)
+        MakerBot.upload_manifest = MakerBot.UploadManifest(os.path.join(temp.name, "upload_manifest.json"))
+
+    @staticmethod
+    def restore(saved):
+        MakerBot.upload_manifest, MakerBot.UPLOAD_RESUME = saved
+
+    def upload(self, job=None):
+        # (result, error, bytes the mock received, the upload's output)
+        sent = self.mock.stats.bytes_uploaded
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            result, error = MakerBot.rpc_file_upload(self.conn, self.local_path, self.remote_path,
+                                                     job=job, start_print=False)
+            # The printer answers in order: once this is answered, the blocks
+            # still in flight from a cancelled upload have arrived too.
+            self.conn.rpc_call_wait(MakerBot.CMD_HEARTBEAT)
+        return result, error, self.mock.stats.bytes_uploaded - sent, output.getvalue()
+
+    def assert_on_printer(self):
+        self.assertEqual(self.mock.files[self.remote_path]["length"], FILE_SIZE)
+        entry = MakerBot.upload_manifest.get(self.manifest_key)
+        self.assertTrue(entry["complete"])
+        self.assertEqual(entry["crc"], MakerBot.file_crc32(self.local_path))
+
+    def test_same_file_is_not_sent_again(self):
+        result, error, sent, _ = self.upload()
+        self.assertIsNone(error)
+        self.assertEqual(sent, FILE_SIZE)
+        self.assert_on_printer()
+
+        result, error, sent, _ = self.upload()
+        self.assertIsNone(error)
+        self.assertIn("skipped", result)
+        self.assertEqual(sent, 0)
+
+    def test_changed_file_is_sent_again(self):
+        self.upload()
+        with open(self.local_path, "r+b") as f:
+            f.write(b"changed")
+        result, error, sent, _ = self.upload()
+        self.assertIsNone(error)
+        self.assertEqual(sent, FILE_SIZE)
+        self.assert_on_printer()
+
+    def test_manifest_is_saved(self):
+        self.upload()
+        manifest = MakerBot.UploadManifest(MakerBot.upload_manifest.path)
+        self.assertTrue(manifest.get(self.manifest_key)["complete"])
+
+    def test_resume_after_cancel(self):
+        MakerBot.UPLOAD_RESUME = True
+        result, error, first, _ = self.upload(cancel_at(40))
+        self.assertIn("cancelled", error)
+        entry = MakerBot.upload_manifest.get(self.manifest_key)
+        self.assertFalse(entry["complete"])
+        offset = entry["blocks_acked"] * MakerBot.RPC_BLOCK_SIZE
+        self.assertTrue(0 < offset < FILE_SIZE)
+        self.assertEqual(entry["acked_crc"], MakerBot.file_crc32(self.local_path, offset))
+
+        result, error, second, output = self.upload()
+        self.assertIsNone(error)
+        self.assertIn(f"resuming at {offset} byte", output)
+        self.assertEqual(second, FILE_SIZE - offset)
+        self.assert_on_printer()
+
+    def test_no_resume_by_default(self):
+        result, error, first, _ = self.upload(cancel_at(40))
+        self.assertIn("cancelled", error)
+        result, error, second, output = self.upload()
+        self.assertIsNone(error)
+        self.assertNotIn("resuming", output)
+        self.assertEqual(second, FILE_SIZE)
+        self.assert_on_printer()
+
+    def test_rejected_resume_sends_the_whole_file(self):
+        MakerBot.UPLOAD_RESUME = True
+        self.upload(cancel_at(40))
+        # The printer lost the partial file (restart): it refuses the offset.
+        del self.mock.files[self.remote_path]
+        result, error, sent, output = self.upload()
+        self.assertIsNone(error)
+        self.assertIn("Resume was not accepted", output)
+        self.assertEqual(sent, FILE_SIZE)
+        self.assert_on_printer()
+
+    def test_changed_file_is_not_resumed(self):
+        MakerBot.UPLOAD_RESUME = True
+        self.upload(cancel_at(40))
+        with open(self.local_path, "r+b") as f:
+            f.write(b"changed")
+        result, error, sent, output = self.upload()
+        self.assertIsNone(error)
+        self.assertNotIn("resuming", output)
+        self.assertEqual(sent, FILE_SIZE)
+        self.assert_on_printer()
+
+if __name__ == '__main__':
+    unittest.main()